@@ -14,7 +14,9 @@ import time
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
 
-from engine import build_report
+from engine import render_report
+from exporters import EXPORT_FORMATS, export_report
+from jobs import DONE, ERROR, JobQueue
 
 import gspread
 from google.oauth2.service_account import Credentials
@@ -41,6 +43,19 @@ def warn_box(message: str):
         unsafe_allow_html=True,
     )
 
+# ----------------- ОЧЕРЕДЬ ОТЧЁТОВ -----------------
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    # одна очередь и один пул расчётов на весь сервер, для всех пользователей
+    return JobQueue()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_export(job_id: str, fmt: str) -> bytes:
+    # выгрузка готового отчёта не меняется — строим один раз на задание и формат,
+    # а не на каждом перезапуске страницы
+    return export_report(get_job_queue().result(job_id), fmt)
+
 # ----------------- GOOGLE SHEETS --------------------
 SHEET_ID = "12NIk4vQ0Z7av6b4JbAIVKyY_blYnb5Vacumy_4FCTdM"
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
@@ -126,10 +141,11 @@ def get_client_free_runs(client_id: str, max_free_runs: int = 1) -> int:
     return max_free_runs
 
 
-def consume_client_run(client_id: str, max_free_runs: int = 1) -> int:
+def consume_client_run(client_id: str, max_free_runs: int = 1):
     """
     Списывает один бесплатный запуск и обновляет Google Sheets.
-    Возвращает, сколько запусков осталось после списания.
+    Возвращает, сколько запусков осталось после списания,
+    или None, если списывать уже нечего.
     """
     records = sheet.get_all_records()
 
@@ -139,9 +155,9 @@ def consume_client_run(client_id: str, max_free_runs: int = 1) -> int:
             free_left = int(row.get("free_runs_left") or 0)
             total_runs = int(row.get("total_runs") or 0)
 
-            # Если уже нечего списывать — просто возвращаем 0
+            # Если уже нечего списывать — запуск не положен
             if free_left <= 0:
-                return 0
+                return None
 
             free_left -= 1
             total_runs += 1
@@ -167,6 +183,22 @@ def consume_client_run(client_id: str, max_free_runs: int = 1) -> int:
 
     return free_left
 
+
+def refund_client_run(client_id: str) -> None:
+    """
+    Возвращает списанный запуск (расчёт упал) и обновляет Google Sheets.
+    """
+    records = sheet.get_all_records()
+
+    for idx, row in enumerate(records, start=2):  # данные со 2-й строки
+        if row.get("client_id") == client_id:
+            free_left = int(row.get("free_runs_left") or 0)
+            total_runs = int(row.get("total_runs") or 0)
+
+            sheet.update_cell(idx, 2, free_left + 1)  # B: free_runs_left
+            sheet.update_cell(idx, 3, max(total_runs - 1, 0))  # C: total_runs
+            return
+
 # ---------- ADMIN BYPASS (для тестов) ----------
 def is_admin_email(email: str) -> bool:
     admins = st.secrets.get("ADMIN_EMAILS", [])
@@ -394,9 +426,9 @@ with col_left:
 
     file_journal = st.file_uploader(
         "Журнал проходов",
-        type=["xls", "xlsx"],
+        type=["xls", "xlsx", "csv", "parquet"],
         label_visibility="collapsed",
-        help="Файл журнала из системы проходов (XLS/XLSX).",
+        help="Файл журнала из системы проходов (XLS/XLSX, CSV или Parquet).",
     )
 
     st.markdown("---")
@@ -425,8 +457,20 @@ with col_left:
     )
 
     kadry_file = st.file_uploader(
-        "Загрузите файл кадров (.xls / .xlsx)",
-        type=["xls", "xlsx"],
+        "Загрузите файл кадров (.xls / .xlsx / .csv / .parquet)",
+        type=["xls", "xlsx", "csv", "parquet"],
+    )
+
+    st.markdown("---")
+
+    # -------- ГРАФИК СМЕН --------
+    st.subheader("📙 График смен (по желанию)")
+
+    shifts_file = st.file_uploader(
+        "Загрузите график смен (.xls / .xlsx / .csv)",
+        type=["xls", "xlsx", "csv"],
+        help="Колонки: «Сотрудник», «Дата» (или «с» / «до»), «Начало», «Конец». "
+             "Без графика ядро для всех 09:00–18:00.",
     )
 
 with col_right:
@@ -438,12 +482,17 @@ with col_right:
           *«Сотрудник», «Вид отсутствия», «с», «до»*.
         - Можно загрузить только журнал —
           тогда «Причина отсутствия» останется пустой.
+        - График смен — для сменных и ночных графиков:
+          *«Сотрудник», «Дата», «Начало», «Конец»*.
         """,
         unsafe_allow_html=False,
     )
 
-# Если журнал не загружен — дальше не идём
-if file_journal is None:
+# задание на отчёт (в адресе страницы — переживает перезагрузку)
+job_id = st.query_params.get("job")
+
+# Если журнал не загружен и отчёт не считается — дальше не идём
+if file_journal is None and not job_id:
     warn_box("⬆ Сначала загрузите файл журнала проходов.")
     st.stop()
 
@@ -476,10 +525,11 @@ else:
     )
 
 # Красивый вывод названий файлов
-st.markdown(
-    f"<div class='file-label'>📘 Журнал: {file_journal.name}</div>",
-    unsafe_allow_html=True,
-)
+if file_journal is not None:
+    st.markdown(
+        f"<div class='file-label'>📘 Журнал: {file_journal.name}</div>",
+        unsafe_allow_html=True,
+    )
 if kadry_file is not None:
     st.markdown(
         f"<div class='file-label'>📗 Кадровый файл: {kadry_file.name}</div>",
@@ -532,6 +582,7 @@ if "code_send_count" not in st.session_state:
     st.session_state["code_send_count"] = 0
 
 final_df = None
+typed_df = None
 
 # --- МГНОВЕННАЯ ПРОВЕРКА ФОРМАТА ПОЧТЫ ---
 clean_client_id = (client_id or "").strip()
@@ -676,17 +727,22 @@ if st.button("🚀 Обработать данные"):
         warn_box("Сначала исправьте e-mail, чтобы продолжить.")
     elif not verified:
         warn_box("Сначала подтвердите e-mail через код из письма.")
+    elif file_journal is None:
+        warn_box("⬆ Сначала загрузите файл журнала проходов.")
     else:
-        # 1) проверяем лимит (для админа лимит не действует)
-        if not is_admin_email(clean_client_id):
+        # 1) списываем запуск сразу при постановке в очередь (для админа лимит не действует):
+        # проверка без списания пропускала сколько угодно заданий, пока первое считается.
+        # Если расчёт упадёт, запуск вернём (см. ниже)
+        charged = not is_admin_email(clean_client_id)
+        if charged:
             try:
-                free_left_before = get_client_free_runs(clean_client_id)
+                free_left_after = consume_client_run(clean_client_id)
             except Exception as e:
                 st.error("❌ Не удалось проверить бесплатный запуск. Попробуйте чуть позже.")
                 st.code(repr(e))
                 st.stop()
             else:
-                if free_left_before <= 0:
+                if free_left_after is None:
                     st.markdown(
                         """
                         <div style="
@@ -706,44 +762,85 @@ if st.button("🚀 Обработать данные"):
                     )
                     st.stop()
 
-        # 2) пробуем собрать отчёт (ДОЛЖНО выполняться и для админа)
+        # 2) ставим отчёт в очередь (ДОЛЖНО выполняться и для админа)
         try:
-            final_df = build_report(file_journal, kadry_file)
-        except Exception as e:
-            final_df = None
-            msg = str(e)
-
-            if "Не удалось прочитать журнал" in msg:
-                st.error(
-                    "❌ Не удалось прочитать файл журнала. "
-                    "Проверьте, что в нём есть колонки: "
-                    "«Событие», «Дата события», «Фамилия», «Имя», "
-                    "«Отчество», «Вход», «Выход»."
-                )
+            job_id = get_job_queue().submit(
+                file_journal, kadry_file, shifts_file, owner=clean_client_id, charged=charged
+            )
+        except Exception:
+            if charged:
+                refund_client_run(clean_client_id)
+            raise
+        st.query_params["job"] = job_id
+        if charged:
+            st.session_state["free_left_after"] = (job_id, free_left_after)
+
+# ---------- СТАТУС ЗАДАНИЯ: ОЖИДАНИЕ, ОШИБКА ИЛИ ГОТОВЫЙ ОТЧЁТ ----------
+if job_id:
+    job_queue = get_job_queue()
+    job = job_queue.status(job_id)
+
+    if job is None:
+        del st.query_params["job"]
+        warn_box("Отчёт не найден (результаты хранятся сутки). Запустите обработку ещё раз.")
+
+    elif not verified or not (is_admin_email(clean_client_id) or (job["owner"] or "") == clean_client_id):
+        # ссылка ?job= сама по себе доступа не даёт: отчёт видит и оплачивает только
+        # владелец задания с подтверждённым e-mail (или админ)
+        warn_box("Чтобы открыть отчёт, укажите и подтвердите e-mail, с которого он был запущен.")
+
+    elif job["status"] == ERROR:
+        msg = job["error"] or ""
+
+        # 3) упавший расчёт не должен съедать бесплатный запуск — возвращаем его один раз
+        owner = job["owner"] or ""
+        if job_queue.claim_refund(job_id):
+            try:
+                refund_client_run(owner)
+            except Exception as e:
+                st.error("⚠ Не удалось вернуть бесплатный запуск. Напишите нам — вернём вручную.")
+                st.code(repr(e))
             else:
-                st.error(
-                    "❌ Ошибка при обработке данных. "
-                    "Проверьте формат файлов и попробуйте ещё раз."
-                )
+                st.info("Бесплатный запуск не списан — можно попробовать ещё раз.")
+
+        if "Не удалось прочитать журнал" in msg:
+            st.error(
+                "❌ Не удалось прочитать файл журнала. "
+                "Проверьте, что в нём есть колонки: "
+                "«Событие», «Дата события», «Фамилия», «Имя», "
+                "«Отчество», «Вход», «Выход»."
+            )
+        else:
+            st.error(
+                "❌ Ошибка при обработке данных. "
+                "Проверьте формат файлов и попробуйте ещё раз."
+            )
 
-            st.code(msg)
+        st.code(msg)
 
-        else:
-            # 3) списываем запуск только НЕ админу
+    elif job["status"] != DONE:
+        # считается в общем пуле — показываем этап и перепроверяем через секунду
+        st.progress(float(job["progress"]), text=f"⏳ {job['stage']}…")
+        time.sleep(1)
+        st.rerun()
+
+    else:
+        typed_df = job_queue.result(job_id)
+        final_df = render_report(typed_df)
+
+        # запуск списан при постановке в очередь — остаток запомнен в сессии
+        charged_job, free_left_after = st.session_state.get("free_left_after", (None, None))
+        if charged_job != job_id:
             free_left_after = None
-            if not is_admin_email(clean_client_id):
-                try:
-                    free_left_after = consume_client_run(clean_client_id)
-                except Exception as e:
-                    st.error("⚠ Отчёт сформирован, но не удалось обновить счётчик запусков.")
-                    st.code(repr(e))
 
-            st.success("✅ Отчёт готов! Ниже можно скачать файл Excel.")
-            if free_left_after is not None:
-                if free_left_after > 0:
-                    st.info(f"Осталось бесплатных запусков по этому e-mail: {free_left_after}.")
-                else:
-                    st.info("Бесплатных запусков по этому e-mail больше не осталось.")
+        st.success("✅ Отчёт готов! Ниже можно скачать файл Excel.")
+        if job.get("peak_mb"):
+            st.caption(f"Пик памяти при расчёте: {job['peak_mb']:.0f} МБ")
+        if free_left_after is not None:
+            if free_left_after > 0:
+                st.info(f"Осталось бесплатных запусков по этому e-mail: {free_left_after}.")
+            else:
+                st.info("Бесплатных запусков по этому e-mail больше не осталось.")
 
 # если ещё не нажали кнопку или была ошибка — дальше не идём
 if final_df is None:
@@ -876,18 +973,18 @@ st.download_button(
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
 )
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+# выгрузка для аналитики: типизированные колонки (минуты числами, даты и время как есть)
+st.caption("Данные для аналитики (числовые минуты, без оформления табеля):")
+for col, (fmt, (_, ext, mime)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+    with col:
+        try:
+            data = get_export(job_id, fmt)
+        except RuntimeError as e:
+            st.caption(str(e))
+            continue
+        st.download_button(
+            label=f"⬇ {ext.upper()}",
+            data=data,
+            file_name=f"умный_табель.{ext}",
+            mime=mime,
+        )
@@ -0,0 +1,644 @@
+"""
+Микро-бенчмарки движка отчёта.
+
+    python benchmarks.py            # все бенчмарки
+    python benchmarks.py weekly     # только выбранные
+
+Каждый бенчмарк сравнивает прежнюю реализацию с текущей на синтетических
+данных и проверяет, что результаты совпадают.
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import engine
+
+
+def _best_of(fn, repeat=3):
+    best, res = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, res
+
+
+def _line(name, old_s, new_s):
+    print(f"{name:<28} было {old_s:8.3f} с   стало {new_s:8.3f} с   ×{old_s / max(new_s, 1e-9):.1f}")
+
+
+# === Синтетика ===
+
+def synth_week_frame(n_emp=10_000, n_weeks=4, seed=0) -> pd.DataFrame:
+    """Посуточные строки (ФИО × рабочие дни), как в _finalize перед _weekly_totals."""
+    rng = np.random.default_rng(seed)
+    fio = np.array([f"Сотрудник {i:05d}" for i in range(n_emp)], dtype=object)
+    mondays = pd.date_range("2025-11-03", periods=n_weeks, freq="7D")
+    days = (mondays.values[:, None] + np.arange(5) * np.timedelta64(1, "D")).ravel()
+    frame = pd.MultiIndex.from_product([fio, days], names=["ФИО", "Дата"]).to_frame(index=False)
+    frame["Итого_дня_мин"] = rng.integers(0, 600, len(frame)) * (rng.random(len(frame)) > 0.1)
+    frame["week_monday"] = frame["Дата"] - pd.to_timedelta(frame["Дата"].dt.weekday, unit="D")
+    return frame
+
+
+def synth_journal_frame(n_emp=500, n_days=20, seed=0) -> pd.DataFrame:
+    """Сырой журнал СКУД (колонки как в выгрузке): ~4 прохода на сотрудника в день."""
+    rng = np.random.default_rng(seed)
+    syl = np.array(["ка", "ло", "ми", "ра", "со", "ту", "не", "ва", "ри", "до"], dtype=object)
+    surname = np.array(["".join(rng.choice(syl, 3)).capitalize() + "ов" for _ in range(n_emp)], dtype=object)
+    days = pd.date_range("2025-11-03", periods=n_days, freq="D")
+    emp = np.repeat(np.arange(n_emp), n_days * 4)
+    day = np.tile(np.repeat(np.arange(n_days), 4), n_emp)
+    minute = np.tile([540, 780, 840, 1080], n_emp * n_days) + rng.integers(-40, 40, len(emp))
+    ts = days.values[day] + minute * np.timedelta64(1, "m") + rng.integers(0, 60, len(emp)) * np.timedelta64(1, "s")
+    is_in = np.tile([True, False, True, False], n_emp * n_days)
+    return pd.DataFrame({
+        "Событие": "Проход по идентификатору",
+        "Дата события": pd.Series(ts).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "Фамилия": surname[emp],
+        "Имя": "Анна",
+        "Отчество": "Петровна",
+        "Выход": np.where(is_in, "Шлюз", "Офис"),
+        "Вход": np.where(is_in, "Офис", "Шлюз"),
+    })
+
+
+# === Чтение журнала: xlsx / CSV / Parquet ===
+
+def bench_read(n_emp=500, n_days=20):
+    frame = synth_journal_frame(n_emp, n_days)
+    print(f"[read] журнал {len(frame)} строк")
+
+    # как у вендора: три строки шапки над таблицей
+    xlsx = io.BytesIO()
+    frame.to_excel(xlsx, index=False, startrow=3, engine="openpyxl")
+    csv = frame.to_csv(index=False, sep=";").encode("utf-8")
+    parquet = io.BytesIO()
+    # архив хранит время события типизированным
+    frame.assign(**{"Дата события": pd.to_datetime(frame["Дата события"])}).to_parquet(parquet, index=False)
+
+    xlsx_s, ref = _best_of(lambda: engine.read_journal(io.BytesIO(xlsx.getvalue())), repeat=1)
+    for name, content in (("csv", csv), ("parquet", parquet.getvalue())):
+        new_s, new = _best_of(lambda: engine.read_journal(io.BytesIO(content)))
+        pd.testing.assert_frame_equal(ref, new)
+        _line(f"read_journal xlsx → {name}", xlsx_s, new_s)
+
+
+# === Движки чтения Excel ===
+
+def _excel_files(n_emp, n_days):
+    """Файлы для сравнения движков: examples/ и синтетический журнал (xlsx, xls — если есть xlwt)."""
+    ex = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+    files = []
+    for name in sorted(os.listdir(ex)):
+        if name.endswith((".xlsx", ".xls")):
+            reader = engine.read_kadry if "кадр" in name.lower() else engine.read_journal
+            with open(os.path.join(ex, name), "rb") as fh:
+                files.append((name, fh.read(), reader))
+
+    frame = synth_journal_frame(n_emp, n_days)
+    xlsx = io.BytesIO()
+    frame.to_excel(xlsx, index=False, startrow=3, engine="openpyxl")
+    files.append((f"синтетика {len(frame)} строк.xlsx", xlsx.getvalue(), engine.read_journal))
+    try:
+        import xlwt
+    except ImportError:
+        return files
+    book = xlwt.Workbook()
+    sheet = book.add_sheet("Журнал")
+    for j, col in enumerate(frame.columns):
+        sheet.write(3, j, col)
+        for i, v in enumerate(frame[col].tolist()):
+            sheet.write(i + 4, j, v)
+    xls = io.BytesIO()
+    book.save(xls)
+    files.append((f"синтетика {len(frame)} строк.xls", xls.getvalue(), engine.read_journal))
+    return files
+
+
+def bench_excel(n_emp=500, n_days=20):
+    backends = [b for b, (module, _) in engine.EXCEL_BACKENDS.items() if engine._installed(module)]
+    print(f"[excel] установлены движки: {', '.join(backends)}")
+    for name, content, reader in _excel_files(n_emp, n_days):
+        fmt = engine.sniff_format(content)
+        results = {}
+        for backend in backends:
+            if fmt not in engine.EXCEL_BACKENDS[backend][1]:
+                continue
+            sec, res = _best_of(lambda: reader(io.BytesIO(content), backend=backend), repeat=1)
+            results[backend] = res
+            print(f"{name[:40]:<40} {backend:<9} {sec:7.3f} с   {len(content) / 2**20 / sec:6.1f} МБ/с")
+        ref = next(iter(results.values()))
+        for res in results.values():
+            pd.testing.assert_frame_equal(ref, res)
+
+
+# === Журнал на нескольких листах Excel ===
+
+def bench_sheets(n_emp=500, n_days=20, n_sheets=4):
+    frame = synth_journal_frame(n_emp, n_days)
+    book = io.BytesIO()
+    with pd.ExcelWriter(book, engine="openpyxl") as writer:
+        for i, part in enumerate(np.array_split(np.arange(len(frame)), n_sheets)):
+            frame.iloc[part].to_excel(writer, sheet_name=f"Лист{i + 1}", index=False, startrow=3 if i == 0 else 0)
+    content = book.getvalue()
+    print(f"[sheets] журнал {len(frame)} строк на {n_sheets} листах, ядер: {os.cpu_count()}")
+
+    if (os.cpu_count() or 1) < 2:
+        print("одно ядро: пул (spawn) не даст выигрыша — замер показывает только его накладные расходы")
+    old_s, old = _best_of(lambda: engine._read_journal_sheets(content, workers=1), repeat=1)
+    new_s, new = _best_of(lambda: engine._read_journal_sheets(content, workers=n_sheets), repeat=1)
+    pd.testing.assert_frame_equal(old, new)
+    _line("листы по очереди → пул", old_s, new_s)
+
+
+# === Большой журнал: целиком в памяти и по частям ===
+
+def _peak_rss_run(mode, path, memory_mb):
+    # запускается в отдельном процессе: ru_maxrss — пик за жизнь процесса
+    import resource
+
+    import outofcore
+
+    t0 = time.perf_counter()
+    if mode == "memory":
+        with open(path, "rb") as fh:
+            rep = engine.build_report(fh, render=False)
+    else:
+        rep = outofcore.build_report_ooc(path, memory_mb=memory_mb, render=False)
+    return time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, rep
+
+
+def _peak_read_run(mode, path):
+    # отдельный процесс, замер — как у заданий очереди (RSS и без страниц файлов)
+    from jobs import _PeakRSS
+
+    t0 = time.perf_counter()
+    with _PeakRSS(0.01) as peak:
+        if mode == "bytes":
+            # как раньше: загрузка целиком в памяти, журнал читает её копию
+            with open(path, "rb") as fh:
+                upload = io.BytesIO(fh.read())
+            df = engine.read_journal(io.BytesIO(upload.getvalue()))
+        else:
+            with open(path, "rb") as fh:
+                df = engine.read_journal(fh)
+    return time.perf_counter() - t0, peak.peak_mb, peak.peak_private_mb, len(df)
+
+
+def bench_spool(n_emp=2_000, n_days=60):
+    import multiprocessing as mp
+
+    frame = synth_journal_frame(n_emp, n_days)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.csv")
+        frame.to_csv(path, index=False, sep=";")
+        print(f"[spool] журнал {len(frame)} строк, {os.path.getsize(path) / 2**20:.0f} МБ CSV")
+        del frame
+
+        ctx = mp.get_context("spawn")
+        res = {}
+        for mode in ("bytes", "mmap"):
+            with ctx.Pool(1) as pool:
+                res[mode] = pool.apply(_peak_read_run, (mode, path))
+    assert res["bytes"][3] == res["mmap"][3]
+    for mode, label in (("bytes", "копии в памяти"), ("mmap", "файл на диске (mmap)")):
+        sec, rss, private, _ = res[mode]
+        print(f"{label:<28} {sec:8.1f} с   пик RSS {rss:7.0f} МБ   без страниц файлов {private:7.0f} МБ")
+
+
+def bench_ooc(n_emp=2_000, n_days=60, memory_mb=32):
+    import multiprocessing as mp
+
+    frame = synth_journal_frame(n_emp, n_days)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.csv")
+        frame.to_csv(path, index=False, sep=";")
+        print(f"[ooc] журнал {len(frame)} строк, {os.path.getsize(path) / 2**20:.0f} МБ CSV, бюджет {memory_mb} МБ")
+        del frame
+
+        ctx = mp.get_context("spawn")
+        res = {}
+        for mode in ("memory", "ooc"):
+            with ctx.Pool(1) as pool:
+                res[mode] = pool.apply(_peak_rss_run, (mode, path, memory_mb))
+    pd.testing.assert_frame_equal(res["memory"][2], res["ooc"][2])
+    for mode, label in (("memory", "целиком"), ("ooc", "по частям")):
+        print(f"{label:<28} {res[mode][0]:8.1f} с   пик RSS {res[mode][1]:7.0f} МБ")
+
+
+# === Табличный движок: pandas и Polars ===
+
+def bench_polars(n_emp=2_000, n_days=60):
+    if not engine._installed("polars"):
+        print("[polars] polars не установлен — пропуск")
+        return
+    import polars_engine
+
+    frame = synth_journal_frame(n_emp, n_days)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {"csv": os.path.join(tmp, "journal.csv"), "parquet": os.path.join(tmp, "journal.parquet")}
+        frame.to_csv(paths["csv"], index=False, sep=";")
+        frame.assign(**{"Дата события": pd.to_datetime(frame["Дата события"])}).to_parquet(paths["parquet"], index=False)
+        print(f"[polars] журнал {len(frame)} строк")
+        for name, path in paths.items():
+            old_s, old = _best_of(lambda: engine.build_report(path, render=False), repeat=1)
+            new_s, new = _best_of(lambda: engine.build_report(path, render=False, engine="polars"), repeat=1)
+            pd.testing.assert_frame_equal(old, new)
+            _line(f"build_report {name}", old_s, new_s)
+            old_s, _ = _best_of(lambda: engine.read_journal(path), repeat=1)
+            new_s, _ = _best_of(lambda: polars_engine.read_journal_polars(path), repeat=1)
+            _line(f"чтение журнала {name}", old_s, new_s)
+
+
+# === Разметка дверей и выбор колонки направлений ===
+
+def _prepare_labels_eager(df):
+    # прежняя подготовка: метки обеих колонок целиком, затем качество по меткам
+    labels = {col: engine.label_series(df[col]) for col in ("Вход", "Выход")}
+    scores = {
+        col: (int((lab != engine.LAB_NONE).sum()), int((lab & engine.LAB_IN).astype(bool).sum()))
+        for col, lab in labels.items()
+    }
+    right_col = "Вход" if scores["Вход"] >= scores["Выход"] else "Выход"
+    return scores, labels[right_col]
+
+
+def bench_doors(n=2_000_000, n_doors=20_000):
+    from doors import DoorDictionary
+
+    rng = np.random.default_rng(0)
+    names = np.array(
+        [f"{k} {i}" for i, k in enumerate(rng.choice(["Офис", "Шлюз", "Турникет", "Кабинет", "Склад"], n_doors))],
+        dtype=object,
+    )
+    df = pd.DataFrame({"Вход": names[rng.integers(0, n_doors, n)], "Выход": names[rng.integers(0, n_doors, n)]})
+    print(f"[doors] {n} проходов, {n_doors} дверей")
+
+    doors = DoorDictionary()
+    doors.classify(names)   # словарь площадки уже накоплен прошлыми запусками
+
+    def _new():
+        p = engine.PreparedJournal(df, doors=doors)
+        right_col = "Вход" if p.scores["Вход"] >= p.scores["Выход"] else "Выход"
+        return p.scores, p.labels[right_col]
+
+    old_s, old = _best_of(lambda: _prepare_labels_eager(df))
+    new_s, new = _best_of(_new)
+    assert old[0] == new[0] and (old[1] == new[1]).all()
+    _line("метки + выбор колонки", old_s, new_s)
+
+
+# === Рабочие сутки ===
+
+def bench_workday(n=1_000_000):
+    rng = np.random.default_rng(0)
+    ts = pd.Series(pd.Timestamp("2025-11-03") + pd.to_timedelta(rng.integers(0, 30 * 86400, n), unit="s"))
+    print(f"[workday] {n} событий")
+
+    old_s, old = _best_of(lambda: ts.apply(engine.work_day), repeat=1)
+    new_s, new = _best_of(lambda: engine.work_days(ts))
+    assert (old.to_numpy() == new.astype(object)).all()
+    _line("work_day", old_s, new_s)
+
+
+# === Стартовое состояние «внутри» по группам ===
+
+def _inside_at_loop(tl, at, lower):
+    # прежний путь: по группе назад от конца до последней понятной метки
+    res = np.zeros(len(tl), dtype=bool)
+    offsets = tl.offsets.tolist()
+    for i, (a, lo) in enumerate(zip(at.tolist(), lower.tolist())):
+        tt = tl.t[offsets[i]:offsets[i + 1]].tolist()
+        ll = tl.lab[offsets[i]:offsets[i + 1]].tolist()
+        for j in range(len(tt) - 1, -1, -1):
+            if tt[j] > a:
+                continue
+            if tt[j] < lo:
+                break
+            if ll[j]:
+                res[i] = ll[j] == engine.LAB_IN
+                break
+    return res
+
+
+def bench_state(n_emp=5_000, n_days=20):
+    frame = engine._clean_journal(synth_journal_frame(n_emp, n_days))
+    frame = frame.iloc[engine._journal_order(frame)].reset_index(drop=True)
+    tl = engine.PreparedJournal(frame).timeline("Вход")
+    print(f"[state] {len(tl.t)} событий, {len(tl)} групп")
+
+    # середина дня: часть групп уже прошла несколько событий
+    at = tl.day_ns + 13 * 3600 * 10**9
+    lower = tl.day_ns + engine.DAY_START_H * 3600 * 10**9
+    old_s, old = _best_of(lambda: _inside_at_loop(tl, at, lower), repeat=1)
+    new_s, new = _best_of(lambda: tl.inside_at(at, lower))
+    assert (old == new).all()
+    _line("состояние на момент", old_s, new_s)
+
+
+# === Сортировка журнала и группировки по целым ключам ===
+
+def _weekly_totals_groupby(final):
+    # прежняя реализация: groupby по строкам ФИО и неделе
+    final = final.reset_index(drop=True)
+    grp = final.groupby(["ФИО", "week_monday"], sort=False)
+    week_sum = grp["Итого_дня_мин"].sum()
+    last_idx = grp["Дата"].idxmax()
+    keep = (week_sum > 0).to_numpy()
+    week_min = np.zeros(len(final), dtype=np.int64)
+    week_min[last_idx.to_numpy()[keep].astype(np.int64)] = week_sum.to_numpy()[keep]
+    final["Итого_нед_мин"] = week_min
+    return final
+
+
+def bench_sort(n_emp=10_000, n_days=20):
+    # выгрузка СКУД идёт по времени, а не по сотрудникам
+    frame = engine._clean_journal(synth_journal_frame(n_emp, n_days)).sort_values("Дата события", kind="stable")
+    print(f"[sort] журнал {len(frame)} строк")
+    keys = ["ФИО", "Рабочий_день", "Дата события"]
+
+    as_str = frame.astype({"ФИО": object})
+    old_s, old = _best_of(lambda: as_str.sort_values(keys).reset_index(drop=True), repeat=1)
+    new_s, new = _best_of(lambda: frame.iloc[engine._journal_order(frame)].reset_index(drop=True))
+    assert (old["ФИО"].to_numpy() == new["ФИО"].astype(object).to_numpy()).all()
+    assert (old["Дата события"].to_numpy() == new["Дата события"].to_numpy()).all()
+    _line("сортировка (строки ФИО)", old_s, new_s)
+    cat_s, _ = _best_of(lambda: frame.sort_values(keys).reset_index(drop=True))
+    _line("сортировка (категории)", cat_s, new_s)
+
+    week = synth_week_frame(n_emp, n_days // 5)
+    old_s, old = _best_of(lambda: _weekly_totals_groupby(week.copy()))
+    new_s, new = _best_of(lambda: engine._weekly_totals(week.copy()))
+    pd.testing.assert_frame_equal(old, new)
+    _line("итоги недели (groupby)", old_s, new_s)
+
+
+# === Ядро посуточного расчёта: Python и Numba ===
+
+def bench_kernel(n_emp=5_000, n_days=20):
+    if not engine._installed("numba"):
+        print("[kernel] numba не установлен — пропуск")
+        return
+    frame = engine._clean_journal(synth_journal_frame(n_emp, n_days))
+    frame = frame.iloc[engine._journal_order(frame)].reset_index(drop=True)
+    tl = engine.PreparedJournal(frame).timeline("Вход")
+    print(f"[kernel] {len(tl.t)} событий, {len(tl)} групп")
+
+    tiny = engine.PreparedJournal(frame.head(8)).timeline("Вход")
+    t0 = time.perf_counter()
+    engine.day_metrics(tiny, kernel="numba")
+    print(f"{'компиляция/загрузка ядра':<28} {time.perf_counter() - t0:8.3f} с")
+
+    old_s, old = _best_of(lambda: engine.day_metrics(tl, kernel="python"), repeat=1)
+    new_s, new = _best_of(lambda: engine.day_metrics(tl, kernel="numba"))
+    pd.testing.assert_frame_equal(old, new)
+    _line("day_metrics", old_s, new_s)
+
+
+# === Заполненность по слотам ===
+
+def _occupancy_replay(tl, slot_min=15):
+    # прежний подход (ноутбук): проигрываем события каждого сотрудника
+    # и добавляем его к каждому слоту, начало которого попало в интервал присутствия
+    slot_ns = slot_min * 60 * 10**9
+    start, end = engine._day_windows(tl, engine.DEFAULT_POLICY)[:2]
+    counts = {}
+    for i in range(len(tl)):
+        lo, hi = tl.offsets[i], tl.offsets[i + 1]
+        tt, ll = tl.t[lo:hi].tolist(), tl.lab[lo:hi].tolist()
+        a, b = int(start[i]), int(end[i])
+        since = a if engine._inside_at(tt, ll, a, a) else None
+        spans = []
+        for t, lab in zip(tt, ll):
+            if not lab or t < a or t > b:
+                continue
+            if lab != engine.LAB_OUT:
+                since = t if since is None else since
+            elif since is not None:
+                spans.append((since, t))
+                since = None
+        if since is not None:
+            spans.append((since, b))
+        for s0, s1 in spans:
+            slot = -(-(s0 - a) // slot_ns) * slot_ns + a
+            while slot < s1:
+                counts[slot] = counts.get(slot, 0) + 1
+                slot += slot_ns
+    return counts
+
+
+def bench_occupancy(n_emp=5_000, n_days=20):
+    import occupancy
+
+    frame = engine._clean_journal(synth_journal_frame(n_emp, n_days))
+    frame = frame.iloc[engine._journal_order(frame)].reset_index(drop=True)
+    tl = engine.PreparedJournal(frame).timeline("Вход")
+    print(f"[occupancy] {len(tl.t)} событий, {len(tl)} групп")
+
+    old_s, old = _best_of(lambda: _occupancy_replay(tl), repeat=1)
+    new_s, (series, _) = _best_of(lambda: occupancy.occupancy_series(tl))
+    slots = series["Слот"].to_numpy().view(np.int64).tolist()
+    assert series["Внутри"].tolist() == [old.get(s, 0) for s in slots]
+    _line("заполненность по слотам", old_s, new_s)
+
+
+# === Итоги недели и сетка табеля ===
+
+def _weekly_totals_loop(final):
+    # прежняя реализация: цикл по группам с точечными .loc-записями
+    final = final.copy()
+    final["Итого_нед_мин"] = 0
+    for (fio, wmo), sub in final.groupby(["ФИО", "week_monday"], sort=False):
+        week_sum = int(sub["Итого_дня_мин"].sum())
+        if week_sum <= 0:
+            continue
+        last_idx = sub["Дата"].idxmax()
+        final.loc[last_idx, "Итого_нед_мин"] = week_sum
+    return final
+
+
+def _calendar_base_loop(all_fio, days_present):
+    return pd.DataFrame([(fio, d) for fio in all_fio for d in days_present], columns=["ФИО", "Дата"])
+
+
+def bench_weekly(n_emp=10_000, n_weeks=4):
+    frame = synth_week_frame(n_emp, n_weeks)
+    print(f"[weekly] {n_emp} сотрудников × {n_weeks} нед. = {len(frame)} строк")
+
+    old_s, old = _best_of(lambda: _weekly_totals_loop(frame), repeat=1)
+    new_s, new = _best_of(lambda: engine._weekly_totals(frame.copy()))
+    pd.testing.assert_series_equal(old["Итого_нед_мин"], new["Итого_нед_мин"], check_dtype=False)
+    _line("итоги недели", old_s, new_s)
+
+    all_fio = sorted(frame["ФИО"].unique())
+    days = list(frame["Дата"].unique())
+    old_s, old = _best_of(lambda: _calendar_base_loop(all_fio, days))
+    new_s, new = _best_of(lambda: engine._calendar_base(all_fio, days))
+    pd.testing.assert_frame_equal(old, new)
+    _line("сетка ФИО × дни", old_s, new_s)
+
+
+# === Причины отсутствия: слияние с кадрами ===
+
+def _absence_reasons_dates(final, kadry_dates):
+    # прежняя реализация: ключ дня через pd.to_datetime(...).dt.date, ключи ФИО построчно
+    final, kadry_dates = final.copy(), kadry_dates.copy()
+    final["Дата_key"] = pd.to_datetime(final["Дата"], errors="coerce").dt.date
+    kadry_dates["Дата_key"] = pd.to_datetime(kadry_dates["Дата"], errors="coerce").dt.date
+    for key, fn in (("ФИО_key_full", engine.fio_match_key), ("ФИО_key_short", engine.fio_short_key)):
+        final[key] = final["ФИО"].apply(fn)
+        kadry_dates[key] = kadry_dates["ФИО"].apply(fn)
+    m1 = kadry_dates[["ФИО_key_full", "Дата_key", "Тип"]].drop_duplicates()
+    final = final.merge(m1, on=["ФИО_key_full", "Дата_key"], how="left")
+    need2 = final["Тип"].isna()
+    if need2.any():
+        m2 = kadry_dates[["ФИО_key_short", "Дата_key", "Тип"]].drop_duplicates()
+        tmp = final.loc[need2, ["ФИО_key_short", "Дата_key"]].merge(m2, on=["ФИО_key_short", "Дата_key"], how="left")
+        final.loc[need2, "Тип"] = tmp["Тип"].values
+    final["Причина отсутствия"] = final["Тип"].fillna("")
+    return final.drop(columns=["Тип", "ФИО_key_full", "ФИО_key_short", "Дата_key"])
+
+
+def bench_kadry(n_emp=10_000, n_weeks=4):
+    final = synth_week_frame(n_emp, n_weeks)[["ФИО", "Дата"]]
+    surname = final["ФИО"].str.replace(" ", "")
+    final = final.assign(ФИО=surname + " Анна Петровна")
+    rng = np.random.default_rng(1)
+    absent = final.sample(frac=0.05, random_state=1)
+    # половина кадровых записей — «Фамилия А.П.», чтобы работал и второй проход
+    short = rng.random(len(absent)) < 0.5
+    kadry_dates = pd.DataFrame({
+        "ФИО": np.where(short, surname[absent.index] + " А.П.", absent["ФИО"]),
+        "Дата": absent["Дата"].to_numpy(),
+        "Тип": rng.choice(["Отпуск", "Больничный", "Командировка"], len(absent)),
+    })
+    print(f"[kadry] {len(final)} строк табеля, {len(kadry_dates)} дней отсутствия")
+
+    old_s, old = _best_of(lambda: _absence_reasons_dates(final, kadry_dates), repeat=1)
+    new_s, new = _best_of(lambda: engine._absence_reasons(final, kadry_dates))
+    pd.testing.assert_frame_equal(old, new)
+    _line("причины отсутствия", old_s, new_s)
+
+
+# === Память рабочего кадра журнала ===
+
+def _clean_journal_wide(df_raw):
+    # прежний рабочий кадр (как в исходном read_journal, без сортировки):
+    # все строки — объекты Python, рабочий день — date, фильтры построчно
+    df = df_raw[engine.JOURNAL_COLUMNS].copy()
+    df["Событие_n"] = df["Событие"].apply(engine.norm)
+    df = df[df["Событие_n"].str.contains("проход по идентификатору", na=False)].copy()
+    for c in ["Фамилия", "Имя", "Отчество"]:
+        df[c] = df[c].where(df[c].notna(), "").astype(str).str.strip()
+    df["ФИО"] = (
+        df.apply(lambda row: " ".join(p for p in (row["Фамилия"], row["Имя"], row["Отчество"]) if p), axis=1)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+    df["Дата события"] = df["Дата события"].apply(engine.smart_parse_date)
+    df = df.dropna(subset=["Дата события"])
+    df["Рабочий_день"] = df["Дата события"].apply(engine.work_day)
+    df["Вход_n"] = df["Вход"].apply(engine.norm)
+    df["Выход_n"] = df["Выход"].apply(engine.norm)
+    bad_both = (
+        df["Вход_n"].str.contains("неконтролируем", na=False)
+        & df["Выход_n"].str.contains("неконтролируем", na=False)
+    )
+    df = df[~bad_both]
+    return df[~df["ФИО"].apply(engine.is_nonperson)].copy()
+
+
+def bench_memory(n_emp=2_000, n_days=20):
+    frame = synth_journal_frame(n_emp, n_days)
+    print(f"[memory] журнал {len(frame)} строк")
+
+    old_s, old = _best_of(lambda: _clean_journal_wide(frame), repeat=1)
+    new_s, new = _best_of(lambda: engine._clean_journal(frame), repeat=1)
+    assert (old["ФИО"].to_numpy() == new["ФИО"].astype(object).to_numpy()).all()
+    assert (old["Рабочий_день"].to_numpy() == new["Рабочий_день"].to_numpy().astype("datetime64[D]").astype(object)).all()
+    _line("разбор журнала", old_s, new_s)
+
+    old_mb = old.memory_usage(deep=True).sum() / 2**20
+    new_mb = new.memory_usage(deep=True).sum() / 2**20
+    print(f"{'рабочий кадр':<28} было {old_mb:8.1f} МБ  стало {new_mb:8.1f} МБ  ×{old_mb / new_mb:.1f}")
+    lab = engine.PreparedJournal(new).labels["Вход"]
+    print(f"{'метки направлений (int8)':<28} {lab.nbytes / 2**20:8.1f} МБ")
+
+
+# === Этапы отчёта с кэшем ===
+
+def bench_stages(n_emp=2_000, n_days=20):
+    import pipeline
+
+    frame = synth_journal_frame(n_emp, n_days)
+    fio = (frame["Фамилия"] + " Анна Петровна").drop_duplicates().to_numpy()
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = os.path.join(tmp, "journal.csv")
+        frame.to_csv(journal, index=False, sep=";")
+        kadry = []
+        for i in range(2):
+            who = rng.choice(fio, n_emp // 20, replace=False)
+            path = os.path.join(tmp, f"kadry{i}.csv")
+            pd.DataFrame({
+                "Сотрудник": who, "Вид отсутствия": "Отпуск", "с": "2025-11-10", "до": "2025-11-14",
+            }).to_csv(path, index=False, sep=";")
+            kadry.append(path)
+        print(f"[stages] журнал {len(frame)} строк, два кадровых файла")
+
+        cache = pipeline.StageCache(os.path.join(tmp, "stages"))
+        for k in kadry:
+            old_s, old = _best_of(lambda: engine.build_report(journal, k), repeat=1)
+            new_s, new = _best_of(lambda: pipeline.build_report_staged(journal, k, cache=cache), repeat=1)
+            pd.testing.assert_frame_equal(old, new)
+            redone = [name for name, hit in cache.last_run.items() if not hit]
+            _line(f"{os.path.basename(k)} (пересчёт: {len(redone)})", old_s, new_s)
+            print(f"{'':<28} пересчитаны: {', '.join(redone)}")
+
+
+# === Форматирование длительностей ===
+
+def bench_fmt(n=1_000_000):
+    rng = np.random.default_rng(0)
+    minutes = pd.Series(rng.integers(0, 1441, n)).astype("Int64")
+    minutes[rng.random(n) < 0.05] = pd.NA
+    print(f"[fmt] {n} значений минут")
+
+    old_s, old = _best_of(lambda: minutes.apply(engine.fmt_hm).to_numpy(dtype=object), repeat=1)
+    new_s, new = _best_of(lambda: engine.fmt_hm_array(minutes))
+    assert (old == new).all()
+    _line("fmt_hm", old_s, new_s)
+
+
+BENCHES = {
+    "read": bench_read,
+    "sheets": bench_sheets,
+    "excel": bench_excel,
+    "ooc": bench_ooc,
+    "spool": bench_spool,
+    "polars": bench_polars,
+    "doors": bench_doors,
+    "workday": bench_workday,
+    "sort": bench_sort,
+    "state": bench_state,
+    "kernel": bench_kernel,
+    "occupancy": bench_occupancy,
+    "weekly": bench_weekly,
+    "kadry": bench_kadry,
+    "fmt": bench_fmt,
+    "memory": bench_memory,
+    "stages": bench_stages,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    for name in names:
+        BENCHES[name]()
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import tempfile
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:     # Windows: без блокировки, слияние при записи всё равно есть
+    fcntl = None
+
+from engine import INSIDE_HINTS, LAB_BOTH, LAB_IN, LAB_NONE, LAB_OUT, OUTSIDE_HINTS, door_labels
+
+# === Словарь дверей площадки ===
+# Каждое уникальное название двери один раз размечается по подсказкам
+# (INSIDE_HINTS / OUTSIDE_HINTS) и запоминается в JSON-файле площадки.
+# Дальше метки берутся из словаря; файл можно поправить руками —
+# например, пометить «Переход корпус 2» как "in".
+# При смене подсказок в коде заново размечаются только двери, которые словарь
+# запомнил сам; поправленные руками (метка не совпадает с подсказками) остаются.
+# При записи словарь перечитывается с диска и дополняется только новыми дверями,
+# так что правка, сохранённая во время расчёта, не затирается.
+
+DOOR_CACHE_DIR = os.environ.get(
+    "UMNYI_OTCHET_DOORS",
+    os.path.join(os.path.expanduser("~"), ".cache", "umnyi_otchet", "doors"),
+)
+
+_NAMES = {LAB_NONE: "unknown", LAB_IN: "in", LAB_OUT: "out", LAB_BOTH: "both"}
+_CODES = {v: k for k, v in _NAMES.items()}
+
+
+def _hints_key():
+    return {"inside": list(INSIDE_HINTS), "outside": list(OUTSIDE_HINTS)}
+
+
+def _site_file(site, cache_dir=None):
+    safe = re.sub(r"[^\w.-]+", "_", str(site)).strip("_") or "default"
+    return os.path.join(cache_dir or DOOR_CACHE_DIR, f"{safe}.json")
+
+
+def _read_doors(path):
+    """
+    (двери файла, подсказки совпадают с текущими) — двери по текущим подсказкам.
+    Если подсказки в коде изменились, из файла остаются только поправленные руками
+    двери (метка не совпадает с разбором по подсказкам, с которыми файл записан).
+    """
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}, True
+    doors = {d: _CODES[v] for d, v in data.get("doors", {}).items() if v in _CODES}
+    hints = data.get("hints") or {}
+    if hints == _hints_key():
+        return doors, True
+    names = list(doors)
+    hinted = door_labels(names, hints.get("inside", []), hints.get("outside", [])).tolist()
+    return {d: doors[d] for d, h in zip(names, hinted) if doors[d] != h}, False
+
+
+class DoorDictionary:
+    """
+    Название двери -> метка направления (LAB_*).
+    classify(...) размечает незнакомые двери по подсказкам и добавляет их в словарь;
+    save() дописывает в файл площадки только новые двери, если они появились.
+    """
+
+    def __init__(self, doors=None, path=None):
+        self.doors = dict(doors or {})
+        self.path = path
+        self._learned = set()
+        self._stale = False     # файл записан под другие подсказки — перезаписать
+
+    def __len__(self):
+        return len(self.doors)
+
+    @classmethod
+    def load(cls, site="default", cache_dir=None):
+        """Словарь площадки с диска (пустой, если файла нет)."""
+        path = _site_file(site, cache_dir)
+        doors, current = _read_doors(path)
+        res = cls(doors, path)
+        res._stale = not current and os.path.exists(path)
+        return res
+
+    def classify(self, doors) -> np.ndarray:
+        """Метки для уникальных названий дверей; новые — по подсказкам, с запоминанием."""
+        doors = [str(d) for d in doors]
+        new = [d for d in doors if d not in self.doors]
+        if new:
+            self.doors.update(zip(new, door_labels(new).tolist()))
+            self._learned.update(new)
+        return np.fromiter((self.doors[d] for d in doors), dtype=np.int8, count=len(doors))
+
+    def overrides(self) -> dict:
+        """
+        Записи, метка которых отличается от разбора по подсказкам (поправлены руками).
+        Только они меняют разметку: двери, добавленные classify, совпадают с подсказками.
+        """
+        names = list(self.doors)
+        hinted = door_labels(names)
+        return {d: c for d, c, h in zip(names, self.doors.values(), hinted.tolist()) if c != h}
+
+    def save(self):
+        """
+        Дописывает в файл новые двери. Файл перечитывается под блокировкой: правки
+        и двери, записанные другими процессами после load(), сохраняются.
+        """
+        if not (self._learned or self._stale) or self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            doors, _ = _read_doors(self.path)
+            for d in self._learned:
+                doors.setdefault(d, self.doors[d])
+            data = {
+                "hints": _hints_key(),
+                "doors": {d: _NAMES[c] for d, c in sorted(doors.items())},
+            }
+            # пишем во временный файл и подменяем — читающие не видят половину файла
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(data, fh, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        self._learned.clear()
+        self._stale = False
@@ -1,7 +1,15 @@
 import pandas as pd
+import numpy as np
+import bisect
 import io
+import mmap
+import multiprocessing
+import os
+import time
 import unicodedata
 import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, date
 
 # === Умный парсер дат ===
@@ -34,6 +42,10 @@ def smart_parse_date(x):
     if not s or s.lower() in {"nan", "none", "nat"}:
         return pd.NaT
 
+    # ISO с временем (2025-11-03 08:41:58): dayfirst=True ниже переставил бы день и месяц
+    if re.match(r"\d{4}-\d{1,2}-\d{1,2}[ T]\d", s):
+        return pd.to_datetime(s, format="ISO8601", errors="coerce")
+
     # немного чистим: 21-11-24 → 21.11.24; 2024/11/21 → 2024.11.21
     s_clean = re.sub(r"[-/]", ".", s)
 
@@ -61,6 +73,40 @@ DAY_CORE_MIN = 8 * 60       # 8 часов ядра
 LATE_H, LATE_M = 9, 1       # опоздание с 09:01
 
 EXIT_MIN_DURATION = 5   # учитывать только выходы длительностью от 5 минут
+SUSPECT_GAP_MIN = 60    # два одинаковых подряд события с разрывом > 60 мин
+DAY_START_H = 6         # рабочие сутки 06:00–06:00
+LUNCH_MIN = 60          # фикс-обед
+SHORT_SHIFT_MIN = 60    # смена короче — обед и штраф не вычитаем
+OUTSIDE_ALLOWANCE_MIN = 60  # допустимое время вне офиса в ядре
+LONG_GAP_MIN = 120      # «Отсутствие более 2 часов подряд»
+
+
+# === Политика учёта ===
+@dataclass(frozen=True)
+class Policy:
+    """
+    Набор параметров учёта рабочего времени.
+    Значения по умолчанию совпадают с константами модуля, так что
+    build_report(...) без политики считает ровно как раньше.
+    """
+    name: str = "default"
+    core_start_h: int = CORE_START_H
+    core_start_m: int = CORE_START_M
+    core_end_h: int = CORE_END_H
+    core_end_m: int = CORE_END_M
+    late_h: int = LATE_H
+    late_m: int = LATE_M
+    dedup_window_min: float = DEDUP_WINDOW_MIN
+    exit_min_duration: float = EXIT_MIN_DURATION
+    suspect_gap_min: float = SUSPECT_GAP_MIN
+    day_start_h: int = DAY_START_H
+    lunch_min: int = LUNCH_MIN
+    short_shift_min: int = SHORT_SHIFT_MIN
+    outside_allowance_min: int = OUTSIDE_ALLOWANCE_MIN
+    long_gap_min: int = LONG_GAP_MIN
+
+
+DEFAULT_POLICY = Policy()
 
 def fmt_hm(m) -> str:
     """минуты -> 'Xч Yмин' (0 -> '0ч 0мин', пустое если NaN)."""
@@ -76,6 +122,20 @@ def fmt_hm(m) -> str:
     return f"{h}ч {mm}мин"
 
 
+def fmt_hm_array(m) -> np.ndarray:
+    """
+    Векторный fmt_hm для колонки минут (поэлементно тот же результат).
+    Строки собираются только для уникальных значений (divmod по массиву),
+    затем раздаются по кодам factorize; NaN/<NA> -> ''.
+    """
+    codes, uniques = pd.factorize(pd.Series(m))
+    u = np.maximum(np.trunc(np.asarray(uniques, dtype=np.float64)), 0).astype(np.int64)
+    h, mm = np.divmod(u, 60)
+    table = np.char.add(np.char.add(h.astype(str), "ч "), np.char.add(mm.astype(str), "мин"))
+    table = np.append(table.astype(object), "")
+    return table[codes]
+
+
 def fio_norm(s: str) -> str:
     s = "" if pd.isna(s) else str(s)
     s = unicodedata.normalize("NFKC", s)
@@ -84,51 +144,87 @@ def fio_norm(s: str) -> str:
     return s
 
 
-def work_day(ts):
-    """Рабочие сутки 06:00–06:00."""
+def work_day(ts, day_start_h=DAY_START_H):
+    """Рабочие сутки 06:00–06:00 (граница задаётся day_start_h) для одного момента."""
     ts = pd.to_datetime(ts)
-    return (ts - pd.Timedelta(days=1)).date() if ts.hour < 6 else ts.date()
+    return (ts - pd.Timedelta(days=1)).date() if ts.hour < day_start_h else ts.date()
+
+
+def work_days(ts, day_start_h=DAY_START_H) -> np.ndarray:
+    """
+    Векторный work_day: моменты -> рабочие сутки (datetime64[D]).
+    Сдвигаем на границу суток назад и округляем вниз до дня — без разбора каждой строки.
+    """
+    return _work_day_ord(_to_ns(ts), day_start_h).astype("datetime64[D]")
 
 
 def norm(s):
     s = "" if pd.isna(s) else str(s)
     return unicodedata.normalize("NFKC", s).strip().casefold()
 
-def last_known_dest_before(g: pd.DataFrame, right_col: str, ts: pd.Timestamp, lower_bound=None) -> str:
-    if g is None or g.empty:
-        return ""
-    h = g[g["Дата события"] <= ts].copy()
-    if lower_bound is not None:
-        h = h[h["Дата события"] >= lower_bound]
-    if h.empty:
-        return ""
-    h["dest_n"] = h[right_col].map(norm)
-    # оставляем только понятные метки (офис/шлюз)
-    h = h[h["dest_n"].apply(lambda s: any(x in s for x in INSIDE_HINTS) or any(x in s for x in OUTSIDE_HINTS))]
-    if h.empty:
-        return ""
-    return str(h.iloc[-1]["dest_n"])
+
+# === Метки направлений ===
+# Код метки по названию двери: бит 1 — есть «офисная» подсказка, бит 2 — «шлюзовая».
+# В посуточной логике LAB_IN/LAB_BOTH считаются входом, LAB_OUT — выходом;
+# при определении стартового состояния «внутри» только чистый LAB_IN.
+LAB_NONE, LAB_IN, LAB_OUT, LAB_BOTH = 0, 1, 2, 3
+
+
+def door_label(s, inside=None, outside=None) -> int:
+    s = norm(s)
+    code = LAB_NONE
+    if any(x in s for x in (INSIDE_HINTS if inside is None else inside)):
+        code |= LAB_IN
+    if any(x in s for x in (OUTSIDE_HINTS if outside is None else outside)):
+        code |= LAB_OUT
+    return code
 
 
-def init_inside_at(a: pd.Timestamp, grp: pd.DataFrame, right_col: str) -> bool:
+def door_labels(doors, inside=None, outside=None) -> np.ndarray:
+    """Метки для списка уникальных названий дверей (по умолчанию — по текущим подсказкам)."""
+    return np.array([door_label(u, inside, outside) for u in doors], dtype=np.int8)
+
+
+def door_codes(s: pd.Series, doors=None):
     """
-    Если после 06:00 нет понятных событий — считаем СНАРУЖИ (False).
+    Колонка дверей -> (коды уникальных дверей, таблица меток по кодам).
+    Подсказки проверяются один раз на уникальное значение; последний элемент
+    таблицы — метка для пустых ячеек (код -1).
+    doors — словарь дверей площадки (doors.DoorDictionary) вместо разбора по подсказкам.
     """
-    if grp is None or grp.empty:
-        return False
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # рабочий кадр журнала: двери уже закодированы категориями
+        codes, uniques = s.cat.codes.to_numpy(), s.cat.categories
+    else:
+        codes, uniques = pd.factorize(s)
+    table = doors.classify(uniques) if doors is not None else door_labels(uniques)
+    return codes, np.append(table, np.int8(LAB_NONE))
 
-    g = grp.sort_values("Дата события")[["Дата события", right_col]].copy()
 
-    day_0600 = pd.Timestamp(a).normalize() + pd.Timedelta(hours=6)
-    if a < day_0600:
-        day_0600 = day_0600 - pd.Timedelta(days=1)
+def label_series(s: pd.Series, doors=None) -> np.ndarray:
+    """Метки для колонки дверей."""
+    codes, table = door_codes(s, doors)
+    return table[codes]
 
-    last_dest = last_known_dest_before(g, right_col, a, lower_bound=day_0600)
 
-    if not last_dest:
-        return False  # нет данных -> снаружи
+def door_scores(codes, table):
+    """
+    "Качество" колонки дверей: (распознано офис/шлюз, распознано офис) в проходах.
+    Число проходов через каждую уникальную дверь × её метка, без разметки каждой строки.
+    """
+    counts = np.bincount(np.where(codes < 0, len(table) - 1, codes), minlength=len(table))
+    return int(counts[table != LAB_NONE].sum()), int(counts[(table & LAB_IN) != 0].sum())
 
-    return not any(x in last_dest for x in OUTSIDE_HINTS)
+
+def init_inside_at(a: pd.Timestamp, grp: pd.DataFrame, right_col: str, day_start_h=DAY_START_H) -> bool:
+    """
+    Состояние на момент a по последней понятной метке с начала рабочих суток (_inside_at).
+    Если после 06:00 нет понятных событий — считаем СНАРУЖИ (False).
+    """
+    if grp is None or grp.empty:
+        return False
+    a = pd.Timestamp(a).value
+    return _inside_at(*_group_arrays(grp, right_col), a, _day_floor(a, day_start_h * _NS_HOUR))
 
 # --- Фильтрация «не людей» (карты, клининг и т.п.) ---
 NONPERSON_TOKENS = [
@@ -177,26 +273,219 @@ def is_nonperson(fio: str) -> bool:
     return False
 
 
+# ===================== ФОРМАТЫ ВХОДНЫХ ФАЙЛОВ =====================
+# Формат определяем по сигнатуре содержимого, а не по имени файла:
+# xlsx (zip), xls (OLE2), Parquet; всё остальное считаем CSV.
+# CSV и Parquet читаем через pyarrow (многопоточно, с типизацией колонок).
+
+_MAGIC = [(b"PAR1", "parquet"), (b"PK\x03\x04", "xlsx"), (b"\xd0\xcf\x11\xe0", "xls")]
+_CSV_SNIFF_BYTES = 64 * 1024
+
+
+def sniff_format(content: bytes) -> str:
+    head = bytes(content[:8])
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return "csv"
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Для чтения CSV/Parquet нужен пакет pyarrow (pip install pyarrow).")
+    return pa
+
+
+def _csv_dialect(content: bytes):
+    """Кодировка и разделитель CSV по первым килобайтам."""
+    import csv
+
+    sample = content[:_CSV_SNIFF_BYTES]
+    if len(content) > _CSV_SNIFF_BYTES:
+        # не режем многобайтовый символ посередине
+        sample = sample[: sample.rfind(b"\n") + 1] or sample
+    try:
+        text = sample.decode("utf-8")
+        encoding = "utf8"
+    except UnicodeDecodeError:
+        # выгрузки СКУД из 1С / Windows
+        text = sample.decode("cp1251", errors="replace")
+        encoding = "cp1251"
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=";,\t|").delimiter
+    except csv.Error:
+        delimiter = ";"
+    return encoding, delimiter
+
+
+def _csv_header_row(content: bytes, cell: str) -> int:
+    """Номер строки CSV, где есть ячейка cell (шапка отчёта над таблицей); 0 — если не нашли."""
+    import csv
+
+    encoding, delimiter = _csv_dialect(content)
+    text = content[:_CSV_SNIFF_BYTES].decode(encoding.replace("utf8", "utf-8-sig"), errors="replace")
+    cell = cell.casefold()
+    for i, row in enumerate(csv.reader(io.StringIO(text), delimiter=delimiter)):
+        if any(c.strip().casefold() == cell for c in row):
+            return i
+    return 0
+
+
+def _read_csv_arrow(content: bytes, skip_rows=0, columns=None, text_columns=()) -> pd.DataFrame:
+    """
+    CSV через pyarrow; заголовок — строка skip_rows.
+    columns — проекция (нет колонки → ошибка), text_columns — колонки,
+    которые не типизируем (остаются строками). Пустые ячейки → пропуски, как в Excel.
+    """
+    pa = _pyarrow()
+    from pyarrow import csv as pa_csv
+
+    encoding, delimiter = _csv_dialect(content)
+    if content[:3] == b"\xef\xbb\xbf":
+        # срез через memoryview — без копии содержимого
+        content = memoryview(content)[3:]
+    table = pa_csv.read_csv(
+        pa.BufferReader(content),
+        read_options=pa_csv.ReadOptions(skip_rows=skip_rows, encoding=encoding),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=columns,
+            column_types={c: pa.string() for c in text_columns},
+            strings_can_be_null=True,
+        ),
+    )
+    return table.to_pandas()
+
+
+def _read_parquet(content: bytes, columns=None) -> pd.DataFrame:
+    """
+    Parquet с проекцией: читаем только колонки из columns (сравнение без крайних пробелов).
+    Имена выбранных колонок возвращаются без крайних пробелов — как их ждут вызывающие.
+    """
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(pa.BufferReader(content))
+    if columns is not None:
+        columns = [n for n in pf.schema_arrow.names if n.strip() in columns]
+        return pf.read(columns=columns).to_pandas().rename(columns=str.strip)
+    return pf.read().to_pandas()
+
+
+# === Движки чтения Excel ===
+# pandas.read_excel умеет читать разными библиотеками: openpyxl (xlsx) и
+# xlrd (xls) — на чистом Python, calamine (пакет python-calamine, Rust) —
+# оба формата и во много раз быстрее. По умолчанию берём самый быстрый
+# установленный движок, подходящий к формату; конкретный можно задать
+# параметром backend или переменной окружения UMNYI_OTCHET_EXCEL.
+
+EXCEL_BACKENDS = {
+    # движок: (модуль, форматы)
+    "calamine": ("python_calamine", ("xlsx", "xls")),
+    "openpyxl": ("openpyxl", ("xlsx",)),
+    "xlrd": ("xlrd", ("xls",)),
+}
+EXCEL_BACKEND = os.environ.get("UMNYI_OTCHET_EXCEL") or None
+
+
+def _installed(module) -> bool:
+    import importlib.util
+
+    return importlib.util.find_spec(module) is not None
+
+
+def excel_backend(fmt: str, backend=None) -> str:
+    """Движок pandas.read_excel для формата fmt ('xlsx'/'xls'): заданный или лучший из установленных."""
+    backend = backend or EXCEL_BACKEND
+    if backend is not None:
+        if backend not in EXCEL_BACKENDS:
+            raise RuntimeError(f"Неизвестный движок чтения Excel: {backend}. Доступны: {list(EXCEL_BACKENDS)}.")
+        module, formats = EXCEL_BACKENDS[backend]
+        if fmt not in formats:
+            raise RuntimeError(f"Движок {backend} не читает файлы .{fmt}.")
+        if not _installed(module):
+            raise RuntimeError(f"Для движка {backend} нужен пакет {module.replace('_', '-')}.")
+        return backend
+    for name, (module, formats) in EXCEL_BACKENDS.items():
+        if fmt in formats and _installed(module):
+            return name
+    need = "xlrd" if fmt == "xls" else "openpyxl"
+    raise RuntimeError(f"Для чтения файлов .{fmt} нужен пакет {need} (pip install {need}).")
+
+
+class _MappedFile(mmap.mmap):
+    """Файл на диске, отображённый в память только для чтения; path — путь к нему."""
+
+    path = None
+
+
+def _read_file_bytes(file_obj):
+    """
+    Содержимое файла (путь или файловый объект). Файлы на диске не читаются
+    в память, а отображаются (mmap): страницы подгружает ОС, копии байтов
+    в куче процесса нет. Загрузки в памяти (BytesIO и т.п.) — как есть.
+    """
+    if isinstance(file_obj, (str, os.PathLike)):
+        with open(file_obj, "rb") as fh:
+            return _read_file_bytes(fh)
+    try:
+        file_obj.seek(0)
+    except Exception:
+        pass
+    try:
+        mapped = _MappedFile(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # не файл на диске или пустой файл
+        return file_obj.read()
+    name = getattr(file_obj, "name", None)
+    mapped.path = os.path.abspath(name) if isinstance(name, str) else None
+    return mapped
+
+
+def _content_source(content):
+    """Что отдать pandas: путь к файлу на диске или поток над байтами (BytesIO делит буфер bytes)."""
+    path = getattr(content, "path", None)
+    if path is not None:
+        return path
+    return io.BytesIO(content)
+
+
 # ===================== ЧТЕНИЕ ЖУРНАЛА =====================
 
-def read_journal(file_obj) -> pd.DataFrame:
+JOURNAL_COLUMNS = ["Событие", "Дата события", "Фамилия", "Имя", "Отчество", "Вход", "Выход"]
+
+
+def read_journal(file_obj, backend=None) -> pd.DataFrame:
     """
-    Читаем журнал проходов из Excel.
+    Читаем журнал проходов из Excel (.xlsx/.xls), CSV или Parquet (формат — по содержимому).
     Ожидаем колонки:
     ['Событие','Дата события','Фамилия','Имя','Отчество','Вход','Выход']
+    backend — движок чтения Excel (EXCEL_BACKENDS), по умолчанию выбирается по формату.
     """
-    need = ["Событие", "Дата события", "Фамилия", "Имя", "Отчество", "Вход", "Выход"]
+    need = JOURNAL_COLUMNS
 
-    content = file_obj.read()
+    content = _read_file_bytes(file_obj)
+    fmt = sniff_format(content)
     df_raw = None
-    for skip in (3, 0, 1, 2):
+    if fmt == "parquet":
+        _tmp = _read_parquet(content, columns=need)
+        if set(need).issubset(_tmp.columns):
+            df_raw = _tmp
+    elif fmt == "csv":
+        # дату события pyarrow типизирует сам, остальное — строки
         try:
-            _tmp = pd.read_excel(io.BytesIO(content), engine="openpyxl", skiprows=skip)
-            if set(need).issubset(_tmp.columns):
-                df_raw = _tmp
-                break
-        except Exception:
-            continue
+            df_raw = _read_csv_arrow(
+                content,
+                _csv_header_row(content, "Дата события"),
+                columns=need,
+                text_columns=[c for c in need if c != "Дата события"],
+            )
+        except (KeyError, ValueError):
+            pass
+    else:
+        df_raw = _read_journal_sheets(content, engine=excel_backend(fmt, backend))
 
     if df_raw is None:
         raise RuntimeError(
@@ -204,7 +493,73 @@ def read_journal(file_obj) -> pd.DataFrame:
             f"(ожидались: {need}). Проверьте формат файла."
         )
 
-    df = df_raw[need].copy()
+    df = _clean_journal(df_raw)
+
+    # ✅ 2) ОДНА сортировка на весь пайплайн (ускоряет) — по целым ключам
+    df = df.iloc[_journal_order(df)].reset_index(drop=True)
+    
+    return df
+
+
+# === Журнал на нескольких листах Excel ===
+# Лист Excel вмещает 1 048 576 строк, поэтому выгрузки больших площадок
+# продолжаются на следующих листах. Берём все листы с шапкой журнала,
+# разбираем их параллельно (пул процессов: openpyxl упирается в GIL)
+# и склеиваем; сортировка — одна, уже после склейки.
+
+_HEADER_SKIPS = (3, 0, 1, 2)    # строк над шапкой: у вендора обычно 3
+
+
+def _read_journal_sheet(source, sheet, engine="openpyxl"):
+    """Один лист журнала или None, если шапки журнала на листе нет. source — путь или байты."""
+    xl = pd.ExcelFile(source if isinstance(source, str) else io.BytesIO(source), engine=engine)
+    try:
+        for skip in _HEADER_SKIPS:
+            try:
+                # сначала только шапка, лист целиком — когда нашли нужную строку
+                if set(JOURNAL_COLUMNS).issubset(xl.parse(sheet, skiprows=skip, nrows=0).columns):
+                    return xl.parse(sheet, skiprows=skip)
+            except Exception:
+                continue
+        return None
+    finally:
+        xl.close()
+
+
+def _read_journal_sheets(content: bytes, workers=None, engine="openpyxl"):
+    """Все листы с шапкой журнала, склеенные в один сырой кадр (None — таких нет)."""
+    try:
+        xl = pd.ExcelFile(_content_source(content), engine=engine)
+        sheets = xl.sheet_names
+        xl.close()
+    except Exception:
+        return None
+
+    # файл на диске процессы пула открывают сами — байты им не передаём
+    source = getattr(content, "path", None) or bytes(content)
+    workers = min(workers or os.cpu_count() or 1, len(sheets))
+    if workers > 1:
+        # spawn, а не fork: читаем и в веб-сервере, и в задании с потоком замера памяти,
+        # а fork многопоточного процесса может зависнуть
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            parts = list(pool.map(_read_journal_sheet, [source] * len(sheets), sheets, [engine] * len(sheets)))
+    else:
+        parts = [_read_journal_sheet(source, sh, engine) for sh in sheets]
+
+    parts = [p[JOURNAL_COLUMNS] for p in parts if p is not None]
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+
+def _clean_journal(df_raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Сырые колонки журнала -> проходы сотрудников: ФИО, разобранное время,
+    рабочий день, нормализованные двери. Без сортировки (её делает вызывающий),
+    поэтому годится и для журнала целиком, и для отдельного куска.
+    """
+    df = df_raw[JOURNAL_COLUMNS].copy()
     df["Событие_n"] = df["Событие"].apply(norm)
     df = df[
         df["Событие_n"].str.contains("проход по идентификатору", na=False)
@@ -223,62 +578,77 @@ def read_journal(file_obj) -> pd.DataFrame:
         .str.strip()
     )
 
-    # умный разбор даты
-    df["Дата события"] = df["Дата события"].apply(smart_parse_date)
+    # умный разбор даты (CSV/Parquet часто приходят уже с типом timestamp)
+    if not pd.api.types.is_datetime64_dtype(df["Дата события"]):
+        df["Дата события"] = df["Дата события"].apply(smart_parse_date)
     df = df.dropna(subset=["Дата события"])
-    df["Рабочий_день"] = df["Дата события"].apply(work_day)
 
-    df["Вход_n"] = df["Вход"].apply(norm)
-    df["Выход_n"] = df["Выход"].apply(norm)
+    # рабочий кадр: только нужные дальше колонки в компактных типах —
+    # ФИО и двери категориями, время datetime64[ns], рабочий день номером дня (int32)
+    fio = df["ФИО"].astype("category")
+    door_in = df["Вход"].astype("category")
+    door_out = df["Выход"].astype("category")
     bad_both = (
-        df["Вход_n"].str.contains("неконтролируем", na=False)
-        & df["Выход_n"].str.contains("неконтролируем", na=False)
+        _uncontrolled(door_in.cat.categories)[door_in.cat.codes]
+        & _uncontrolled(door_out.cat.categories)[door_out.cat.codes]
+    )
+    nonperson = np.array([is_nonperson(u) for u in fio.cat.categories], dtype=bool)[fio.cat.codes]
+    keep = ~(bad_both | nonperson)
+
+    t = df["Дата события"].to_numpy(dtype="datetime64[ns]")[keep]
+    return pd.DataFrame(
+        {
+            "ФИО": fio[keep].cat.remove_unused_categories(),
+            "Дата события": t,
+            "Рабочий_день": _work_day_ord(t.view(np.int64)),
+            "Вход": door_in[keep].cat.remove_unused_categories(),
+            "Выход": door_out[keep].cat.remove_unused_categories(),
+        },
+        index=df.index[keep],
     )
-    df = df[~bad_both].copy()
 
-    df = df[~df["ФИО"].apply(is_nonperson)].copy()
 
-    # ✅ 2) ОДНА сортировка на весь пайплайн (ускоряет)
-    df = df.sort_values(["ФИО", "Рабочий_день", "Дата события"]).reset_index(drop=True)
-    
-    return df
+def _uncontrolled(doors) -> np.ndarray:
+    """Признак «неконтролируемая» зона для уникальных названий дверей (-1 = пусто -> False)."""
+    return np.append(
+        np.array(["неконтролируем" in norm(d) for d in doors], dtype=bool), False
+    )
 
 # ===================== ЧТЕНИЕ КАДРОВОГО ФАЙЛА =====================
 
-def read_kadry(file_obj) -> pd.DataFrame:
+def read_kadry(file_obj, backend=None) -> pd.DataFrame:
     """
     Читаем кадровый файл и разворачиваем интервалы в посуточный список.
+    Excel (.xls/.xlsx), CSV или Parquet — формат определяем по содержимому.
     Ожидаем колонки: 'Сотрудник', 'Вид отсутствия', 'с', 'до'.
+    backend — движок чтения Excel (EXCEL_BACKENDS), по умолчанию выбирается по формату.
     """
     # обязательно в начало файла
-    try:
-        file_obj.seek(0)
-    except Exception:
-        pass
-
-    # 1) пробуем .xls через xlrd, если не вышло — обычный read_excel (xlsx)
-    try:
-        kadry = pd.read_excel(file_obj, header=None, engine="xlrd")
-    except Exception:
-        try:
-            file_obj.seek(0)
-        except Exception:
-            pass
-        kadry = pd.read_excel(file_obj, header=None)
+    content = _read_file_bytes(file_obj)
+    fmt = sniff_format(content)
+
+    # 1) Parquet / CSV — сразу с заголовками
+    cols = ["Сотрудник", "Вид отсутствия", "с", "до"]
+    if fmt == "parquet":
+        kadry = _read_parquet(content, columns=cols)
+    elif fmt == "csv":
+        kadry = _read_csv_arrow(content, _csv_header_row(content, "Сотрудник"), text_columns=cols)
+    else:
+        kadry = pd.read_excel(_content_source(content), header=None, engine=excel_backend(fmt, backend))
 
-    # 2) ищем строку заголовков (где есть "Сотрудник")
-    def _is_sotr_cell(x):
-        s = "" if pd.isna(x) else str(x)
-        return s.strip().casefold() == "сотрудник"
+        # 2) ищем строку заголовков (где есть "Сотрудник")
+        def _is_sotr_cell(x):
+            s = "" if pd.isna(x) else str(x)
+            return s.strip().casefold() == "сотрудник"
 
-    mask_rows = kadry.apply(lambda row: row.map(_is_sotr_cell).any(), axis=1)
-    idxs = kadry.index[mask_rows]
-    if len(idxs) == 0:
-        raise RuntimeError("Не удалось найти строку с заголовком 'Сотрудник' в кадровом файле.")
+        mask_rows = kadry.apply(lambda row: row.map(_is_sotr_cell).any(), axis=1)
+        idxs = kadry.index[mask_rows]
+        if len(idxs) == 0:
+            raise RuntimeError("Не удалось найти строку с заголовком 'Сотрудник' в кадровом файле.")
 
-    hdr_row = idxs[0]
-    kadry.columns = kadry.iloc[hdr_row]
-    kadry = kadry.iloc[hdr_row + 1 :].copy()
+        hdr_row = idxs[0]
+        kadry.columns = kadry.iloc[hdr_row]
+        kadry = kadry.iloc[hdr_row + 1 :].copy()
 
     # 3) чистим имена колонок (иногда там пробелы/неразрывные)
     kadry.columns = [
@@ -303,19 +673,21 @@ def read_kadry(file_obj) -> pd.DataFrame:
 
     # умный разбор дат
     for col in ["Дата_с", "Дата_по"]:
-        kadry[col] = kadry[col].apply(smart_parse_date)
+        kadry[col] = pd.to_datetime(kadry[col].apply(smart_parse_date))
 
     kadry["Дата_по"] = kadry["Дата_по"].fillna(kadry["Дата_с"])
-
-    rows = []
-    for _, r in kadry.iterrows():
-        d1, d2 = r["Дата_с"], r["Дата_по"]
-        if pd.isna(d1) or pd.isna(d2):
-            continue
-        for d in pd.date_range(d1, d2, freq="D"):
-            rows.append({"ФИО": r["ФИО"], "Дата": d.date(), "Тип": r["Тип"]})
-
-    kadry_dates = pd.DataFrame(rows)
+    kadry = kadry.dropna(subset=["Дата_с", "Дата_по"])
+
+    # разворачиваем диапазоны в посуточный список (дни с..по, как pd.date_range);
+    # «Дата» — полночь дня в datetime64, как в посуточном отчёте
+    n_days = np.clip((kadry["Дата_по"] - kadry["Дата_с"]) // pd.Timedelta(days=1) + 1, 0, None).to_numpy()
+    rep = kadry.iloc[np.repeat(np.arange(len(kadry)), n_days)]
+    step = np.arange(len(rep)) - np.repeat(np.cumsum(n_days) - n_days, n_days)
+    kadry_dates = pd.DataFrame({
+        "ФИО": rep["ФИО"].to_numpy(),
+        "Дата": (rep["Дата_с"] + pd.to_timedelta(step, unit="D")).dt.normalize().to_numpy(),
+        "Тип": rep["Тип"].to_numpy(),
+    })
 
     if kadry_dates.empty:
         return kadry_dates
@@ -333,66 +705,293 @@ def read_kadry(file_obj) -> pd.DataFrame:
     
     return kadry_dates
 
-# === Время внутри офиса и длинный разрыв вне офиса ===
+# === Посуточные таймлайны ===
 
-def inside_minutes_between(
-    grp: pd.DataFrame,
-    right_col: str,
-    a: pd.Timestamp,
-    b: pd.Timestamp,
-) -> int:
+_NS_MIN = 60 * 10**9
+_NS_HOUR = 60 * _NS_MIN
+_NS_DAY = 24 * _NS_HOUR
+_NAT = np.iinfo(np.int64).min   # NaT в int64-представлении
+
+
+def _secs(d: int) -> float:
+    """Разница в нс -> секунды ровно как Timedelta.total_seconds() (важно для округлений)."""
+    days, rem = divmod(d // 1000, 86_400_000_000)
+    s, us = divmod(rem, 1_000_000)
+    return days * 86400 + s + us / 1e6
+
+
+def _day_floor(ts: int, day_start_ns: int) -> int:
+    """Начало рабочих суток (в нс), в которые попадает момент ts."""
+    return (ts - day_start_ns) // _NS_DAY * _NS_DAY + day_start_ns
+
+
+def _to_ns(values) -> np.ndarray:
+    if getattr(values, "dtype", None) == np.dtype("datetime64[ns]"):
+        # рабочий кадр журнала: время уже datetime64[ns] — без повторного разбора
+        return np.asarray(values).view(np.int64)
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _work_day_ord(t_ns, day_start_h=DAY_START_H) -> np.ndarray:
+    """Время событий (нс) -> рабочий день номером дня от 1970-01-01 (int32), как work_day."""
+    t_ns = np.asarray(t_ns, dtype=np.int64)
+    return ((t_ns - day_start_h * _NS_HOUR) // _NS_DAY).astype(np.int32)
+
+
+def _day_ord(values) -> np.ndarray:
+    """Рабочие дни (номера дней или даты) -> номер дня от 1970-01-01 (int64)."""
+    values = np.asarray(values)
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64)
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def _fio_codes(fio: pd.Series) -> np.ndarray:
     """
-    Сколько минут сотрудник был ВНУТРИ офиса в окне [a, b].
-    Основано на направлениях (офис/шлюз).
+    ФИО -> плотные int-коды в порядке имён (как sort_values по строкам; пустые — в конце).
+    У рабочего кадра журнала это уже готовые коды категорий: категории отсортированы.
     """
-    if grp is None or grp.empty or a >= b:
-        return 0
+    if isinstance(fio.dtype, pd.CategoricalDtype) and fio.cat.categories.is_monotonic_increasing:
+        codes = fio.cat.codes.to_numpy()
+        n = len(fio.cat.categories)
+    else:
+        codes, uniques = pd.factorize(fio, sort=True)
+        n = len(uniques)
+    return np.where(codes < 0, n, codes).astype(np.int32)
 
-    g = grp.sort_values("Дата события")[["Дата события", right_col]].copy()
-    g["dest_n"] = g[right_col].map(norm)
 
-    start_look = a - pd.Timedelta(hours=6)
-    sec = g[(g["Дата события"] >= start_look) & (g["Дата события"] <= b)].copy()
-    sec["label"] = sec["dest_n"].apply(
-        lambda s: "in" if any(h in s for h in INSIDE_HINTS) else ("out" if any(h in s for h in OUTSIDE_HINTS) else None)
-    )
-    sec = sec.dropna(subset=["label"]).reset_index(drop=True)
-
-    # состояние на момент a
-    inside = init_inside_at(a, grp, right_col)
-
-    # дедуп одинаковых подряд меток
-    ded = []
-    for _, row in sec.iterrows():
-        t, lab = row["Дата события"], row["label"]
-        if ded:
-            t_prev, lab_prev = ded[-1]
-            if lab == lab_prev and (t - t_prev).total_seconds() / 60.0 <= DEDUP_WINDOW_MIN:
+def _journal_order(df: pd.DataFrame) -> np.ndarray:
+    """
+    Перестановка строк журнала по (ФИО, Рабочий_день, Дата события), как стабильная
+    сортировка по трём колонкам, но одним argsort по целому ключу:
+    (код ФИО, день) × n + ранг времени. Ключи уникальны, так что порядок однозначен.
+    """
+    t = _to_ns(df["Дата события"])
+    day = _day_ord(df["Рабочий_день"])
+    fio = _fio_codes(df["ФИО"]).astype(np.int64)
+    n = len(t)
+    if not n:
+        return np.zeros(0, dtype=np.intp)
+    day = day - day.min()
+    group = fio * (int(day.max()) + 1) + day
+    if (int(group.max()) + 1) * n >= 2**62:
+        # ключ не помещается в int64 — сортировка по трём ключам
+        return np.lexsort((t, day, fio))
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(t, kind="stable")] = np.arange(n)   # выгрузка обычно уже по времени — это быстро
+    return np.argsort(group * n + rank)
+
+
+class Timeline:
+    """
+    События журнала в виде плоских массивов, сгруппированных по (ФИО, Рабочий_день):
+    группа i — это срез t/lab[offsets[i]:offsets[i+1]].
+    Строится один раз на журнал и переиспользуется всеми политиками.
+    """
+
+    def __init__(self, df: pd.DataFrame, lab):
+        n = len(df)
+        fio = df["ФИО"]
+        # сравниваем целые коды ФИО, строки берём только для начал групп
+        if isinstance(fio.dtype, pd.CategoricalDtype):
+            fio_key, fio_names = fio.cat.codes.to_numpy(), fio.cat.categories
+        else:
+            fio_key, fio_names = pd.factorize(fio)
+        fio_names = np.append(np.asarray(fio_names, dtype=object), None)
+        day = _day_ord(df["Рабочий_день"])
+        if n:
+            brk = np.flatnonzero((fio_key[1:] != fio_key[:-1]) | (day[1:] != day[:-1])) + 1
+            starts = np.concatenate(([0], brk))
+        else:
+            starts = np.zeros(0, dtype=np.int64)
+        self.offsets = np.append(starts, n).astype(np.int64)
+        self.fio_code = fio_key[starts]
+        self.fio = fio_names[self.fio_code]
+        # рабочие сутки — полночь даты (datetime64[ns]): так их держит весь пайплайн
+        self.day = day[starts].astype("datetime64[D]").astype("datetime64[ns]")
+        self.day_ns = day[starts] * _NS_DAY
+        self.t = _to_ns(df["Дата события"]) if n else np.zeros(0, dtype=np.int64)
+        self.lab = np.asarray(lab, dtype=np.int8)
+        # индекс последнего размеченного события на позиции i или раньше в той же группе (-1 — нет)
+        marked = np.where(self.lab != LAB_NONE, np.arange(n), -1)
+        last = np.maximum.accumulate(marked) if n else marked
+        self.last_lab = np.where(last >= np.repeat(starts, np.diff(self.offsets)), last, -1)
+
+    def __len__(self):
+        return len(self.fio)
+
+    def inside_at(self, at, lower) -> np.ndarray:
+        """
+        Состояние «внутри» каждой группы на момент at[i] по последней понятной метке
+        в [lower[i], at[i]] — векторный _inside_at для всех групп сразу.
+        Позиция момента в группе — число её событий не позже at[i] (время в группе
+        отсортировано), метка — через last_lab, без прохода по событиям назад.
+        """
+        if not len(self):
+            return np.zeros(0, dtype=bool)
+        starts = self.offsets[:-1]
+        before = self.t <= np.repeat(np.asarray(at, dtype=np.int64), np.diff(self.offsets))
+        pos = starts + np.add.reduceat(before.astype(np.int64), starts) - 1
+        k = np.where(pos >= starts, self.last_lab[np.maximum(pos, 0)], -1)
+        hit = k >= 0
+        k = np.maximum(k, 0)
+        return hit & (self.t[k] >= lower) & (self.lab[k] == LAB_IN)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, right_col=None):
+        """Таймлайн из произвольного журнала (сортирует, метки по right_col)."""
+        df = df.iloc[_journal_order(df)]
+        if right_col is None:
+            return cls(df, np.zeros(len(df), dtype=np.int8))
+        return cls(df, label_series(df[right_col]))
+
+
+def _group_arrays(grp: pd.DataFrame, right_col: str):
+    """Время (нс) и метки группы по возрастанию времени; группы журнала уже отсортированы — не пересортировываем."""
+    g = grp if grp["Дата события"].is_monotonic_increasing else grp.sort_values("Дата события", kind="stable")
+    return _to_ns(g["Дата события"]).tolist(), label_series(g[right_col]).tolist()
+
+
+def _inside_at(tt, ll, a: int, lower: int) -> bool:
+    """
+    Состояние на момент a по последней понятной метке в [lower, a] (tt отсортирован).
+    Для одной группы; в day_metrics — векторный Timeline.inside_at.
+    """
+    for i in range(bisect.bisect_right(tt, a) - 1, -1, -1):
+        t = tt[i]
+        if t < lower:
+            break
+        if ll[i]:
+            return ll[i] == LAB_IN
+    return False
+
+
+def _dedup(tt, ll, lo: int, hi: int, dedup_min) -> list:
+    """Понятные события окна [lo, hi] без дрожания: [(t, is_in), ...]."""
+    res = []
+    for t, lab in zip(tt, ll):
+        if t < lo or t > hi or not lab:
+            continue
+        is_in = lab != LAB_OUT
+        if res:
+            t_prev, in_prev = res[-1]
+            if is_in == in_prev and _secs(t - t_prev) / 60.0 <= dedup_min:
                 continue
-        ded.append((t, lab))
+        res.append((t, is_in))
+    return res
+
 
+def _inside_minutes(tt, ll, a: int, b: int, dedup_min, inside: bool) -> int:
+    """Минуты внутри в окне [a, b]; inside — состояние на момент a."""
     mins = 0.0
     last_t = a
-    for t, lab in ded:
+    for t, is_in in _dedup(tt, ll, a - 6 * _NS_HOUR, b, dedup_min):
         t_clamp = min(max(t, a), b)
         if inside:
-            mins += max(0.0, (t_clamp - last_t).total_seconds() / 60.0)
-        inside = lab == "in"
+            mins += max(0.0, _secs(t_clamp - last_t) / 60.0)
+        inside = is_in
         last_t = t_clamp
         if last_t >= b:
             break
 
     if last_t < b and inside:
-        mins += (b - last_t).total_seconds() / 60.0
+        mins += _secs(b - last_t) / 60.0
 
     return int(round(mins))
 
 
+def _longest_gap(tt, ll, a: int, b: int, dedup_min, inside: bool):
+    """Самый длинный разрыв вне офиса в окне [a, b]; inside — состояние на момент a."""
+    outside = not inside
+
+    best = 0.0
+    best_a = None
+    best_b = None
+    last_t = a
+    for t, is_in in _dedup(tt, ll, a - 6 * _NS_HOUR, b, dedup_min):
+        t_clamp = min(max(t, a), b)
+        if outside:
+            gap = max(0.0, _secs(t_clamp - last_t) / 60.0)
+            if gap > best:
+                best, best_a, best_b = gap, last_t, t_clamp
+        outside = not is_in
+        last_t = t_clamp
+        if last_t >= b:
+            break
+
+    if last_t < b and outside:
+        gap = _secs(b - last_t) / 60.0
+        if gap > best:
+            best, best_a, best_b = gap, last_t, b
+
+    return int(round(best)), best_a, best_b
+
+
+def _exits_and_suspect(tt, ll, a: int, b: int, inside: bool, policy: "Policy"):
+    # inside — стартовое состояние на начало ядра (объективно)
+    ded = _dedup(tt, ll, a, b, policy.dedup_window_min)
+
+    # --- СЧЁТ ВЫХОДОВ (как количество периодов "out" >= EXIT_MIN_DURATION) ---
+    exits = 0
+    # если на начало ядра уже "снаружи" — период out начался раньше
+    cur_out_start = None if inside else a
+    for t, is_in in ded:
+        if inside:
+            if not is_in:
+                inside = False
+                cur_out_start = t
+        elif is_in:
+            # закрываем период out
+            if cur_out_start is not None and _secs(t - cur_out_start) / 60.0 >= policy.exit_min_duration:
+                exits += 1
+            inside = True
+            cur_out_start = None
+
+    # если период out тянется до конца ядра
+    if not inside and cur_out_start is not None:
+        if _secs(b - cur_out_start) / 60.0 >= policy.exit_min_duration:
+            exits += 1
+
+    # --- SUSPECT: два одинаковых подряд с gap > SUSPECT_GAP_MIN ---
+    suspect = False
+    for (t0, in0), (t1, in1) in zip(ded, ded[1:]):
+        if in0 == in1 and _secs(t1 - t0) / 60.0 > policy.suspect_gap_min:
+            suspect = True
+            break
+
+    return exits, suspect
+
+
+# === Время внутри офиса и длинный разрыв вне офиса ===
+
+def inside_minutes_between(
+    grp: pd.DataFrame,
+    right_col: str,
+    a: pd.Timestamp,
+    b: pd.Timestamp,
+    policy=None,
+) -> int:
+    """
+    Сколько минут сотрудник был ВНУТРИ офиса в окне [a, b].
+    Основано на направлениях (офис/шлюз).
+    """
+    if grp is None or grp.empty or a >= b:
+        return 0
+    policy = policy or DEFAULT_POLICY
+    tt, ll = _group_arrays(grp, right_col)
+    a, b = pd.Timestamp(a).value, pd.Timestamp(b).value
+    inside = _inside_at(tt, ll, a, _day_floor(a, policy.day_start_h * _NS_HOUR))
+    return _inside_minutes(tt, ll, a, b, policy.dedup_window_min, inside)
+
+
 def longest_outside_gap_between(
     grp: pd.DataFrame,
     right_col: str,
     a: pd.Timestamp,
     b: pd.Timestamp,
+    policy=None,
 ):
     """
     Самый длинный непрерывный интервал 'вне офиса' в окне [a,b].
@@ -400,169 +999,421 @@ def longest_outside_gap_between(
     """
     if grp is None or grp.empty or a >= b:
         return 0, None, None
+    policy = policy or DEFAULT_POLICY
+    tt, ll = _group_arrays(grp, right_col)
+    a, b = pd.Timestamp(a).value, pd.Timestamp(b).value
+    inside = _inside_at(tt, ll, a, _day_floor(a, policy.day_start_h * _NS_HOUR))
+    gap, g_a, g_b = _longest_gap(tt, ll, a, b, policy.dedup_window_min, inside)
+    return (
+        gap,
+        pd.Timestamp(g_a) if g_a is not None else None,
+        pd.Timestamp(g_b) if g_b is not None else None,
+    )
 
-    g = grp.sort_values("Дата события")[["Дата события", right_col]].copy()
-    g["dest_n"] = g[right_col].map(norm)
+# === Компилированное ядро посуточного расчёта (Numba, необязательно) ===
+# Тот же расчёт, что _inside_minutes / _longest_gap / _exits_and_suspect, но
+# одним проходом по плоским массивам таймлайна: на каждую группу — минуты
+# внутри, самый длинный разрыв с концами, выходы и suspect. Дедупликация идёт
+# потоком (два окна — ядро, обрезанное сутками, и ядро целиком — параллельно).
+# Numba — необязательная зависимость: без неё считает цикл на Python.
+# Компиляция и загрузка ядра стоят времени, поэтому на маленьких журналах
+# (меньше NUMBA_MIN_EVENTS событий) по умолчанию тоже считает Python.
+
+DAY_KERNELS = ("numba", "python")
+DAY_KERNEL = os.environ.get("UMNYI_OTCHET_KERNEL") or None
+NUMBA_MIN_EVENTS = 200_000
+_KERNEL_CHUNK = 1 << 14   # групп за вызов ядра — между вызовами сообщаем прогресс
+
+_NUMBA_KERNEL = None
+
+
+def _secs_nb(d):
+    # _secs для ядра: те же целочисленные шаги, чтобы округления совпадали
+    us_all = d // 1000
+    days = us_all // 86_400_000_000
+    rem = us_all - days * 86_400_000_000
+    s = rem // 1_000_000
+    us = rem - s * 1_000_000
+    return days * 86400 + s + us / 1e6
+
+
+def _day_kernel(
+    t, lab, offsets, g0, g1, a, b, in_a, core_a, core_b, in_core,
+    dedup_min, exit_min, suspect_min, long_gap_min, pre_ns,
+    out_core, gap_a, gap_b, exits, suspect,
+):
+    """Группы g0..g1-1 таймлайна; результаты пишутся в out_core/gap_a/gap_b/exits/suspect."""
+    for i in range(g0, g1):
+        lo = offsets[i]
+        hi = offsets[i + 1]
+        a_i = a[i]
+        b_i = b[i]
+        ca = core_a[i]
+        cb = core_b[i]
+
+        # окно 1: [a, b] — минуты внутри и длинный разрыв; дедуп с a - pre_ns
+        win = a_i < b_i
+        w_lo = a_i - pre_ns
+        inside = in_a[i]
+        last = a_i
+        mins = 0.0
+        best = 0.0
+        best_a = _NAT
+        best_b = _NAT
+        done = not win
+        k1 = False
+        k1_t = 0
+        k1_in = False
+
+        # окно 2: ядро [core_a, core_b] — выходы и suspect
+        inside2 = in_core[i]
+        has_out = not inside2
+        out_start = ca
+        n_exits = 0
+        susp = False
+        k2 = False
+        k2_t = 0
+        k2_in = False
+
+        for j in range(lo, hi):
+            lj = lab[j]
+            if lj == LAB_NONE:
+                continue
+            tj = t[j]
+            is_in = lj != LAB_OUT
+
+            if not done and tj >= w_lo and tj <= b_i:
+                if not (k1 and is_in == k1_in and _secs_nb(tj - k1_t) / 60.0 <= dedup_min):
+                    k1 = True
+                    k1_t = tj
+                    k1_in = is_in
+                    tc = min(max(tj, a_i), b_i)
+                    if inside:
+                        mins += max(0.0, _secs_nb(tc - last) / 60.0)
+                    else:
+                        gap = max(0.0, _secs_nb(tc - last) / 60.0)
+                        if gap > best:
+                            best = gap
+                            best_a = last
+                            best_b = tc
+                    inside = is_in
+                    last = tc
+                    if last >= b_i:
+                        done = True
+
+            if tj >= ca and tj <= cb:
+                if not (k2 and is_in == k2_in and _secs_nb(tj - k2_t) / 60.0 <= dedup_min):
+                    if k2 and is_in == k2_in and _secs_nb(tj - k2_t) / 60.0 > suspect_min:
+                        susp = True
+                    k2 = True
+                    k2_t = tj
+                    k2_in = is_in
+                    if inside2:
+                        if not is_in:
+                            inside2 = False
+                            has_out = True
+                            out_start = tj
+                    elif is_in:
+                        if has_out and _secs_nb(tj - out_start) / 60.0 >= exit_min:
+                            n_exits += 1
+                        inside2 = True
+                        has_out = False
+
+        if win:
+            if last < b_i:
+                if inside:
+                    mins += _secs_nb(b_i - last) / 60.0
+                else:
+                    gap = _secs_nb(b_i - last) / 60.0
+                    if gap > best:
+                        best = gap
+                        best_a = last
+                        best_b = b_i
+            out_core[i] = round(max(0.0, _secs_nb(b_i - a_i) / 60.0 - round(mins)))
+            gap_min = round(best)
+            if gap_min > 0 and gap_min >= long_gap_min and best_a != _NAT:
+                gap_a[i] = best_a
+                gap_b[i] = best_b
+
+        if not inside2 and has_out and _secs_nb(cb - out_start) / 60.0 >= exit_min:
+            n_exits += 1
+        exits[i] = n_exits
+        suspect[i] = susp
+
+
+def day_kernel(kernel=None, n_events=None) -> str:
+    """
+    Ядро посуточного расчёта: заданное (DAY_KERNELS) или по умолчанию —
+    numba, если пакет установлен и журнал не меньше NUMBA_MIN_EVENTS событий.
+    """
+    kernel = kernel or DAY_KERNEL
+    if kernel is not None:
+        if kernel not in DAY_KERNELS:
+            raise RuntimeError(f"Неизвестное ядро расчёта: {kernel}. Доступны: {list(DAY_KERNELS)}.")
+        if kernel == "numba" and not _installed("numba"):
+            raise RuntimeError("Для ядра numba нужен пакет numba (pip install numba).")
+        return kernel
+    if n_events is not None and n_events < NUMBA_MIN_EVENTS:
+        return "python"
+    return "numba" if _installed("numba") else "python"
+
+
+def _numba_kernel():
+    global _NUMBA_KERNEL
+    if _NUMBA_KERNEL is None:
+        import numba
+
+        global _secs_nb
+        # cache=True — скомпилированное ядро хранится рядом с модулем и не собирается заново
+        _secs_nb = numba.njit(cache=True)(_secs_nb)
+        _NUMBA_KERNEL = numba.njit(cache=True)(_day_kernel)
+    return _NUMBA_KERNEL
+
+
+# === Прогресс расчёта ===
+# Колбэк progress(stage, done, total): stage — название этапа, done/total —
+# сотрудники, уже посчитанные / всего (0, 0 — этап без счётчика).
+# Смена этапа сообщается всегда, счётчик внутри этапа — не чаще раза в
+# PROGRESS_EVERY_S секунд; часы проверяются раз в 128 групп.
+
+PROGRESS_EVERY_S = 0.5
+_PROGRESS_CHECK_MASK = 127
+
+# этапы build_report и их доля в общем ходе — для полосы прогресса
+PROGRESS_STAGES = [
+    ("Чтение журнала", 0.30),
+    ("Разметка дверей", 0.05),
+    ("Кадровый файл", 0.05),
+    ("Расчёт по сотрудникам", 0.50),
+    ("Сборка отчёта", 0.10),
+]
 
-    start_look = a - pd.Timedelta(hours=6)
-    sec = g[(g["Дата события"] >= start_look) & (g["Дата события"] <= b)].copy()
-    sec["label"] = sec["dest_n"].apply(
-        lambda s: "in" if any(x in s for x in INSIDE_HINTS) else ("out" if any(x in s for x in OUTSIDE_HINTS) else None)
-    )
-    sec = sec.dropna(subset=["label"]).reset_index(drop=True)
 
-    # состояние на момент a
-    outside = not init_inside_at(a, grp, right_col)
+def progress_fraction(stage: str, done=0, total=0) -> float:
+    """Доля выполнения 0..1 по этапу и счётчику внутри него."""
+    before = 0.0
+    for name, share in PROGRESS_STAGES:
+        if name == stage:
+            return min(1.0, before + share * (done / total if total else 0.0))
+        before += share
+    return 0.0
 
-    ded = []
-    for _, row in sec.iterrows():
-        t, lab = row["Дата события"], row["label"]
-        if ded:
-            t_prev, lab_prev = ded[-1]
-            if lab == lab_prev and (t - t_prev).total_seconds() / 60.0 <= DEDUP_WINDOW_MIN:
-                continue
-        ded.append((t, lab))
 
-    best = 0.0
-    best_a = None
-    best_b = None
-    last_t = a
+class _Progress:
+    def __init__(self, callback):
+        self.callback = callback
+        self.stage_name = None
+        self._next = 0.0
 
-    for t, lab in ded:
-        t_clamp = min(max(t, a), b)
-        if outside:
-            gap = max(0.0, (t_clamp - last_t).total_seconds() / 60.0)
-            if gap > best:
-                best, best_a, best_b = gap, last_t, t_clamp
-        outside = lab == "out"
-        last_t = t_clamp
-        if last_t >= b:
-            break
+    def stage(self, name):
+        self.stage_name = name
+        self._next = time.monotonic() + PROGRESS_EVERY_S
+        self.callback(name, 0, 0)
 
-    if last_t < b and outside:
-        gap = (b - last_t).total_seconds() / 60.0
-        if gap > best:
-            best, best_a, best_b = gap, last_t, b
+    def tick(self, done, total, force=False):
+        now = time.monotonic()
+        if force or now >= self._next:
+            self._next = now + PROGRESS_EVERY_S
+            self.callback(self.stage_name, done, total)
 
-    return int(round(best)), best_a, best_b
 
-def _fmt_leave(ts):
-    if pd.isna(ts):
-        return ""
-    s = ts.strftime("%H:%M")
-    if ts.hour < 6:
-        s += f" ({ts.strftime('%d.%m')})"
-    return s
+def _as_progress(progress):
+    if progress is None or isinstance(progress, _Progress):
+        return progress
+    return _Progress(progress)
+
 
-def compute_outside_table(df: pd.DataFrame, right_col: str) -> pd.DataFrame:
+def _day_windows(tl: Timeline, policy, schedule=None):
     """
-    Таблица «Вне офиса» по каждому (ФИО, Рабочий_день).
-    right_col = 'Вход' или 'Выход' — по какой колонке считать направления.
+    Для каждой группы таймлайна (нс): начало и конец рабочих суток,
+    окно ядра и порог опоздания. По умолчанию — из политики,
+    для сотрудников со сменой в графике — из смены.
     """
-    rows = []
-
-    for (fio, day), grp in df.groupby(["ФИО", "Рабочий_день"], sort=False):
-        base = pd.Timestamp(day).normalize()
-        start0600 = base + pd.Timedelta(hours=6)
-        end0600 = start0600 + pd.Timedelta(days=1)
+    base = tl.day_ns
+    core_a_off = policy.core_start_h * _NS_HOUR + policy.core_start_m * _NS_MIN
+    core_b_off = policy.core_end_h * _NS_HOUR + policy.core_end_m * _NS_MIN
+    late_off = policy.late_h * _NS_HOUR + policy.late_m * _NS_MIN
+
+    start = base + policy.day_start_h * _NS_HOUR
+    end = start + _NS_DAY
+    core_a = base + core_a_off
+    core_b = base + core_b_off
+    late = base + late_off
+
+    if schedule is not None and len(tl):
+        has, s_min, e_min, b_cur, b_next = schedule.day_windows(
+            tl.fio, base // _NS_DAY, policy.day_start_h
+        )
+        start = base + b_cur * _NS_MIN
+        end = base + _NS_DAY + b_next * _NS_MIN
+        shift_a = base + s_min * _NS_MIN
+        core_a = np.where(has, shift_a, core_a)
+        core_b = np.where(has, base + e_min * _NS_MIN, core_b)
+        # порог опоздания сдвигается вместе с началом смены (по умолчанию +1 мин)
+        late = np.where(has, shift_a + (late_off - core_a_off), late)
 
-        first = grp["Дата события"].min()
-        last = grp["Дата события"].max()
+    return start, end, core_a, core_b, late
 
-        # окно ядра 09–18
-        a = base + pd.Timedelta(hours=CORE_START_H, minutes=CORE_START_M)
-        b = base + pd.Timedelta(hours=CORE_END_H,   minutes=CORE_END_M)
-        a = max(a, start0600)
-        b = min(b, end0600)
 
-        if a >= b:
-            out_core_min = 0
-            gap_period = ""
-        else:
-            total_core = (b - a).total_seconds() / 60.0
-            in_core = inside_minutes_between(grp, right_col, a, b)
-            out_core_min = max(0.0, total_core - in_core)
-            gap_min, g_a, g_b = longest_outside_gap_between(grp, right_col, a, b)
-            gap_period = (
-                f"{g_a:%H:%M}–{g_b:%H:%M}"
-                if (gap_min and gap_min >= 120 and g_a and g_b)
-                else ""
+def day_metrics(tl: Timeline, policy=None, schedule=None, progress=None, kernel=None) -> pd.DataFrame:
+    """
+    Все посуточные показатели за один проход по таймлайну:
+    приход/уход, вне ядра, длинный разрыв, длительность, опоздание,
+    выходы, suspect и число событий.
+    schedule — график смен (shifts.ShiftSchedule) или None.
+    progress — колбэк прогресса (см. build_report): сотрудники готово / всего.
+    kernel — ядро расчёта ('numba'/'python', см. day_kernel), по умолчанию выбирается само.
+    """
+    policy = policy or DEFAULT_POLICY
+    progress = _as_progress(progress)
+    dedup = policy.dedup_window_min
+    start, end, core_a, core_b, late = _day_windows(tl, policy, schedule)
+
+    # окно ядра, обрезанное рабочими сутками
+    a = np.maximum(core_a, start)
+    b = np.minimum(core_b, end)
+    # стартовые состояния окон: последняя понятная метка не раньше начала суток,
+    # в которые попадает момент
+    inside_a = tl.inside_at(a, np.where(a >= start, start, start - _NS_DAY))
+    inside_core = tl.inside_at(core_a, np.where(core_a >= start, start, start - _NS_DAY))
+
+    n = len(tl)
+    out_core = np.zeros(n, dtype=np.int64)
+    gap_a = np.full(n, _NAT, dtype=np.int64)
+    gap_b = np.full(n, _NAT, dtype=np.int64)
+    exits = np.zeros(n, dtype=np.int64)
+    suspect = np.zeros(n, dtype=bool)
+
+    if progress is not None:
+        # номер сотрудника по группам: группы идут по ФИО, затем по дню
+        emp_no = np.cumsum(np.r_[n > 0, tl.fio_code[1:] != tl.fio_code[:-1]]).tolist() if n else []
+        n_emp = emp_no[-1] if n else 0
+
+    if day_kernel(kernel, len(tl.t)) == "numba":
+        run = _numba_kernel()
+        for g0 in range(0, n, _KERNEL_CHUNK):
+            if progress is not None:
+                progress.tick(emp_no[g0] - 1, n_emp)
+            run(
+                tl.t, tl.lab, tl.offsets, g0, min(g0 + _KERNEL_CHUNK, n),
+                a, b, inside_a, core_a, core_b, inside_core,
+                float(dedup), float(policy.exit_min_duration), float(policy.suspect_gap_min),
+                float(policy.long_gap_min), 6 * _NS_HOUR,
+                out_core, gap_a, gap_b, exits, suspect,
             )
+    else:
+        offsets = tl.offsets.tolist()
+        t_all, lab_all = tl.t, tl.lab
+        win = zip(a.tolist(), b.tolist(), inside_a.tolist(), core_a.tolist(), core_b.tolist(), inside_core.tolist())
+        for i, (a_i, b_i, in_a, a_core, b_core, in_core_a) in enumerate(win):
+            if progress is not None and not i & _PROGRESS_CHECK_MASK:
+                progress.tick(emp_no[i] - 1, n_emp)
+            lo, hi = offsets[i], offsets[i + 1]
+            tt = t_all[lo:hi].tolist()
+            ll = lab_all[lo:hi].tolist()
+
+            if a_i < b_i:
+                in_core = _inside_minutes(tt, ll, a_i, b_i, dedup, in_a)
+                out_core[i] = int(round(max(0.0, _secs(b_i - a_i) / 60.0 - in_core)))
+                gap_min, g_a, g_b = _longest_gap(tt, ll, a_i, b_i, dedup, in_a)
+                if gap_min and gap_min >= policy.long_gap_min and g_a is not None and g_b is not None:
+                    gap_a[i], gap_b[i] = g_a, g_b
+
+            exits[i], suspect[i] = _exits_and_suspect(tt, ll, a_core, b_core, in_core_a, policy)
+
+    if progress is not None:
+        progress.tick(n_emp, n_emp, force=True)
+
+    starts = tl.offsets[:-1]
+    first_ns = tl.t[starts] if n else np.zeros(0, dtype=np.int64)
+    last_ns = tl.t[tl.offsets[1:] - 1] if n else np.zeros(0, dtype=np.int64)
+    dur = np.array([int(_secs(d) / 60.0) for d in (last_ns - first_ns).tolist()], dtype=np.int64)
+
+    return pd.DataFrame(
+        {
+            "ФИО": tl.fio,
+            "Дата": tl.day,
+            "first_ts": pd.to_datetime(first_ns),
+            "last_ts": pd.to_datetime(last_ns),
+            "Вне_ядра_мин": out_core,
+            "gap_from": gap_a.view("datetime64[ns]"),
+            "gap_to": gap_b.view("datetime64[ns]"),
+            "Продолжительность_мин": np.maximum(dur, 0),
+            "late": first_ns > late,
+            "Выходы": exits,
+            "suspect": suspect,
+            "events_cnt": np.diff(tl.offsets),
+        }
+    )
 
-        rows.append(
-            {
-                "ФИО": fio,
-                "Дата": base.date(),
-                "Время прихода": first.strftime("%H:%M") if pd.notna(first) else "",
-                "Время ухода": _fmt_leave(last),
-                "Вне_ядра_мин": int(round(out_core_min)),
-                "Отсутствие более 2 часов подряд": gap_period,
-            }
-        )
 
-    res = pd.DataFrame(rows).sort_values(["ФИО", "Дата"])
-    res["Вне офиса"] = res["Вне_ядра_мин"].apply(lambda m: f"{m // 60}ч {m % 60}мин")
-    return res[
-        [
-            "ФИО",
-            "Дата",
-            "Время прихода",
-            "Время ухода",
-            "Вне офиса",
-            "Отсутствие более 2 часов подряд",
-            "Вне_ядра_мин",
-        ]
-    ]
+# === Форматирование для показа ===
+
+def _fmt_clock(ts: pd.Series) -> np.ndarray:
+    """datetime -> 'HH:MM' ('' для NaT)."""
+    return ts.dt.strftime("%H:%M").fillna("").to_numpy(dtype=object)
+
+
+def _fmt_leave(last: pd.Series, day: pd.Series) -> np.ndarray:
+    """Время ухода; уход после полуночи — с датой: '01:40 (25.11)'."""
+    leave = _fmt_clock(last)
+    next_day = last.dt.normalize().to_numpy() > np.asarray(day, dtype="datetime64[ns]")
+    if next_day.any():
+        leave[next_day] = leave[next_day] + " (" + last[next_day].dt.strftime("%d.%m").to_numpy(dtype=object) + ")"
+    return leave
+
+
+def _fmt_gap(gap_from: pd.Series, gap_to: pd.Series) -> np.ndarray:
+    """'HH:MM–HH:MM' для длинного отсутствия ('' если его нет)."""
+    res = np.full(len(gap_from), "", dtype=object)
+    has = gap_from.notna().to_numpy()
+    if has.any():
+        res[has] = _fmt_clock(gap_from[has]) + "–" + _fmt_clock(gap_to[has])
+    return res
+
+
+def compute_outside_table(df: pd.DataFrame, right_col: str, policy=None) -> pd.DataFrame:
+    """
+    Таблица «Вне офиса» по каждому (ФИО, Рабочий_день).
+    right_col = 'Вход' или 'Выход' — по какой колонке считать направления.
+    """
+    res = day_metrics(Timeline.from_frame(df, right_col), policy)
+    return pd.DataFrame(
+        {
+            "ФИО": res["ФИО"],
+            "Дата": res["Дата"],
+            "Время прихода": _fmt_clock(res["first_ts"]),
+            "Время ухода": _fmt_leave(res["last_ts"], res["Дата"]),
+            "Вне офиса": fmt_hm_array(res["Вне_ядра_мин"]),
+            "Отсутствие более 2 часов подряд": _fmt_gap(res["gap_from"], res["gap_to"]),
+            "Вне_ядра_мин": res["Вне_ядра_мин"],
+        }
+    )
 
 
 # --- Доп. логика: опоздания, длительность, выходы и suspect ---
 
-def _core_window_for_day(day):
+def _core_window_for_day(day, policy=None):
+    policy = policy or DEFAULT_POLICY
     base = pd.Timestamp(day).normalize()
-    a = base + pd.Timedelta(hours=CORE_START_H, minutes=CORE_START_M)
-    b = base + pd.Timedelta(hours=CORE_END_H, minutes=CORE_END_M)
+    a = base + pd.Timedelta(hours=policy.core_start_h, minutes=policy.core_start_m)
+    b = base + pd.Timedelta(hours=policy.core_end_h, minutes=policy.core_end_m)
     return a, b
 
 
-def _calc_group_stats(df: pd.DataFrame):
+def _calc_group_stats(df: pd.DataFrame, policy=None):
     """
     Для каждого (ФИО, Рабочий_день):
       - первый/последний проход
       - длительность
       - опоздание / вовремя
     """
-    rows = []
-    for (fio, day), grp in df.groupby(["ФИО", "Рабочий_день"], sort=False):
-        grp = grp.sort_values("Дата события")
-        first_ts = grp["Дата события"].min()
-        last_ts  = grp["Дата события"].max()
-        dur_min = int(
-            (last_ts - first_ts).total_seconds() / 60.0
-        ) if pd.notna(last_ts) and pd.notna(first_ts) else 0
-
-        # порог опоздания 09:01
-        plan_start = pd.Timestamp(day) + pd.Timedelta(hours=LATE_H, minutes=LATE_M)
-        late_min = (
-            first_ts - plan_start
-        ).total_seconds() / 60.0 if pd.notna(first_ts) else 0
-        status = "опоздание" if late_min > 0 else "вовремя"
-
-        rows.append(
-            {
-                "ФИО": fio,
-                "Дата": pd.to_datetime(day).date(),
-                "first_ts": first_ts,
-                "last_ts": last_ts,
-                "Продолжительность_мин": max(dur_min, 0),
-                "Опоздание": status,
-            }
-        )
-
-    st = pd.DataFrame(rows)
-    st["Общее время"] = st["Продолжительность_мин"].apply(fmt_hm)
-    return st
+    st = day_metrics(Timeline.from_frame(df), policy)
+    st["Опоздание"] = np.where(st["late"], "опоздание", "вовремя")
+    st["Общее время"] = fmt_hm_array(st["Продолжительность_мин"])
+    return st[["ФИО", "Дата", "first_ts", "last_ts", "Продолжительность_мин", "Опоздание", "Общее время"]]
 
-def _calc_exits_and_suspect(df: pd.DataFrame, right_col: str):
+def _calc_exits_and_suspect(df: pd.DataFrame, right_col: str, policy=None):
     """
     Для каждого дня:
       - количество выходов в ядре (09–18), считаем только выходы
@@ -570,93 +1421,9 @@ def _calc_exits_and_suspect(df: pd.DataFrame, right_col: str):
       - флаг 'suspect' (возможен проход вне терминала):
         два одинаковых подряд события (in->in или out->out) с разрывом > 60 минут
     """
-    SUSPECT_GAP_MIN = 60
-    rows = []
+    res = day_metrics(Timeline.from_frame(df, right_col), policy)
+    return res[["ФИО", "Дата", "Выходы", "suspect"]]
 
-    for (fio, day), grp in df.groupby(["ФИО", "Рабочий_день"], sort=False):
-        base = pd.Timestamp(day).normalize()
-        a_core, b_core = _core_window_for_day(base)
-
-        # стартовое состояние на 09:00 (объективно)
-        inside = init_inside_at(a_core, grp, right_col)  # True=в офисе, False=снаружи
-
-        g = grp.sort_values("Дата события")[["Дата события", right_col]].copy()
-        g["dest_n"] = g[right_col].map(norm)
-
-        # оставляем события в ядре, но для дедупа и логики используем их метки
-        sec = g[(g["Дата события"] >= a_core) & (g["Дата события"] <= b_core)].copy()
-        sec["lab"] = sec["dest_n"].apply(
-            lambda s: "in" if any(x in s for x in INSIDE_HINTS) else ("out" if any(x in s for x in OUTSIDE_HINTS) else None)
-        )
-        sec = sec.dropna(subset=["lab"]).reset_index(drop=True)
-
-        # дедуп дрожания
-        labels, times = [], []
-        for _, r in sec.iterrows():
-            lab = r["lab"]
-            t = r["Дата события"]
-        
-            if labels:
-                t_prev, lab_prev = times[-1], labels[-1]
-                gap = (t - t_prev).total_seconds() / 60.0
-        
-                # защита от дублей турникета
-                if lab == lab_prev and gap <= DEDUP_WINDOW_MIN:
-                    continue
-        
-            labels.append(lab)
-            times.append(t)
-
-        # --- СЧЁТ ВЫХОДОВ (как количество периодов "out" >= 5 минут) ---
-        exits = 0
-        cur_out_start = None
-
-        # если на 09:00 уже "снаружи" — период out начался раньше, считаем от 09:00
-        if not inside:
-            cur_out_start = a_core
-
-        for t, lab in zip(times, labels):
-            if inside:
-                if lab == "out":
-                    inside = False
-                    cur_out_start = t
-            else:
-                # сейчас снаружи
-                if lab == "in":
-                    # закрываем период out
-                    if cur_out_start is not None:
-                        dur = (t - cur_out_start).total_seconds() / 60.0
-                        if dur >= EXIT_MIN_DURATION:
-                            exits += 1
-                    inside = True
-                    cur_out_start = None
-                # lab == "out" -> продолжаем быть снаружи
-
-        # если период out тянется до конца ядра
-        if not inside and cur_out_start is not None:
-            dur = (b_core - cur_out_start).total_seconds() / 60.0
-            if dur >= EXIT_MIN_DURATION:
-                exits += 1
-
-        # --- SUSPECT (как в Colab): два одинаковых подряд с gap > 60 минут ---
-        suspect = False
-        for i in range(1, len(labels)):
-            if labels[i] == labels[i - 1]:
-                gap = (times[i] - times[i - 1]).total_seconds() / 60.0
-                if gap > SUSPECT_GAP_MIN:
-                    suspect = True
-                    break
-
-        rows.append(
-            {
-                "ФИО": fio,
-                "Дата": base.date(),
-                "Выходы": exits,
-                "suspect": suspect,
-            }
-        )
-
-    return pd.DataFrame(rows)
 
 # === Ключ для сопоставления ФИО (журнал ↔ кадры) ===
 def fio_match_key(s):
@@ -692,294 +1459,448 @@ def fio_short_key(s: str) -> str:
         ini += parts[2][0]
 
     return f"{fam}_{ini}"
-# ===================== ГЛАВНАЯ ФУНКЦИЯ ОТЧЁТА =====================
+# ===================== ПОДГОТОВКА ЖУРНАЛА (общая для всех политик) =====================
+
+class _LabelCache(dict):
+    """{колонка дверей: метки}; по колонке хранятся коды дверей, метки строк собираются лениво."""
+
+    def __init__(self, df, cols, doors=None):
+        super().__init__()
+        self.codes = {col: door_codes(df[col], doors) for col in cols}
+
+    def __missing__(self, col):
+        codes, table = self.codes[col]
+        lab = self[col] = table[codes]
+        return lab
 
-def build_report(journal_file, kadry_file=None) -> pd.DataFrame:
+
+class PreparedJournal:
     """
-    Главная функция: получает файл журнала и, при наличии, кадровый файл.
-    Возвращает готовый pandas.DataFrame для выгрузки в Excel.
+    Разобранный журнал + метки направлений по обеим колонкам.
+    Таймлайны по (колонка направлений, граница суток) строятся лениво и кэшируются,
+    поэтому несколько политик не перечитывают и не переразмечают журнал.
     """
-    # 1) читаем журнал
-    df = read_journal(journal_file)
 
-    kadry_dates = None
-    if kadry_file is not None:
-        kadry_dates = read_kadry(kadry_file)
+    def __init__(self, df: pd.DataFrame, labels=None, doors=None):
+        self.df = df
+        # метки строк собираются при первом обращении: обычно нужна только одна колонка
+        self.labels = _LabelCache(df, ("Вход", "Выход"), doors)
+        # "качество" меток: (распознано офис/шлюз, распознано офис)
+        self.scores = {col: door_scores(*codes) for col, codes in self.labels.codes.items()}
+        # готовые метки под другими именами (например, сведённые с нескольких площадок)
+        self.labels.update(labels or {})
+        self._timelines = {}
+
+    def __getstate__(self):
+        # в кэш этапов (pipeline) кладём журнал и метки; таймлайны строятся заново
+        state = self.__dict__.copy()
+        state["_timelines"] = {}
+        return state
+
+    def work_frame(self, day_start_h=DAY_START_H, schedule=None):
+        """
+        Журнал с рабочими днями под границу суток / график смен, в порядке таймлайна.
+        Возвращает (df, order): order — перестановка строк self.df (None, если не менялась).
+        """
+        df = self.df
+        if schedule is not None:
+            # рабочий день определяется сменами (ночные смены через границу суток)
+            wd = schedule.work_days(df["ФИО"].to_numpy(), _to_ns(df["Дата события"]), day_start_h)
+            df = df.assign(Рабочий_день=wd.astype(np.int32))
+        elif day_start_h != DAY_START_H:
+            # другая граница суток — пересчитываем рабочий день
+            df = df.assign(Рабочий_день=_work_day_ord(_to_ns(df["Дата события"]), day_start_h))
+        if df is self.df:
+            return df, None
+        order = _journal_order(df)
+        return df.iloc[order], order
+
+    def timeline(self, right_col: str, day_start_h=DAY_START_H, schedule=None) -> Timeline:
+        key = (right_col, day_start_h, id(schedule))
+        if key not in self._timelines:
+            df, order = self.work_frame(day_start_h, schedule)
+            lab = self.labels[right_col] if order is None else self.labels[right_col][order]
+            # держим ссылку на график, чтобы id(schedule) в ключе не переиспользовался
+            self._timelines[key] = (schedule, Timeline(df, lab))
+        return self._timelines[key][1]
+
+
+def prepare_journal(journal_file, doors=None) -> PreparedJournal:
+    return PreparedJournal(read_journal(journal_file), doors=doors)
+
+
+def _choose_right_col(prepared: PreparedJournal, policy, schedule=None) -> str:
+    """
+    Автоматически выбираем колонку для направлений ('Вход' или 'Выход')
+    по "качеству" меток: где больше распознано офис/шлюз.
+    """
+    def _total_outside(col):
+        t = day_metrics(prepared.timeline(col, policy.day_start_h, schedule), policy, schedule)
+        return t["Вне_ядра_мин"].sum()
+
+    return _pick_right_col(prepared.scores, _total_outside)
+
+
+def _pick_right_col(scores: dict, total_outside) -> str:
+    """
+    scores — {колонка: (распознано офис/шлюз, распознано офис)};
+    total_outside(col) — сумма «вне ядра» по колонке, считается только в страховочном случае.
+    """
+    score_in = scores["Вход"]
+    score_out = scores["Выход"]
 
-    # 2) автоматически выбираем колонку для направлений ('Вход' или 'Выход')
-    # Выбираем по "качеству" меток: где больше распознано офис/шлюз.
-    
-    def _score_col(col: str):
-        s = df[col].map(norm)
-        good = s.apply(lambda x: any(t in x for t in INSIDE_HINTS) or any(t in x for t in OUTSIDE_HINTS)).sum()
-        office = s.apply(lambda x: any(t in x for t in INSIDE_HINTS)).sum()
-        return int(good), int(office)
-    
-    score_in = _score_col("Вход")
-    score_out = _score_col("Выход")
-    
     # основное правило
     right_col = "Вход" if score_in >= score_out else "Выход"
-    
+
     # --- страховка, если меток слишком мало (СКУД пишет иначе) ---
     MIN_GOOD = 50  # можешь поставить 20/100 под свои объёмы
     if max(score_in[0], score_out[0]) < MIN_GOOD:
         # fallback на старую логику (как было)
-        def _total_outside(col):
-            t = compute_outside_table(df, col)
-            return pd.to_numeric(t["Вне_ядра_мин"], errors="coerce").fillna(0).sum()
-    
-        sum_exit = _total_outside("Выход")
-        sum_entry = _total_outside("Вход")
+        sum_exit = total_outside("Выход")
+        sum_entry = total_outside("Вход")
         right_col = "Вход" if sum_entry <= sum_exit else "Выход"
 
-    # 3) таблица "Вне офиса"
-    out_df = compute_outside_table(df, right_col)
+    return right_col
+
+
+# ===================== ГЛАВНАЯ ФУНКЦИЯ ОТЧЁТА =====================
+
+def report_for_policy(
+    prepared: PreparedJournal, policy=None, kadry_dates=None, schedule=None, render=True, progress=None
+) -> pd.DataFrame:
+    """
+    Отчёт по уже подготовленному журналу для одной политики.
+    render=False — типизированный отчёт (TYPED_COLUMNS) без строкового оформления.
+    """
+    policy = policy or DEFAULT_POLICY
+    progress = _as_progress(progress)
+    right_col = _choose_right_col(prepared, policy, schedule)
+    tl = prepared.timeline(right_col, policy.day_start_h, schedule)
+    if progress is not None:
+        progress.stage("Расчёт по сотрудникам")
+    days = day_metrics(tl, policy, schedule, progress)
+    if progress is not None:
+        progress.stage("Сборка отчёта")
+    typed = _finalize(days, kadry_dates, policy)
+    return render_report(typed) if render else typed
 
-    # 4) длительность, опоздания
-    stats_df = _calc_group_stats(df)
 
-    # 5) выходы и suspect
-    exits_df = _calc_exits_and_suspect(df, right_col)
+REPORT_ENGINES = ("pandas", "polars")
 
-    out_df["Дата"] = pd.to_datetime(out_df["Дата"], errors="coerce").dt.date
-    stats_df["Дата"] = pd.to_datetime(stats_df["Дата"], errors="coerce").dt.date
-    exits_df["Дата"] = pd.to_datetime(exits_df["Дата"], errors="coerce").dt.date
 
-    # 6) объединяем
-    final = out_df.merge(
-        stats_df[["ФИО", "Дата", "Продолжительность_мин", "Общее время", "Опоздание"]],
-        on=["ФИО", "Дата"],
-        how="left",
-        validate="one_to_one",
-    )
-    final = final.merge(
-        exits_df[["ФИО", "Дата", "Выходы", "suspect"]],
-        on=["ФИО", "Дата"],
-        how="left",
-        validate="one_to_one",
-    )
+def build_report(
+    journal_file, kadry_file=None, policy=None, schedule=None, render=True, doors=None, progress=None, engine="pandas"
+) -> pd.DataFrame:
+    """
+    Главная функция: получает файл журнала и, при наличии, кадровый файл.
+    Возвращает готовый pandas.DataFrame для выгрузки в Excel.
+    policy — параметры учёта (по умолчанию DEFAULT_POLICY),
+    schedule — график смен (shifts.read_shifts), задаёт ядро, опоздание и границы суток.
+    render=False — вернуть типизированный отчёт (числа Int64, время datetime64) без строк.
+    doors — словарь дверей площадки (doors.DoorDictionary), по умолчанию — разбор по подсказкам.
+    progress — колбэк progress(stage, done, total): вызывается на каждом этапе
+    (PROGRESS_STAGES) и по ходу расчёта — сотрудники готово / всего, не чаще PROGRESS_EVERY_S.
+    engine — табличный движок: "pandas" или "polars" (polars_engine, результат тот же).
+    """
+    if engine not in REPORT_ENGINES:
+        raise RuntimeError(f"Неизвестный движок отчёта: {engine}. Доступны: {list(REPORT_ENGINES)}.")
+    if engine == "polars":
+        from polars_engine import build_report_polars
 
-    final["Выходы"] = final["Выходы"].fillna(0).astype(int)
-    final["suspect"] = final["suspect"].fillna(False)
+        return build_report_polars(journal_file, kadry_file, policy, schedule, render, doors, progress)
 
-    # дописываем пометку "возм. проход вне терминала"
-    mask_susp = final["suspect"] == True
-    final.loc[mask_susp, "Вне офиса"] = (
-        final.loc[mask_susp, "Вне офиса"].astype(str)
-        + "\nвозм. проход вне терминала"
-    )
+    progress = _as_progress(progress)
 
-    # === 7) ИТОГО ЗА ДЕНЬ (логика: span - обед - штраф за вне ядра) ===
-    span = pd.to_numeric(final["Продолжительность_мин"], errors="coerce").fillna(0).astype(int)
-    outside = pd.to_numeric(final["Вне_ядра_мин"], errors="coerce").fillna(0).astype(int)
+    # 1) читаем журнал
+    if progress is not None:
+        progress.stage("Чтение журнала")
+    df = read_journal(journal_file)
+    if progress is not None:
+        progress.stage("Разметка дверей")
+    prepared = PreparedJournal(df, doors=doors)
 
-    small = span < 60  # совсем короткая смена — не трогаем
-    lunch = (~small).astype(int) * 60                # фикс-обед 60 мин, если смена ≥ 60
-    penalty = (~small).astype(int) * (outside - 60).clip(lower=0)  # штраф за вне ядра > 60 мин
+    kadry_dates = None
+    if kadry_file is not None:
+        if progress is not None:
+            progress.stage("Кадровый файл")
+        kadry_dates = read_kadry(kadry_file)
 
-    final["Итого_дня_мин"] = (span - lunch - penalty).clip(lower=0).astype(int)
-    final["Итого за день"] = final["Итого_дня_мин"].apply(fmt_hm)
+    return report_for_policy(prepared, policy, kadry_dates, schedule, render, progress)
 
-    # Недоработки как max(0, вне_ядра - 60)
-    ned_min = (outside - 60).clip(lower=0).astype(int)
-    final["Недоработки"] = ned_min.apply(fmt_hm)
 
-    # === 8) ИТОГО ЗА НЕДЕЛЮ — только в последний рабочий день недели ===
-    final["Дата_dt"] = pd.to_datetime(final["Дата"], errors="coerce")
-    final["week_monday"] = final["Дата_dt"] - pd.to_timedelta(
-        final["Дата_dt"].dt.weekday, unit="D"
-    )
+def build_reports(journal_file, kadry_file=None, policies=None, schedule=None, render=True, doors=None) -> dict:
+    """
+    Несколько политик на одном журнале за один вызов.
+    Чтение, разметка и таймлайны делаются один раз, на каждую политику
+    пересчитываются только посуточные метрики и сборка отчёта.
+    Возвращает {policy.name: DataFrame}.
+    """
+    policies = list(policies) if policies else [DEFAULT_POLICY]
+    names = [p.name for p in policies]
+    if len(set(names)) != len(names):
+        raise RuntimeError(f"Имена политик должны быть уникальными: {names}")
 
-    # === 7.5) НЕПОЛНЫЙ ДЕНЬ (1 проход) ===
-    # считаем количество событий за рабочий день
-    events_cnt = (
-        df.groupby(["ФИО", "Рабочий_день"])
-          .size()
-          .reset_index(name="events_cnt")
-    )
-    events_cnt["Дата"] = pd.to_datetime(events_cnt["Рабочий_день"], errors="coerce").dt.date
-    events_cnt = events_cnt[["ФИО", "Дата", "events_cnt"]]
-    
-    final = final.merge(events_cnt, on=["ФИО", "Дата"], how="left")
-    final["events_cnt"] = pd.to_numeric(final["events_cnt"], errors="coerce").fillna(0).astype(int)
-    
-    bad = final["events_cnt"] == 1
-    final.loc[bad, "suspect"] = False
-    
-    # пометка вместо "опоздание"
-    final.loc[bad, "Опоздание"] = "Неполный день (1 проход)"
+    prepared = prepare_journal(journal_file, doors)
 
-    # очищаем "Общее время" и длительность (как в Colab, чтобы не было 0ч 0мин)
-    final.loc[bad, "Общее время"] = ""
-    final.loc[bad, "Продолжительность_мин"] = 0
-    
-    # чистим показатели (как в Colab)
-    final.loc[bad, "Вне_ядра_мин"] = 0
-    final.loc[bad, "Вне офиса"] = ""
-    final.loc[bad, "Выходы"] = ""
-    final.loc[bad, "Отсутствие более 2 часов подряд"] = ""
-    
-    final.loc[bad, "Итого_дня_мин"] = 0
-    final.loc[bad, "Итого за день"] = ""
-    final.loc[bad, "Недоработки"] = ""
-    
-    # можно удалить служебную колонку если не нужна в Excel
-    # final = final.drop(columns=["events_cnt"], errors="ignore")
+    kadry_dates = None
+    if kadry_file is not None:
+        kadry_dates = read_kadry(kadry_file)
 
-    final["Итого_нед_мин"] = 0
-    final["Итого за неделю"] = ""
+    return {p.name: report_for_policy(prepared, p, kadry_dates, schedule, render) for p in policies}
 
-    for (fio, wmo), sub in final.groupby(["ФИО", "week_monday"], sort=False):
-        week_sum = int(sub["Итого_дня_мин"].sum())
-        if week_sum <= 0:
-            continue
-        # последний рабочий день в этой группе (обычно пятница)
-        last_idx = sub["Дата_dt"].idxmax()
-        final.loc[last_idx, "Итого_нед_мин"] = week_sum
-        final.loc[last_idx, "Итого за неделю"] = fmt_hm(week_sum)
 
-    final = final.drop(columns=["Дата_dt", "week_monday", "suspect"], errors="ignore")
-    
-    # === 9.5) ДОБАВЛЯЕМ ПУСТЫЕ ДНИ ПН–ПТ (как табель) ===
-    # определяем "неделю отчёта" по журналу (макс. рабочий день)
-    anchor = pd.to_datetime(df["Рабочий_день"], errors="coerce").max()
-    
-    if pd.isna(anchor):
-        days_present = []
-    else:
-        mo = anchor.normalize() - pd.to_timedelta(anchor.weekday(), unit="D")  # понедельник
-        days_present = [ (mo + pd.to_timedelta(i, "D")).date() for i in range(5) ]  # Пн–Пт
-    
-    all_fio = set(df["ФИО"].dropna().tolist())
+def _weekly_totals(final: pd.DataFrame) -> pd.DataFrame:
+    """
+    ИТОГО ЗА НЕДЕЛЮ — только в последний рабочий день недели (обычно пятница).
+    Строки упорядочиваются одним argsort по целому ключу (код ФИО, день) —
+    без группировки по строкам ФИО; группы (ФИО, неделя) идут подряд:
+    сумма — reduceat, последний день — конец группы.
+    """
+    final = final.reset_index(drop=True)
+    week_min = np.zeros(len(final), dtype=np.int64)
+    if len(final):
+        fio = pd.factorize(final["ФИО"])[0].astype(np.int64)   # порядок ФИО не важен — без сортировки строк
+        day = final["Дата"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        day -= day.min()
+        order = np.argsort(fio * (day.max() + 1) + day, kind="stable")
+        fio = fio[order]
+        week = final["week_monday"].to_numpy(dtype="datetime64[D]").astype(np.int64)[order]
+        starts = np.flatnonzero(np.r_[True, (fio[1:] != fio[:-1]) | (week[1:] != week[:-1])])
+        ends = np.append(starts[1:], len(order))
+        week_sum = np.add.reduceat(final["Итого_дня_мин"].to_numpy(dtype=np.int64)[order], starts)
+
+        keep = week_sum > 0
+        week_min[order[ends[keep] - 1]] = week_sum[keep]
+    final["Итого_нед_мин"] = week_min
+    return final
 
-    # добавляем из кадров ТОЛЬКО тех, кто отсутствует в пределах этой недели (Пн–Пт)
-    if kadry_dates is not None and not kadry_dates.empty and len(days_present) > 0:
-        kd_week = kadry_dates[kadry_dates["Дата"].isin(days_present)]
-        all_fio |= set(kd_week["ФИО"].dropna().tolist())
 
-    # и выкинем совсем пустые ФИО
-    all_fio = {fio for fio in all_fio if fio_match_key(fio)}
-    
-    # убираем дубли по ключу (ё/е, пробелы)
-    fio_pretty = {}
-    for fio in all_fio:
-        fio_pretty[fio_match_key(fio)] = fio  # оставляем последнее/или первое — не критично
-    all_fio = sorted(fio_pretty.values())
-    
-    # база (ФИО × дни)
-    base = pd.DataFrame([(fio, d) for fio in all_fio for d in days_present], columns=["ФИО", "Дата"])
-    
-    # IMPORTANT: final["Дата"] у тебя сейчас date, поэтому base тоже date
-    base["Дата"] = pd.to_datetime(base["Дата"], errors="coerce").dt.date
-    
-    # расширяем final до полного набора
-    final = base.merge(final, on=["ФИО", "Дата"], how="left")
+def _calendar_base(all_fio, days_present) -> pd.DataFrame:
+    """Сетка табеля ФИО × дни (декартово произведение)."""
+    return pd.MultiIndex.from_product(
+        [list(all_fio), days_present], names=["ФИО", "Дата"]
+    ).to_frame(index=False)
+
+
+# Колонки типизированного отчёта (результат _finalize)
+TYPED_COLUMNS = [
+    "ФИО",
+    "Дата",
+    "first_ts",
+    "last_ts",
+    "gap_from",
+    "gap_to",
+    "late",
+    "incomplete",
+    "suspect",
+    "events_cnt",
+    "Продолжительность_мин",
+    "Вне_ядра_мин",
+    "Выходы",
+    "Итого_дня_мин",
+    "Итого_нед_мин",
+    "Недоработки_мин",
+    "Причина отсутствия",
+]
 
-    # === 9) ПРИЧИНА ОТСУТСТВИЯ (кадровый файл) — ПОСЛЕ 9.5 ===
-    if kadry_file is None or kadry_dates is None or kadry_dates.empty:
-        final["Причина отсутствия"] = ""
-    else:
-        final["Дата_key"] = pd.to_datetime(final["Дата"], errors="coerce").dt.date
-        kadry_dates["Дата_key"] = pd.to_datetime(kadry_dates["Дата"], errors="coerce").dt.date
 
-        final["ФИО_key_full"] = final["ФИО"].apply(fio_match_key)
-        kadry_dates["ФИО_key_full"] = kadry_dates["ФИО"].apply(fio_match_key)
+def _fio_keys(fio: pd.Series, key_fn) -> np.ndarray:
+    """Ключ ФИО (fio_match_key / fio_short_key) — считается один раз на уникальное ФИО."""
+    codes, uniques = pd.factorize(fio)
+    return np.append(np.array([key_fn(u) for u in uniques], dtype=object), "")[codes]
 
-        final["ФИО_key_short"] = final["ФИО"].apply(fio_short_key)
-        kadry_dates["ФИО_key_short"] = kadry_dates["ФИО"].apply(fio_short_key)
 
-        m1 = kadry_dates[["ФИО_key_full", "Дата_key", "Тип"]].drop_duplicates()
-        final = final.merge(m1, on=["ФИО_key_full", "Дата_key"], how="left")
+def _absence_reasons(final: pd.DataFrame, kadry_dates) -> pd.DataFrame:
+    """
+    Колонка «Причина отсутствия» из кадров: сначала по полному ключу ФИО,
+    затем по «Фамилия + инициалы». Дата с обеих сторон — datetime64 (полночь дня),
+    так что ключ дня сливается как есть, без перевода в date.
+    """
+    if kadry_dates is None or kadry_dates.empty:
+        return final.assign(**{"Причина отсутствия": ""})
 
-        need2 = final["Тип"].isna()
-        if need2.any():
-            m2 = kadry_dates[["ФИО_key_short", "Дата_key", "Тип"]].drop_duplicates()
-            tmp = final.loc[need2, ["ФИО_key_short", "Дата_key"]].merge(
-                m2, on=["ФИО_key_short", "Дата_key"], how="left"
-            )
-            final.loc[need2, "Тип"] = tmp["Тип"].values
+    final = final.assign(
+        ФИО_key_full=_fio_keys(final["ФИО"], fio_match_key),
+        ФИО_key_short=_fio_keys(final["ФИО"], fio_short_key),
+    )
+    kd = pd.DataFrame({
+        "ФИО_key_full": _fio_keys(kadry_dates["ФИО"], fio_match_key),
+        "ФИО_key_short": _fio_keys(kadry_dates["ФИО"], fio_short_key),
+        "Дата": kadry_dates["Дата"].to_numpy(dtype="datetime64[ns]"),
+        "Тип": kadry_dates["Тип"].to_numpy(),
+    })
 
-        final["Причина отсутствия"] = final["Тип"].fillna("")
+    m1 = kd[["ФИО_key_full", "Дата", "Тип"]].drop_duplicates()
+    final = final.merge(m1, on=["ФИО_key_full", "Дата"], how="left")
 
-        final = final.drop(
-            columns=["Тип", "ФИО_key_full", "ФИО_key_short", "Дата_key"],
-            errors="ignore",
-        )
-    
-    # аккуратные дефолты для пустых строк
-    text_cols = [
-        "Время прихода", "Время ухода", "Опоздание", "Общее время",
-        "Вне офиса", "Отсутствие более 2 часов подряд",
-        "Итого за день", "Итого за неделю", "Недоработки",
-        "Причина отсутствия",
-    ]
-    for c in text_cols:
-        if c in final.columns:
-            final[c] = final[c].fillna("")
-           
-    num_cols = ["Вне_ядра_мин", "Итого_дня_мин", "Итого_нед_мин", "Выходы", "Продолжительность_мин"]
-    for c in num_cols:
-        if c in final.columns:
-            final[c] = pd.to_numeric(final[c], errors="coerce").fillna(0).astype(int)
-
-    # пустые дни (нет проходов) — чистим отображаемые поля
-    mask_empty = final["Продолжительность_мин"] <= 0
-    
-    final.loc[mask_empty, "Время прихода"] = ""
-    final.loc[mask_empty, "Время ухода"] = ""
-    final.loc[mask_empty, "Общее время"] = ""
-    final.loc[mask_empty, "Вне офиса"] = ""
-    final.loc[mask_empty, "Отсутствие более 2 часов подряд"] = ""
-    final.loc[mask_empty, "Выходы"] = ""
-    final.loc[mask_empty, "Итого за день"] = ""
-    final.loc[mask_empty, "Недоработки"] = ""
-    # "Опоздание" тоже пустим, если это не неполный день (а просто нет проходов)
-    final.loc[mask_empty & (final.get("Опоздание", "") != "Неполный день (1 проход)"), "Опоздание"] = ""
-
-    # === 10) Формат даты и порядок колонок ===
-    final["Дата"] = pd.to_datetime(final["Дата"], errors="coerce").dt.strftime("%d-%m-%Y")
-
-    cols_order = [
-        "ФИО",
-        "Дата",
-        "Время прихода",
-        "Время ухода",
-        "Опоздание",
-        "Общее время",
-        "Вне офиса",
-        "Выходы",
-        "Отсутствие более 2 часов подряд",
-        "Итого за день",
-        "Итого за неделю",
-        "Недоработки",
-        "Причина отсутствия",
-        "Вне_ядра_мин",
-        "Итого_дня_мин",
-        "Итого_нед_мин",
-    ]
-    for c in cols_order:
-        if c not in final.columns:
-            final[c] = ""  # на всякий случай
+    need2 = final["Тип"].isna()
+    if need2.any():
+        m2 = kd[["ФИО_key_short", "Дата", "Тип"]].drop_duplicates()
+        tmp = final.loc[need2, ["ФИО_key_short", "Дата"]].merge(m2, on=["ФИО_key_short", "Дата"], how="left")
+        final.loc[need2, "Тип"] = tmp["Тип"].values
 
-    final = final[cols_order]
+    final["Причина отсутствия"] = final["Тип"].fillna("")
+    return final.drop(columns=["Тип", "ФИО_key_full", "ФИО_key_short"])
 
-    return final
 
+def _day_totals(days: pd.DataFrame, policy) -> pd.DataFrame:
+    """Посуточные строки -> итоги дня (обед, штраф за вне ядра) и итог недели."""
+    final = days.reset_index(drop=True)
 
+    # === 7.5) НЕПОЛНЫЙ ДЕНЬ (1 проход) — показатели обнуляем ===
+    incomplete = final["events_cnt"].to_numpy() == 1
+    span = np.where(incomplete, 0, final["Продолжительность_мин"].to_numpy())
+    outside = np.where(incomplete, 0, final["Вне_ядра_мин"].to_numpy())
+    allowance = policy.outside_allowance_min
 
+    # === 7) ИТОГО ЗА ДЕНЬ (логика: span - обед - штраф за вне ядра) ===
+    small = span < policy.short_shift_min  # совсем короткая смена — не трогаем
+    lunch = np.where(small, 0, policy.lunch_min)                              # фикс-обед
+    penalty = np.where(small, 0, np.clip(outside - allowance, 0, None))       # штраф за вне ядра сверх допуска
+
+    final["incomplete"] = incomplete
+    final["suspect"] = final["suspect"].to_numpy() & ~incomplete
+    final["Продолжительность_мин"] = span
+    final["Вне_ядра_мин"] = outside
+    final["Итого_дня_мин"] = np.clip(span - lunch - penalty, 0, None)
+    # Недоработки как max(0, вне_ядра - допуск)
+    final["Недоработки_мин"] = np.clip(outside - allowance, 0, None)
 
+    # === 8) ИТОГО ЗА НЕДЕЛЮ — только в последний рабочий день недели ===
+    # «Дата» уже datetime64 (полночь рабочих суток) — без повторного разбора
+    final["week_monday"] = final["Дата"] - pd.to_timedelta(final["Дата"].dt.weekday, unit="D")
+    final = _weekly_totals(final)
+    return final.drop(columns=["week_monday"])
 
 
+def _calendar_days(anchor) -> pd.DatetimeIndex:
+    """Пн–Пт недели отчёта; anchor — последний рабочий день журнала (NaT — журнал пуст)."""
+    if pd.isna(anchor):
+        return pd.DatetimeIndex([])
+    anchor = pd.Timestamp(anchor)
+    mo = anchor - pd.to_timedelta(anchor.weekday(), unit="D")  # понедельник
+    return mo + pd.to_timedelta(np.arange(5), unit="D")  # Пн–Пт
 
 
+def _calendar_fio(fio, kadry_dates, days_present) -> list:
+    """Строки табеля: сотрудники журнала (fio) и кадров этой недели, без дублей по ключу ФИО."""
+    all_fio = set(fio)
+
+    # добавляем из кадров ТОЛЬКО тех, кто отсутствует в пределах этой недели (Пн–Пт)
+    if kadry_dates is not None and not kadry_dates.empty and len(days_present) > 0:
+        kd_week = kadry_dates[kadry_dates["Дата"].isin(days_present)]
+        all_fio |= set(kd_week["ФИО"].dropna().tolist())
+
+    # и выкинем совсем пустые ФИО
+    all_fio = {fio for fio in all_fio if fio_match_key(fio)}
+
+    # убираем дубли по ключу (ё/е, пробелы)
+    fio_pretty = {}
+    for fio in all_fio:
+        fio_pretty[fio_match_key(fio)] = fio  # оставляем последнее/или первое — не критично
+    return sorted(fio_pretty.values())
 
 
+def _calendar_fill(final: pd.DataFrame, kadry_dates) -> pd.DataFrame:
+    """Сетка табеля: все сотрудники × Пн–Пт недели отчёта, дни без проходов — пустые строки."""
+    # === 9.5) ДОБАВЛЯЕМ ПУСТЫЕ ДНИ ПН–ПТ (как табель) ===
+    # определяем "неделю отчёта" по журналу (макс. рабочий день)
+    days_present = _calendar_days(final["Дата"].max())
+    all_fio = _calendar_fio(final["ФИО"].dropna().tolist(), kadry_dates, days_present)
+
+    # база (ФИО × дни)
+    base = _calendar_base(all_fio, days_present)
 
+    # расширяем final до полного набора
+    return base.merge(final, on=["ФИО", "Дата"], how="left")
 
 
+def _typed_report(final: pd.DataFrame) -> pd.DataFrame:
+    """Типы колонок табеля: дни без проходов — нули в итогах, <NA> в показателях дня."""
+    final = final.copy()
+    for c in ["late", "incomplete", "suspect"]:
+        final[c] = final[c].astype("boolean").fillna(False).astype(bool)
+    for c in ["events_cnt", "Продолжительность_мин", "Вне_ядра_мин", "Итого_дня_мин", "Итого_нед_мин"]:
+        final[c] = final[c].fillna(0).astype("Int64")
+    day_shown = final["Продолжительность_мин"] > 0
+    for c in ["Выходы", "Недоработки_мин"]:
+        final[c] = final[c].astype("Int64").where(day_shown)
 
+    return final[TYPED_COLUMNS]
 
 
+def _finalize(days: pd.DataFrame, kadry_dates, policy) -> pd.DataFrame:
+    """
+    Типизированный отчёт: итоги дня/недели, пустые дни Пн–Пт, причины отсутствия.
+    Числа — nullable Int64 (<NA> там, где в табеле пусто), время — datetime64,
+    флаги — bool. Строки для показа делает render_report.
+    """
+    final = _day_totals(days, policy)
+    final = _calendar_fill(final, kadry_dates)
+    # === 9) ПРИЧИНА ОТСУТСТВИЯ (кадровый файл) — ПОСЛЕ 9.5 ===
+    final = _absence_reasons(final, kadry_dates)
+    return _typed_report(final)
+
+
+# Колонки табеля для Excel/экрана (результат render_report)
+REPORT_COLUMNS = [
+    "ФИО",
+    "Дата",
+    "Время прихода",
+    "Время ухода",
+    "Опоздание",
+    "Общее время",
+    "Вне офиса",
+    "Выходы",
+    "Отсутствие более 2 часов подряд",
+    "Итого за день",
+    "Итого за неделю",
+    "Недоработки",
+    "Причина отсутствия",
+    "Вне_ядра_мин",
+    "Итого_дня_мин",
+    "Итого_нед_мин",
+]
 
 
+def render_report(typed: pd.DataFrame) -> pd.DataFrame:
+    """
+    Типизированный отчёт -> строки табеля, одним проходом по колонкам.
+    Дни без длительности (нет проходов / один проход) показываются пустыми.
+    """
+    shown = (typed["Продолжительность_мин"] > 0).to_numpy()
+
+    def _only_shown(values):
+        res = np.full(len(typed), "", dtype=object)
+        res[shown] = np.asarray(values, dtype=object)[shown]
+        return res
+
+    late_txt = np.where(typed["late"].to_numpy(), "опоздание", "вовремя")
+    outside_txt = fmt_hm_array(typed["Вне_ядра_мин"])
+    susp = typed["suspect"].to_numpy()
+    outside_txt[susp] = outside_txt[susp] + "\nвозм. проход вне терминала"
+
+    week = typed["Итого_нед_мин"]
+    week_txt = np.where(week > 0, fmt_hm_array(week), "")
+
+    out = pd.DataFrame(
+        {
+            "ФИО": typed["ФИО"],
+            "Дата": typed["Дата"].dt.strftime("%d-%m-%Y"),
+            "Время прихода": _only_shown(_fmt_clock(typed["first_ts"])),
+            "Время ухода": _only_shown(_fmt_leave(typed["last_ts"], typed["Дата"])),
+            "Опоздание": np.where(typed["incomplete"], "Неполный день (1 проход)", _only_shown(late_txt)),
+            "Общее время": _only_shown(fmt_hm_array(typed["Продолжительность_мин"])),
+            "Вне офиса": _only_shown(outside_txt),
+            "Выходы": _only_shown(typed["Выходы"].fillna(0).astype(int).tolist()),
+            "Отсутствие более 2 часов подряд": _only_shown(_fmt_gap(typed["gap_from"], typed["gap_to"])),
+            "Итого за день": _only_shown(fmt_hm_array(typed["Итого_дня_мин"])),
+            "Итого за неделю": week_txt,
+            "Недоработки": _only_shown(fmt_hm_array(typed["Недоработки_мин"])),
+            "Причина отсутствия": typed["Причина отсутствия"],
+            "Вне_ядра_мин": typed["Вне_ядра_мин"].astype(int),
+            "Итого_дня_мин": typed["Итого_дня_мин"].astype(int),
+            "Итого_нед_мин": typed["Итого_нед_мин"].astype(int),
+        }
+    )
+    return out[REPORT_COLUMNS]
@@ -0,0 +1,409 @@
+"""
+Сверка движков отчёта с эталоном.
+
+    python equivalence.py                 # examples/ + 10 синтетических журналов, все движки
+    python equivalence.py 50              # 50 синтетических журналов
+    python equivalence.py 20 numba polars # только выбранные движки
+    python equivalence.py --golden engine_base.py   # пересобрать эталонные отчёты
+    python equivalence.py 10 --baseline engine_base.py   # синтетику — тоже с исходным движком
+
+Эталон — отчёты исходного построчного движка (до векторизации), сохранённые
+в examples/golden/ для журналов examples/ и журналов с трудными случаями
+(examples/golden/edge*.xlsx). С ними сверяются все движки, включая pandas:
+ошибка в общем векторном коде видна как расхождение с эталоном.
+Пересобрать эталон: git show <исходный коммит>:engine.py > engine_base.py
+и python equivalence.py --golden engine_base.py (нужен build_report(журнал, кадры)).
+
+Случайные синтетические журналы (CSV/Parquet) сохранённого эталона не имеют.
+С --baseline эталон для них строит сам исходный движок из файла (по копии
+журнала и кадров в Excel — другого он не читает), и с ним сверяются все
+движки. Без --baseline движки сверяются с pandas-движком (посуточный расчёт
+на Python): типизированные отчёты сравниваются по каждой колонке (тип и
+значения, <NA> = <NA>). Для каждого движка печатаются время и прирост памяти процесса.
+Если есть расхождения — код выхода 1.
+Синтетические журналы содержат трудные случаи: день из одного прохода,
+уход после полуночи (до границы суток), дрожание дублей, неизвестные
+и «двойные» двери, неконтролируемые зоны и строки не-сотрудников.
+"""
+import gc
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import engine
+from jobs import _PeakRSS
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+GOLDEN_DIR = os.path.join(EXAMPLES_DIR, "golden")
+EXAMPLES = [
+    ("Ноябрь пример.xlsx", "ноябрь кадры.xlsx"),
+    ("пример СКУД.xlsx", "пример от кадров.xlsx"),
+]
+# журналы с трудными случаями для эталона: (файл, сид, сотрудников, дней)
+EDGE_CASES = [("edge0.xlsx", 0, 40, 8), ("edge1.xlsx", 1, 40, 8)]
+HASH_SEED = "0"
+OOC_MEMORY_MB = 4   # маленький бюджет — журнал точно раскладывается на разделы
+
+
+# === Движки ===
+
+@contextmanager
+def _kernel(name):
+    saved = engine.DAY_KERNEL
+    engine.DAY_KERNEL = name
+    try:
+        yield
+    finally:
+        engine.DAY_KERNEL = saved
+
+
+def _pandas(journal, kadry):
+    with _kernel("python"):
+        return engine.build_report(journal, kadry, render=False)
+
+
+def _numba(journal, kadry):
+    with _kernel("numba"):
+        return engine.build_report(journal, kadry, render=False)
+
+
+def _polars(journal, kadry):
+    with _kernel("python"):
+        return engine.build_report(journal, kadry, render=False, engine="polars")
+
+
+def _staged(journal, kadry):
+    import pipeline
+
+    with _kernel("python"):
+        return pipeline.build_report_staged(journal, kadry, render=False, cache=pipeline.StageCache(root=None))
+
+
+def _ooc(journal, kadry):
+    import outofcore
+
+    if journal.endswith((".xlsx", ".xls")):
+        return None   # по частям читаются только CSV и Parquet
+    with _kernel("python"):
+        return outofcore.build_report_ooc(journal, kadry, memory_mb=OOC_MEMORY_MB, render=False)
+
+
+# движок: (функция, нужный пакет или None)
+ENGINES = {
+    "pandas": (_pandas, None),
+    "numba": (_numba, "numba"),
+    "polars": (_polars, "polars"),
+    "staged": (_staged, None),
+    "ooc": (_ooc, "pyarrow"),
+}
+
+
+# === Синтетические журналы с трудными случаями ===
+
+_IN, _OUT = "Офис 3 этаж", "Шлюз главный"
+_ODD_DOORS = ["Лифт", None, "Выход офис", "Неконтролируемая зона"]
+_SYL = ["ка", "ло", "ми", "ра", "со", "ту", "не", "ва", "ри", "дё"]
+
+
+def _surname(i):
+    return "".join(_SYL[int(c)] for c in f"{i:04d}").capitalize() + "ов"
+
+
+def synth_edge_journal(n_emp=40, n_days=10, seed=0, start="2025-11-03"):
+    """(журнал как выгрузка СКУД, кадровый файл) — pandas.DataFrame с колонками вендора."""
+    rng = np.random.default_rng(seed)
+    d0 = pd.Timestamp(start)
+    rows = []
+
+    def add(fio, ts, is_in, door=None):
+        # проход «внутрь»: Вход — офис, Выход — шлюз (и наоборот)
+        door_in, door_out = (_IN, _OUT) if is_in else (_OUT, _IN)
+        if door is not None or rng.random() < 0.03:
+            door_in = door_out = door if door is not None else _ODD_DOORS[rng.integers(len(_ODD_DOORS))]
+        rows.append((fio, ts, door_in, door_out))
+
+    people = [(_surname(i), "Анна" if i % 2 else "Иван", "Петровна" if i % 2 else "Ильич") for i in range(n_emp)]
+    for fam, name, patr in people:
+        fio = (fam, name, patr)
+        for d in range(n_days):
+            day = d0 + pd.Timedelta(days=d)
+            kind = rng.choice(["обычный", "один проход", "после полуночи", "дрожание", "нет", "выходы"],
+                              p=[0.35, 0.1, 0.1, 0.15, 0.15, 0.15])
+            if kind == "нет":
+                continue
+            t_in = day + pd.Timedelta(minutes=int(rng.integers(7 * 60, 11 * 60)), seconds=int(rng.integers(60)))
+            if kind == "один проход":
+                add(fio, t_in, bool(rng.random() < 0.7))
+                continue
+            if kind == "после полуночи":
+                # вечерний приход, уход после 00:00 — ещё те же рабочие сутки
+                t_in = day + pd.Timedelta(hours=int(rng.integers(14, 22)), minutes=int(rng.integers(60)))
+                t_out = day + pd.Timedelta(days=1, hours=int(rng.integers(0, 6)), minutes=int(rng.integers(60)))
+            else:
+                t_out = t_in + pd.Timedelta(minutes=int(rng.integers(4 * 60, 11 * 60)), seconds=int(rng.integers(60)))
+            add(fio, t_in, True)
+            if kind == "выходы":
+                t = t_in
+                for _ in range(int(rng.integers(1, 5))):
+                    t = t + pd.Timedelta(minutes=int(rng.integers(20, 150)))
+                    back = t + pd.Timedelta(minutes=int(rng.choice([2, 4, 5, 6, 30, 61, 130])))
+                    if back >= t_out:
+                        break
+                    add(fio, t, False)
+                    add(fio, back, True)
+                    t = back
+            if kind == "дрожание":
+                # повторы в пределах окна слипания и одинаковые направления подряд
+                for _ in range(int(rng.integers(1, 4))):
+                    add(fio, t_in + pd.Timedelta(seconds=int(rng.integers(1, 240))), True)
+                if rng.random() < 0.5:
+                    add(fio, t_in + pd.Timedelta(minutes=int(rng.integers(61, 180))), True)
+            add(fio, t_out, False)
+            if rng.random() < 0.1:
+                add(fio, t_out + pd.Timedelta(microseconds=int(rng.integers(1, 999_999))), False)
+
+    for i, guest in enumerate(["Гость 1", "ООО Ромашка"]):
+        add((guest, "", ""), d0 + pd.Timedelta(hours=10 + i), True)
+
+    journal = pd.DataFrame(rows, columns=["ФИО", "Дата события", "Вход", "Выход"])
+    journal = journal.sort_values("Дата события", kind="stable").reset_index(drop=True)
+    journal = pd.DataFrame({
+        "Событие": np.where(rng.random(len(journal)) < 0.02, "Отказ в доступе", "Проход по идентификатору"),
+        "Дата события": journal["Дата события"],
+        "Фамилия": [f[0] for f in journal["ФИО"]],
+        "Имя": [f[1] for f in journal["ФИО"]],
+        "Отчество": [f[2] for f in journal["ФИО"]],
+        "Вход": journal["Вход"],
+        "Выход": journal["Выход"],
+    })
+
+    # кадры: полное ФИО, «Фамилия И.О.» и ВЕРХНИЙ регистр
+    kadry = []
+    for fam, name, patr in people:
+        if rng.random() < 0.3:
+            s = d0 + pd.Timedelta(days=int(rng.integers(n_days)))
+            who = rng.choice([f"{fam} {name} {patr}", f"{fam} {name[0]}.{patr[0]}.", f"{fam} {name} {patr}".upper()])
+            kind = rng.choice(["Отпуск", "Больничный", "Командировка"])
+            kadry.append((who, kind, s.strftime("%d.%m.%Y"), (s + pd.Timedelta(days=int(rng.integers(4)))).strftime("%d.%m.%Y")))
+    kadry = pd.DataFrame(kadry, columns=["Сотрудник", "Вид отсутствия", "с", "до"])
+    return journal, kadry
+
+
+def _write_case(tmp, seed, n_emp, n_days):
+    """Синтетический журнал (CSV или Parquet) и кадры (CSV) в tmp: (пути, журнал и кадры в том виде, как записаны)."""
+    journal, kadry = synth_edge_journal(n_emp, n_days, seed)
+    j_path = os.path.join(tmp, f"synth{seed}")
+    if seed % 2:
+        j_path += ".csv"
+        # в CSV время — с точностью до секунды
+        journal["Дата события"] = journal["Дата события"].dt.floor("s")
+        journal.assign(**{"Дата события": journal["Дата события"].dt.strftime("%Y-%m-%d %H:%M:%S")}).to_csv(
+            j_path, index=False, sep=";"
+        )
+    else:
+        j_path += ".parquet"
+        journal.to_parquet(j_path, index=False)
+    k_path = os.path.join(tmp, f"kadry{seed}.csv")
+    kadry.to_csv(k_path, index=False, sep=";")
+    return j_path, k_path, journal, kadry
+
+
+# === Сравнение ===
+
+def diff_reports(ref: pd.DataFrame, other: pd.DataFrame) -> list:
+    """Расхождения отчётов: [(колонка, число строк, пример), ...]; пустой список — совпали."""
+    if list(ref.columns) != list(other.columns):
+        return [("колонки", 0, f"{list(ref.columns)} != {list(other.columns)}")]
+    if len(ref) != len(other):
+        return [("строки", abs(len(ref) - len(other)), f"{len(ref)} != {len(other)}")]
+    res = []
+    for c in ref.columns:
+        a, b = ref[c].reset_index(drop=True), other[c].reset_index(drop=True)
+        if a.dtype != b.dtype:
+            res.append((c, len(a), f"тип {a.dtype} != {b.dtype}"))
+            continue
+        # пропуски (<NA>, NaT) сравниваются как None == None
+        x = a.astype(object).where(a.notna(), None).to_numpy()
+        y = b.astype(object).where(b.notna(), None).to_numpy()
+        bad = np.array([u != v for u, v in zip(x, y)], dtype=bool)
+        if bad.any():
+            i = int(np.flatnonzero(bad)[0])
+            res.append((c, int(bad.sum()), f"строка {i} ({ref['ФИО'].iloc[i]}): {a.iloc[i]!r} != {b.iloc[i]!r}"))
+    return res
+
+
+def _golden_path(journal):
+    return os.path.join(GOLDEN_DIR, os.path.splitext(os.path.basename(journal))[0] + ".csv")
+
+
+def _as_text(rendered: pd.DataFrame) -> pd.DataFrame:
+    # эталон хранится в CSV — сравниваем оформленные отчёты как строки CSV
+    buf = io.StringIO()
+    rendered.to_csv(buf, index=False)
+    buf.seek(0)
+    return pd.read_csv(buf, dtype=str, keep_default_na=False)
+
+
+def load_golden(journal):
+    """Эталонный отчёт журнала (строки CSV) или None, если эталона нет."""
+    path = _golden_path(journal)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def _measure(fn, *args):
+    gc.collect()
+    start = _PeakRSS._statm_mb()
+    t0 = time.perf_counter()
+    with _PeakRSS(0.01) as peak:
+        res = fn(*args)
+    sec = time.perf_counter() - t0
+    mb = peak.peak_private_mb - start[1] if start is not None and peak.peak_private_mb is not None else float("nan")
+    return res, sec, mb
+
+
+def run(cases, engines, goldens=None):
+    """
+    cases — [(название, журнал, кадры)]; возвращает число расхождений.
+    goldens — {журнал: эталон как строки CSV} для журналов без сохранённого эталона.
+    С эталоном (examples/golden или goldens) сверяются все движки; без эталона — с движком pandas.
+    """
+    goldens = goldens or {}
+    engines = ["pandas"] + [e for e in engines if e != "pandas"]
+    total = {name: [0.0, 0.0, 0, 0] for name in engines}   # время, пик памяти, случаев, расхождений
+    n_diff = 0
+    for case, journal, kadry in cases:
+        golden = goldens.get(journal)
+        source = "исходный движок"
+        if golden is None:
+            golden, source = load_golden(journal), "examples/golden"
+        print(f"{case[:34]:<34} эталон: {source if golden is not None else 'pandas'}")
+        ref = None
+        for name in engines:
+            res, sec, mb = _measure(ENGINES[name][0], journal, kadry)
+            if res is None:
+                continue
+            if golden is not None:
+                diffs = diff_reports(golden, _as_text(engine.render_report(res)))
+            elif name == "pandas":
+                ref, diffs = res, []
+            else:
+                diffs = diff_reports(ref, res)
+            t = total[name]
+            t[0], t[1], t[2], t[3] = t[0] + sec, max(t[1], mb), t[2] + 1, t[3] + bool(diffs)
+            status = "совпадает" if not diffs else f"РАСХОЖДЕНИЯ в {len(diffs)} колонках"
+            if golden is None and name == "pandas":
+                status = f"{res.shape[0]} строк"
+            print(f"{'':<34} {name:<8} {sec:8.3f} с {mb:8.1f} МБ   {status}")
+            for col, n, example in diffs:
+                print(f"{'':<45} {col}: {n} строк, {example}")
+            n_diff += bool(diffs)
+
+    print()
+    print(f"{'движок':<10} {'случаев':>8} {'время, с':>10} {'пик, МБ':>9} {'расхождений':>12}")
+    for name, (sec, mb, n, bad) in total.items():
+        print(f"{name:<10} {n:>8} {sec:>10.2f} {mb:>9.1f} {bad:>12}")
+    return n_diff
+
+
+def example_cases():
+    """Случаи с эталоном: журналы examples/ и журналы с трудными случаями."""
+    cases = [
+        (j, os.path.join(EXAMPLES_DIR, j), os.path.join(EXAMPLES_DIR, k))
+        for j, k in EXAMPLES
+        if os.path.exists(os.path.join(EXAMPLES_DIR, j))
+    ]
+    for name, _, n_emp, n_days in EDGE_CASES:
+        j = os.path.join(GOLDEN_DIR, name)
+        if os.path.exists(j):
+            cases.append((f"трудные случаи {name}", j, j.replace(".xlsx", "_kadry.xlsx")))
+    return cases
+
+
+def _load_engine(engine_path):
+    """Движок из файла (исходный engine.py): модуль с build_report(журнал, кадры) -> оформленный отчёт."""
+    spec = importlib.util.spec_from_file_location("engine_golden", engine_path)
+    ref = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(ref)
+    return ref
+
+
+def baseline_golden(ref, journal: pd.DataFrame, kadry: pd.DataFrame):
+    """Эталон синтетического журнала исходным движком ref — по копии журнала и кадров в Excel."""
+    j_xlsx, k_xlsx = io.BytesIO(), io.BytesIO()
+    journal.to_excel(j_xlsx, index=False)
+    kadry.to_excel(k_xlsx, index=False)
+    j_xlsx.seek(0)
+    k_xlsx.seek(0)
+    return _as_text(ref.build_report(j_xlsx, k_xlsx))
+
+
+def save_golden(engine_path):
+    """
+    Эталонные отчёты движком из файла engine_path (build_report(журнал, кадры) -> оформленный отчёт).
+    Журналы с трудными случаями пишутся заново в Excel — его читает и исходный движок.
+    """
+    ref = _load_engine(engine_path)
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for name, seed, n_emp, n_days in EDGE_CASES:
+        journal, kadry = synth_edge_journal(n_emp, n_days, seed)
+        path = os.path.join(GOLDEN_DIR, name)
+        journal.to_excel(path, index=False)
+        kadry.to_excel(path.replace(".xlsx", "_kadry.xlsx"), index=False)
+    for case, journal, kadry in example_cases():
+        with open(journal, "rb") as j, open(kadry, "rb") as k:
+            rendered = ref.build_report(j, k)
+        rendered.to_csv(_golden_path(journal), index=False)
+        print(f"{case}: {len(rendered)} строк -> {_golden_path(journal)}")
+
+
+def main(argv):
+    if argv and argv[0] == "--golden":
+        save_golden(argv[1])
+        return 0
+    ref = None
+    if "--baseline" in argv:
+        i = argv.index("--baseline")
+        if i + 1 >= len(argv):
+            raise RuntimeError("После --baseline укажите файл исходного движка (engine_base.py).")
+        ref = _load_engine(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    seeds = int(argv[0]) if argv and argv[0].isdigit() else 10
+    names = [a for a in argv if not a.isdigit()] or list(ENGINES)
+    unknown = [n for n in names if n not in ENGINES]
+    if unknown:
+        raise RuntimeError(f"Неизвестные движки: {unknown}. Доступны: {list(ENGINES)}.")
+    engines = [n for n in names if ENGINES[n][1] is None or engine._installed(ENGINES[n][1])]
+    for n in sorted(set(names) - set(engines)):
+        print(f"{n}: пакет {ENGINES[n][1]} не установлен — пропуск")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = example_cases()
+        goldens = {}
+        rng = np.random.default_rng(0)
+        for seed in range(seeds):
+            # размер: от пары сотрудников до нескольких сотен
+            n_emp, n_days = int(rng.choice([2, 15, 40, 300])), int(rng.integers(3, 15))
+            j, k, journal, kadry = _write_case(tmp, seed, n_emp, n_days)
+            cases.append((f"синтетика {seed}: {n_emp}×{n_days} {os.path.splitext(j)[1]}", j, k))
+            if ref is not None:
+                goldens[j] = baseline_golden(ref, journal, kadry)
+        return run(cases, engines, goldens)
+
+
+if __name__ == "__main__":
+    if os.environ.get("PYTHONHASHSEED") != HASH_SEED:
+        # порядок сотрудников табеля и то, какое написание ФИО из кадров попадёт в отчёт,
+        # идут от множества ФИО (как в исходном движке) и зависят от хэшей строк:
+        # эталон снят и сверяется при одном и том же PYTHONHASHSEED
+        os.environ["PYTHONHASHSEED"] = HASH_SEED
+        os.execv(sys.executable, [sys.executable, *sys.argv])
+    sys.exit(1 if main(sys.argv[1:]) else 0)
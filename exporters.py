@@ -0,0 +1,100 @@
+import io
+
+import pandas as pd
+
+# === Выгрузка отчёта в Parquet / CSV / Arrow IPC ===
+# Пишем типизированный отчёт (build_report(..., render=False)) как есть:
+# минуты — целые с пропусками, даты — date, время — timestamp.
+# Строковое оформление табеля (render_report) здесь не нужно.
+
+CSV_CHUNK_ROWS = 100_000     # CSV пишем кусками, не собирая весь текст в памяти
+ARROW_BATCH_ROWS = 100_000
+DATE_COLUMNS = ["Дата"]      # в отчёте — полночь дня (datetime64), выгружаем как дату
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet/Arrow нужен пакет pyarrow (pip install pyarrow).")
+    return pa
+
+
+def _arrow_table(typed: pd.DataFrame):
+    pa = _pyarrow()
+    table = pa.Table.from_pandas(typed, preserve_index=False)
+    for c in DATE_COLUMNS:
+        if c in table.column_names:
+            i = table.column_names.index(c)
+            table = table.set_column(i, c, table.column(c).cast(pa.date32()))
+    return table
+
+
+def write_parquet(typed: pd.DataFrame, dest) -> None:
+    """Parquet (путь или бинарный файловый объект)."""
+    _pyarrow()
+    import pyarrow.parquet as pq
+
+    pq.write_table(_arrow_table(typed), dest, compression="zstd")
+
+
+def write_arrow(typed: pd.DataFrame, dest) -> None:
+    """Arrow IPC (файловый формат, .arrow / Feather v2), пачками по ARROW_BATCH_ROWS строк."""
+    pa = _pyarrow()
+    table = _arrow_table(typed)
+    own = isinstance(dest, str)
+    # PythonFile при закрытии закрывает и чужой файловый объект — закрываем только свой
+    sink = pa.OSFile(dest, "wb") if own else pa.PythonFile(dest, mode="w")
+    try:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=ARROW_BATCH_ROWS):
+                writer.write_batch(batch)
+    finally:
+        if own:
+            sink.close()
+
+
+def iter_csv(typed: pd.DataFrame, chunk_rows=CSV_CHUNK_ROWS):
+    """CSV по кускам (str): заголовок с первым куском, дальше только строки."""
+    dates = [c for c in DATE_COLUMNS if c in typed.columns]
+    for start in range(0, max(len(typed), 1), chunk_rows):
+        chunk = typed.iloc[start : start + chunk_rows]
+        if dates:
+            chunk = chunk.assign(**{c: chunk[c].dt.date for c in dates})
+        yield chunk.to_csv(index=False, header=start == 0, date_format="%Y-%m-%d %H:%M:%S")
+
+
+def write_csv(typed: pd.DataFrame, dest, chunk_rows=CSV_CHUNK_ROWS) -> None:
+    """CSV в UTF-8 (путь или бинарный файловый объект), потоково."""
+    own = isinstance(dest, str)
+    fh = open(dest, "wb") if own else dest
+    try:
+        for chunk in iter_csv(typed, chunk_rows):
+            fh.write(chunk.encode("utf-8"))
+    finally:
+        if own:
+            fh.close()
+
+
+# формат -> (функция записи, расширение, MIME)
+EXPORT_FORMATS = {
+    "parquet": (write_parquet, "parquet", "application/vnd.apache.parquet"),
+    "csv": (write_csv, "csv", "text/csv"),
+    "arrow": (write_arrow, "arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def export_report(typed: pd.DataFrame, fmt: str, dest=None):
+    """
+    Выгрузка типизированного отчёта в формате fmt ('parquet' / 'csv' / 'arrow').
+    Если dest не задан — возвращает bytes.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise RuntimeError(f"Неизвестный формат выгрузки '{fmt}'. Доступны: {list(EXPORT_FORMATS)}")
+    write = EXPORT_FORMATS[fmt][0]
+    if dest is not None:
+        write(typed, dest)
+        return None
+    buf = io.BytesIO()
+    write(typed, buf)
+    return buf.getvalue()
@@ -0,0 +1,322 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+import pandas as pd
+
+from exporters import DATE_COLUMNS
+
+# === Очередь заданий на отчёт ===
+# Отчёт по большому журналу считается минутами, поэтому веб-приложение не
+# считает его само: файлы кладутся в каталог задания, строка задания — в
+# SQLite, а считает общий на весь сервер пул процессов (JOB_WORKERS штук).
+# Страница опрашивает статус (этап и долю выполнения) и забирает результат —
+# типизированный отчёт в Parquet. Задание переживает перезагрузку страницы.
+
+JOBS_DIR = os.environ.get(
+    "UMNYI_OTCHET_JOBS",
+    os.path.join(os.path.expanduser("~"), ".cache", "umnyi_otchet", "jobs"),
+)
+JOB_WORKERS = 2
+JOB_TTL_H = 24          # готовые и упавшие задания храним сутки
+CLEANUP_EVERY_S = 600   # очередь живёт со всем сервером — чистим по ходу, не чаще раза в 10 минут
+COPY_CHUNK = 1 << 20    # загрузки пишем на диск кусками, без второй копии в памяти
+PEAK_SAMPLE_S = 0.05    # как часто замеряем память процесса во время расчёта
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id       TEXT PRIMARY KEY,
+    owner    TEXT,
+    status   TEXT NOT NULL,
+    stage    TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    error    TEXT,
+    charged  INTEGER NOT NULL DEFAULT 0,
+    peak_mb  REAL,
+    created  REAL NOT NULL,
+    updated  REAL NOT NULL
+)
+"""
+
+
+@contextmanager
+def _connect(root):
+    """Соединение с таблицей заданий: транзакция на блок, затем закрытие."""
+    con = sqlite3.connect(os.path.join(root, "jobs.sqlite"), timeout=30)
+    con.row_factory = sqlite3.Row
+    try:
+        con.execute("PRAGMA journal_mode=WAL")
+        with con:
+            yield con
+    finally:
+        con.close()
+
+
+def _update(root, job_id, **fields):
+    fields["updated"] = time.time()
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    with _connect(root) as con:
+        con.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+
+class _PeakRSS:
+    """
+    Пик памяти процесса за время блока with, в МБ: peak_mb — RSS целиком,
+    peak_private_mb — без страниц файлов (в т.ч. отображённых mmap входов),
+    которые ОС может вытеснить в любой момент.
+    Процесс пула переиспользуется между заданиями, поэтому пожизненный
+    ru_maxrss не годится — фоновый поток замеряет /proc/self/statm.
+    Где /proc нет, замеры остаются None.
+    """
+
+    def __init__(self, every_s=PEAK_SAMPLE_S):
+        self.every_s = every_s
+        self.peak_mb = None
+        self.peak_private_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _statm_mb():
+        try:
+            with open("/proc/self/statm") as fh:
+                resident, shared = (int(x) for x in fh.read().split()[1:3])
+        except (OSError, ValueError):
+            return None
+        page_mb = os.sysconf("SC_PAGE_SIZE") / 2**20
+        return resident * page_mb, (resident - shared) * page_mb
+
+    def _sample(self):
+        mb = self._statm_mb()
+        if mb is not None:
+            self.peak_mb = max(self.peak_mb or 0.0, mb[0])
+            self.peak_private_mb = max(self.peak_private_mb or 0.0, mb[1])
+
+    def _run(self):
+        while not self._stop.wait(self.every_s):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def _job_dir(root, job_id):
+    return os.path.join(root, job_id)
+
+
+def _input_path(job_dir, kind):
+    """Файл входа kind ('journal'/'kadry'/'shifts') в каталоге задания (с исходным расширением)."""
+    for name in os.listdir(job_dir):
+        if name.split(".", 1)[0] == kind:
+            return os.path.join(job_dir, name)
+    return None
+
+
+def _run_job(root, job_id):
+    """Выполняется в процессе пула: считает отчёт и пишет этапы в таблицу заданий."""
+    from doors import DoorDictionary
+    from engine import progress_fraction
+    from exporters import write_parquet
+    from pipeline import build_report_staged, default_cache
+    from shifts import read_shifts
+
+    job_dir = _job_dir(root, job_id)
+
+    def progress(stage, done, total):
+        # build_report сам прореживает вызовы, так что пишем в таблицу каждый
+        label = f"{stage}: {done} из {total}" if total else stage
+        _update(root, job_id, stage=label, progress=round(0.95 * progress_fraction(stage, done, total), 3))
+
+    peak = _PeakRSS()
+    try:
+        _update(root, job_id, status=RUNNING)
+
+        # входы читаются с диска каталога задания: файлы отображаются в память (mmap)
+        with peak:
+            schedule = None
+            if _input_path(job_dir, "shifts"):
+                with open(_input_path(job_dir, "shifts"), "rb") as fh:
+                    schedule = read_shifts(fh)
+
+            doors = DoorDictionary.load()
+            kadry_path = _input_path(job_dir, "kadry")
+            with open(_input_path(job_dir, "journal"), "rb") as journal, \
+                    (open(kadry_path, "rb") if kadry_path else nullcontext()) as kadry:
+                # тот же журнал с другим кадровым файлом/графиком — этапы журнала берутся из кэша
+                typed = build_report_staged(
+                    journal, kadry, None, schedule, render=False, doors=doors, cache=default_cache(), progress=progress
+                )
+
+            _update(root, job_id, stage="Сохранение", progress=0.95)
+            write_parquet(typed, os.path.join(job_dir, "result.parquet"))
+        try:
+            doors.save()
+        except OSError:
+            pass
+        _update(root, job_id, status=DONE, stage="Готово", progress=1.0, peak_mb=peak.peak_mb)
+    except Exception as e:
+        _update(root, job_id, status=ERROR, error=str(e) or repr(e), peak_mb=peak.peak_mb)
+
+
+class JobQueue:
+    """
+    Очередь заданий в каталоге root. Один экземпляр на процесс сервера
+    (в Streamlit — через st.cache_resource), пул процессов создаётся при первом задании.
+    """
+
+    def __init__(self, root=JOBS_DIR, workers=JOB_WORKERS):
+        self.root = root
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._cleaned_at = 0.0
+        os.makedirs(root, exist_ok=True)
+        with _connect(root) as con:
+            con.execute(_SCHEMA)
+            # таблица от прошлой версии — без замера памяти
+            if "peak_mb" not in [r["name"] for r in con.execute("PRAGMA table_info(jobs)")]:
+                con.execute("ALTER TABLE jobs ADD COLUMN peak_mb REAL")
+            # задания прошлого запуска сервера уже никто не досчитает
+            con.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status IN (?, ?)",
+                (ERROR, "Расчёт прерван перезапуском сервера. Запустите обработку ещё раз.", time.time(), QUEUED, RUNNING),
+            )
+        self.cleanup()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: рабочие процессы не наследуют потоки веб-сервера
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _drop_pool(self, pool):
+        # рабочий процесс убит (например, по нехватке памяти) — такой пул больше
+        # не принимает заданий; следующее задание создаст новый
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _start(self, job_id):
+        for attempt in range(2):
+            pool = self._executor()
+            try:
+                future = pool.submit(_run_job, self.root, job_id)
+            except BrokenProcessPool:
+                self._drop_pool(pool)
+                if attempt:
+                    raise
+                continue
+            future.add_done_callback(partial(self._on_done, pool, job_id))
+            return
+
+    def _on_done(self, pool, job_id, future):
+        # _run_job сам записывает свои ошибки; сюда попадает только гибель процесса
+        exc = future.exception() if not future.cancelled() else RuntimeError("Расчёт отменён.")
+        if exc is None:
+            return
+        if isinstance(exc, BrokenProcessPool):
+            self._drop_pool(pool)
+            error = "Процесс расчёта аварийно завершился (возможно, не хватило памяти). Запустите обработку ещё раз."
+        else:
+            error = str(exc) or repr(exc)
+        with _connect(self.root) as con:
+            con.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ? AND status IN (?, ?)",
+                (ERROR, error, time.time(), job_id, QUEUED, RUNNING),
+            )
+
+    def submit(self, journal, kadry=None, shifts=None, owner=None, charged=False) -> str:
+        """
+        Кладём файлы (файловые объекты с .name или bytes) в каталог задания и ставим его в очередь.
+        Загрузка пишется на диск кусками — второй копии файла в памяти сервера не появляется.
+        charged — за задание уже списан запуск; если оно упадёт, claim_refund разрешит вернуть его.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = _job_dir(self.root, job_id)
+        os.makedirs(job_dir)
+        for kind, f in (("journal", journal), ("kadry", kadry), ("shifts", shifts)):
+            if f is None:
+                continue
+            ext = os.path.splitext(str(getattr(f, "name", "")))[1].lower()
+            with open(os.path.join(job_dir, kind + ext), "wb") as fh:
+                if isinstance(f, bytes):
+                    fh.write(f)
+                else:
+                    try:
+                        f.seek(0)
+                    except Exception:
+                        pass
+                    shutil.copyfileobj(f, fh, COPY_CHUNK)
+
+        now = time.time()
+        with _connect(self.root) as con:
+            con.execute(
+                "INSERT INTO jobs (id, owner, status, stage, charged, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, QUEUED, "В очереди", int(charged), now, now),
+            )
+        self._start(job_id)
+        self._maybe_cleanup()
+        return job_id
+
+    def status(self, job_id):
+        """dict со статусом задания или None, если такого нет."""
+        self._maybe_cleanup()
+        with _connect(self.root) as con:
+            row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def result(self, job_id) -> pd.DataFrame:
+        """Типизированный отчёт готового задания (как build_report(..., render=False))."""
+        path = os.path.join(_job_dir(self.root, job_id), "result.parquet")
+        if not os.path.exists(path):
+            raise RuntimeError("Результат задания не найден.")
+        typed = pd.read_parquet(path)
+        # даты выгружены как date — возвращаем полночь дня, как в отчёте
+        for c in DATE_COLUMNS:
+            if c in typed.columns:
+                typed[c] = pd.to_datetime(typed[c]).astype("datetime64[ns]")
+        return typed
+
+    def claim_refund(self, job_id) -> bool:
+        """True ровно один раз для упавшего задания со списанным запуском — чтобы вернуть его только однажды."""
+        with _connect(self.root) as con:
+            cur = con.execute(
+                "UPDATE jobs SET charged = 0 WHERE id = ? AND status = ? AND charged = 1", (job_id, ERROR)
+            )
+        return cur.rowcount == 1
+
+    def _maybe_cleanup(self):
+        if time.time() - self._cleaned_at >= CLEANUP_EVERY_S:
+            self.cleanup()
+
+    def cleanup(self, max_age_h=JOB_TTL_H):
+        """Удаляет готовые и упавшие задания старше max_age_h вместе с их каталогами."""
+        self._cleaned_at = time.time()
+        limit = time.time() - max_age_h * 3600
+        with _connect(self.root) as con:
+            old = [r["id"] for r in con.execute(
+                "SELECT id FROM jobs WHERE updated < ? AND status IN (?, ?)", (limit, DONE, ERROR)
+            )]
+            con.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in old])
+        for job_id in old:
+            shutil.rmtree(_job_dir(self.root, job_id), ignore_errors=True)
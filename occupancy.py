@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+from engine import (
+    DEFAULT_POLICY,
+    LAB_NONE,
+    LAB_OUT,
+    PreparedJournal,
+    Timeline,
+    _NS_DAY,
+    _NS_HOUR,
+    _NS_MIN,
+    _choose_right_col,
+    _day_windows,
+    read_journal,
+)
+
+# === Заполненность здания по слотам времени ===
+# Сколько людей внутри в каждый 15-минутный слот. Состояние «внутри/снаружи»
+# берём из тех же меток и стартовых состояний, что и посуточный расчёт,
+# но не ходим по сотрудникам: каждый интервал присутствия даёт +1 в момент
+# входа и −1 в момент выхода, все дельты всех сотрудников сортируются по времени,
+# и накопленная сумма — это число людей внутри в любой момент.
+# Интервал ограничен рабочими сутками группы (или окном смены по графику):
+# кто не отметил выход, считается внутри до конца суток — как в day_metrics.
+
+SLOT_MIN = 15
+
+
+def presence_deltas(tl: Timeline, policy=None, schedule=None):
+    """
+    Дельты заполненности по всем группам таймлайна: (время в нс, +1/−1),
+    без сортировки. Повторы одного направления состояние не меняют и дельт не дают.
+    """
+    policy = policy or DEFAULT_POLICY
+    n = len(tl)
+    if not n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8)
+    start, end = _day_windows(tl, policy, schedule)[:2]
+    inside0 = tl.inside_at(start, start).astype(np.int8)
+
+    # понятные события внутри окна своей группы и состояние после каждого
+    grp = np.repeat(np.arange(n), np.diff(tl.offsets))
+    keep = (tl.lab != LAB_NONE) & (tl.t >= start[grp]) & (tl.t <= end[grp])
+    t = tl.t[keep]
+    g = grp[keep]
+    state = (tl.lab[keep] != LAB_OUT).astype(np.int8)
+
+    # состояние до события: предыдущее событие группы или стартовое состояние
+    first = np.r_[True, g[1:] != g[:-1]] if len(g) else np.zeros(0, dtype=bool)
+    prev = np.where(first, inside0[g], np.r_[np.int8(0), state[:-1]])
+
+    # конец окна закрывает интервал, если человек остался внутри
+    cnt = np.bincount(g, minlength=n)
+    last = np.cumsum(cnt) - 1
+    final = np.where(cnt > 0, state[np.maximum(last, 0)] if len(g) else 0, inside0)
+
+    step = state - prev
+    moved = step != 0
+    times = np.concatenate((start[inside0 == 1], t[moved], end[final == 1]))
+    deltas = np.concatenate((
+        np.ones(int(inside0.sum()), dtype=np.int8),
+        step[moved],
+        -np.ones(int((final == 1).sum()), dtype=np.int8),
+    ))
+    return times, deltas
+
+
+def _levels(times, deltas):
+    """
+    Накопленная сумма по отсортированным дельтам: моменты изменения и число людей
+    сразу после них. Одновременные дельты сливаются — берём значение в конце серии.
+    """
+    order = np.argsort(times, kind="stable")
+    t = times[order]
+    level = np.cumsum(deltas[order], dtype=np.int64)
+    if not len(t):
+        return t, level
+    run_end = np.r_[t[1:] != t[:-1], True]
+    return t[run_end], level[run_end]
+
+
+def occupancy_series(tl: Timeline, policy=None, schedule=None, slot_min=SLOT_MIN):
+    """
+    Заполненность по слотам для всех рабочих суток таймлайна.
+    Возвращает (series, peaks):
+      series — строка на слот: Дата (рабочие сутки), Слот (начало), Внутри (людей
+               на начало слота), Максимум (наибольшее число людей за слот);
+      peaks  — строка на сутки: Дата, Пик, Время_пика (первый момент пика).
+    """
+    policy = policy or DEFAULT_POLICY
+    if slot_min <= 0 or (24 * 60) % slot_min:
+        raise RuntimeError(f"Длина слота должна делить сутки на равные части, а не {slot_min} мин.")
+    slot_ns = slot_min * _NS_MIN
+    day_off = policy.day_start_h * _NS_HOUR
+
+    t, level = _levels(*presence_deltas(tl, policy, schedule))
+
+    # рабочие сутки: дни таймлайна и сутки, куда заходят интервалы (ночные смены)
+    days = np.unique(np.concatenate((tl.day_ns // _NS_DAY, (t - day_off) // _NS_DAY)))
+    per_day = 24 * 60 // slot_min
+    slots = (days[:, None] * _NS_DAY + day_off + np.arange(per_day) * slot_ns).ravel()
+
+    # на начало слота — значение после последнего изменения не позже него
+    pos = np.searchsorted(t, slots, side="right") - 1
+    at_start = np.where(pos >= 0, level[np.maximum(pos, 0)], 0)
+
+    # максимум за слот — среди начала слота и изменений внутри него
+    peak = at_start.copy()
+    k = np.searchsorted(slots, t, side="right") - 1
+    inside = (k >= 0) & (t < slots[np.maximum(k, 0)] + slot_ns)
+    np.maximum.at(peak, k[inside], level[inside])
+
+    day_col = np.repeat(days, per_day)
+    series = pd.DataFrame({
+        "Дата": (day_col * _NS_DAY).view("datetime64[ns]"),
+        "Слот": slots.view("datetime64[ns]"),
+        "Внутри": at_start,
+        "Максимум": peak,
+    })
+
+    # пик суток: кандидаты — начала суток и все изменения; первый по времени из наибольших
+    day_start_pos = np.arange(len(days)) * per_day
+    cand_day = np.concatenate((np.arange(len(days)), np.searchsorted(days, (t - day_off) // _NS_DAY)))
+    cand_t = np.concatenate((slots[day_start_pos], t))
+    cand_v = np.concatenate((at_start[day_start_pos], level))
+    best = np.lexsort((cand_t, -cand_v, cand_day))
+    first = best[np.r_[True, cand_day[best][1:] != cand_day[best][:-1]]]
+    peaks = pd.DataFrame({
+        "Дата": (days * _NS_DAY).view("datetime64[ns]"),
+        "Пик": cand_v[first],
+        "Время_пика": cand_t[first].view("datetime64[ns]"),
+    })
+    return series, peaks
+
+
+def build_occupancy(journal_file, policy=None, schedule=None, doors=None, slot_min=SLOT_MIN):
+    """
+    Заполненность здания по журналу: (series, peaks), см. occupancy_series.
+    Колонка направлений выбирается так же, как для отчёта.
+    """
+    policy = policy or DEFAULT_POLICY
+    prepared = PreparedJournal(read_journal(journal_file), doors=doors)
+    right_col = _choose_right_col(prepared, policy, schedule)
+    tl = prepared.timeline(right_col, policy.day_start_h, schedule)
+    return occupancy_series(tl, policy, schedule, slot_min)
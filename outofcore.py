@@ -0,0 +1,215 @@
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    DEFAULT_POLICY,
+    JOURNAL_COLUMNS,
+    PreparedJournal,
+    _clean_journal,
+    _csv_dialect,
+    _csv_header_row,
+    _CSV_SNIFF_BYTES,
+    _finalize,
+    _journal_order,
+    _pick_right_col,
+    _pyarrow,
+    day_metrics,
+    read_kadry,
+    render_report,
+    sniff_format,
+)
+
+# === Обработка больших журналов по частям (out-of-core) ===
+# Журнал за год по крупному зданию не помещается в память целиком.
+# 1) Потоково читаем CSV/Parquet кусками, чистим каждый кусок как read_journal
+#    и раскладываем строки по хэшу ФИО в файлы-разделы на диске.
+# 2) Каждый раздел (все проходы своих сотрудников) читаем целиком и считаем
+#    посуточные метрики — сотрудник целиком лежит в одном разделе.
+# 3) Посуточные строки (их мало: сотрудники × дни) склеиваем и собираем отчёт.
+# Размер кусков и число разделов задаются бюджетом памяти, а не размером файла.
+
+MEMORY_BUDGET_MB = 512
+ROW_BYTES = 2_000        # пик памяти на строку журнала при разборе и расчёте (с запасом)
+CSV_LINE_BYTES = 100     # средняя длина строки CSV — для оценки числа строк по размеру файла
+
+PARTITION_COLUMNS = ["ФИО", "Дата события", "Рабочий_день", "Вход", "Выход"]
+
+
+def _partition_schema():
+    pa = _pyarrow()
+    return pa.schema([
+        ("ФИО", pa.string()),
+        ("Дата события", pa.timestamp("ns")),
+        ("Рабочий_день", pa.int32()),
+        ("Вход", pa.string()),
+        ("Выход", pa.string()),
+    ])
+
+
+def _budget_rows(memory_mb) -> int:
+    return max(1_000, int(memory_mb * 2**20 // ROW_BYTES))
+
+
+def _estimate_rows(path, fmt) -> int:
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    return os.path.getsize(path) // CSV_LINE_BYTES + 1
+
+
+def _iter_raw_chunks(path, fmt, chunk_rows):
+    """Сырые куски журнала (колонки JOURNAL_COLUMNS) не больше ~chunk_rows строк."""
+    pa = _pyarrow()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        columns = [n for n in pf.schema_arrow.names if n.strip() in JOURNAL_COLUMNS]
+        if not set(JOURNAL_COLUMNS).issubset(c.strip() for c in columns):
+            raise RuntimeError(f"Не удалось прочитать журнал: не найдены нужные колонки (ожидались: {JOURNAL_COLUMNS}).")
+        for batch in pf.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas().rename(columns=str.strip)
+        return
+
+    if fmt != "csv":
+        raise RuntimeError("Потоковая обработка поддерживает журналы в CSV и Parquet. Сохраните Excel-журнал как CSV.")
+
+    from pyarrow import csv as pa_csv
+
+    with open(path, "rb") as fh:
+        head = fh.read(_CSV_SNIFF_BYTES + 1)
+    encoding, delimiter = _csv_dialect(head)
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(
+            skip_rows=_csv_header_row(head, "Дата события"),
+            encoding=encoding,
+            block_size=max(1 << 20, chunk_rows * CSV_LINE_BYTES),
+        ),
+        parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=JOURNAL_COLUMNS,
+            column_types={c: pa.string() for c in JOURNAL_COLUMNS if c != "Дата события"},
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def _partition(path, fmt, out_dir, n_parts, chunk_rows) -> list:
+    """Раскладываем очищенный журнал по n_parts файлам по хэшу ФИО. Возвращает пути разделов."""
+    import pyarrow.parquet as pq
+
+    pa = _pyarrow()
+    schema = _partition_schema()
+    writers = {}
+    try:
+        for raw in _iter_raw_chunks(path, fmt, chunk_rows):
+            df = _clean_journal(raw)[PARTITION_COLUMNS]
+            if df.empty:
+                continue
+            part = pd.util.hash_array(df["ФИО"].to_numpy(dtype=object)) % np.uint64(n_parts)
+            for p in np.unique(part):
+                if p not in writers:
+                    writers[p] = pq.ParquetWriter(os.path.join(out_dir, f"part_{int(p):05d}.parquet"), schema)
+                table = pa.Table.from_pandas(df[part == p], schema=schema, preserve_index=False)
+                writers[p].write_table(table)
+    finally:
+        for w in writers.values():
+            w.close()
+    return [os.path.join(out_dir, f"part_{int(p):05d}.parquet") for p in sorted(writers)]
+
+
+def _read_partition(path) -> PreparedJournal:
+    import pyarrow.parquet as pq
+
+    df = pq.read_table(path).to_pandas()
+    df = df.iloc[_journal_order(df)].reset_index(drop=True)
+    return PreparedJournal(df)
+
+
+def _partition_days(parts, cols, policy, schedule) -> dict:
+    """Посуточные метрики по всем разделам для каждой колонки из cols: {col: DataFrame}."""
+    days = {col: [] for col in cols}
+    for path in parts:
+        prepared = _read_partition(path)
+        for col in cols:
+            days[col].append(day_metrics(prepared.timeline(col, policy.day_start_h, schedule), policy, schedule))
+        del prepared
+    # порядок строк как у журнала целиком: ФИО, затем дата
+    return {
+        col: pd.concat(frames, ignore_index=True).sort_values(["ФИО", "Дата"], kind="stable").reset_index(drop=True)
+        for col, frames in days.items()
+    }
+
+
+def _partition_scores(parts) -> dict:
+    import pyarrow.parquet as pq
+
+    scores = {"Вход": (0, 0), "Выход": (0, 0)}
+    for path in parts:
+        # метки дверей считаем без сортировки: нужны только суммы
+        part = PreparedJournal(pq.read_table(path, columns=["Вход", "Выход"]).to_pandas())
+        for col, (good, office) in part.scores.items():
+            scores[col] = (scores[col][0] + good, scores[col][1] + office)
+    return scores
+
+
+def build_report_ooc(
+    journal_path,
+    kadry_file=None,
+    policy=None,
+    schedule=None,
+    memory_mb=MEMORY_BUDGET_MB,
+    tmp_dir=None,
+    render=True,
+) -> pd.DataFrame:
+    """
+    build_report для журналов, не помещающихся в память.
+    journal_path — путь к журналу в CSV или Parquet; memory_mb — бюджет памяти:
+    по нему выбираются размер кусков чтения и число разделов на диске.
+    Бюджет ограничивает память под события журнала; сверх него — сам процесс
+    с библиотеками и посуточные строки (сотрудники × дни), которые собираются целиком.
+    Результат совпадает с build_report на том же журнале.
+    Разделы пишутся во временный каталог внутри tmp_dir и удаляются по завершении.
+    """
+    policy = policy or DEFAULT_POLICY
+    journal_path = os.fspath(journal_path)
+    with open(journal_path, "rb") as fh:
+        fmt = sniff_format(fh.read(8))
+
+    chunk_rows = _budget_rows(memory_mb)
+    n_parts = max(1, math.ceil(_estimate_rows(journal_path, fmt) / chunk_rows))
+
+    work_dir = tempfile.mkdtemp(prefix="umnyi_otchet_", dir=tmp_dir)
+    try:
+        parts = _partition(journal_path, fmt, work_dir, n_parts, chunk_rows)
+        if not parts:
+            raise RuntimeError("В журнале не найдено ни одного прохода сотрудников.")
+
+        scores = _partition_scores(parts)
+        fallback = {}
+
+        def _total_outside(col):
+            # страховочный случай (мало распознанных меток) — считаем обе колонки
+            if not fallback:
+                fallback.update(_partition_days(parts, ["Вход", "Выход"], policy, schedule))
+            return fallback[col]["Вне_ядра_мин"].sum()
+
+        right_col = _pick_right_col(scores, _total_outside)
+        days = fallback.get(right_col)
+        if days is None:
+            days = _partition_days(parts, [right_col], policy, schedule)[right_col]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    kadry_dates = read_kadry(kadry_file) if kadry_file is not None else None
+    typed = _finalize(days, kadry_dates, policy)
+    return render_report(typed) if render else typed
@@ -0,0 +1,316 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from engine import (
+    DEFAULT_POLICY,
+    INSIDE_HINTS,
+    OUTSIDE_HINTS,
+    PreparedJournal,
+    _absence_reasons,
+    _as_progress,
+    _calendar_fill,
+    _choose_right_col,
+    _day_totals,
+    _read_file_bytes,
+    _typed_report,
+    day_metrics,
+    read_journal,
+    read_kadry,
+    render_report,
+)
+
+# === Отчёт как цепочка этапов с кэшем результатов ===
+# build_report — это этапы: разбор журнала → разметка дверей → посуточные
+# метрики → итоги недели → сетка табеля → причины отсутствия → оформление.
+# Результат каждого этапа запоминается по ключу — хэшу ключей его входов и
+# параметров. Повторный запуск с тем же журналом и новым кадровым файлом
+# берёт журнал, разметку и метрики из кэша и пересчитывает только хвост.
+# Кэш — в памяти процесса (последние результаты в пределах STAGE_MEMORY_MB) и на
+# диске (STAGE_CACHE_DIR, pickle, не больше STAGE_DISK_MB), чтобы его видели и
+# процессы пула заданий. Крупные этапы с журналом целиком процессы пула держат
+# только на диске: рабочий процесс живёт долго, и память между заданиями не копится.
+
+STAGE_CACHE_DIR = os.environ.get(
+    "UMNYI_OTCHET_STAGES",
+    os.path.join(os.path.expanduser("~"), ".cache", "umnyi_otchet", "stages"),
+)
+STAGE_MEMORY_MB = 256    # результаты этапов в памяти процесса
+STAGE_DISK_MB = int(os.environ.get("UMNYI_OTCHET_STAGES_MB", 2048))   # файлы кэша на диске
+STAGE_TTL_H = 24         # файлы кэша на диске храним сутки
+DISK_ONLY_STAGES = ("journal", "labels")   # журнал целиком — в памяти пула не держим
+HASH_CHUNK = 1 << 24     # файл хэшируем кусками — mmap не подгружается целиком
+# Версия логики этапов — входит в ключ каждого этапа. Ключ видит только входы,
+# а не код: после любого изменения расчёта этапов (здесь или в engine) или
+# формата их результатов увеличьте её, иначе дисковый кэш вернёт старые результаты.
+PIPELINE_VERSION = 1
+
+# этап: входы (другие этапы или параметры запуска), этап прогресса при пересчёте
+STAGES = {
+    "journal":  (("journal_file",), "Чтение журнала"),
+    "labels":   (("journal", "doors"), "Разметка дверей"),
+    "days":     (("labels", "policy", "schedule"), "Расчёт по сотрудникам"),
+    "weekly":   (("days", "policy"), "Сборка отчёта"),
+    "kadry":    (("kadry_file",), "Кадровый файл"),
+    "calendar": (("weekly", "kadry"), None),
+    "absences": (("calendar", "kadry"), None),
+    "render":   (("absences",), None),
+}
+
+
+def _stage_days(prepared, policy, schedule, progress=None):
+    right_col = _choose_right_col(prepared, policy, schedule)
+    tl = prepared.timeline(right_col, policy.day_start_h, schedule)
+    return day_metrics(tl, policy, schedule, progress)
+
+
+def _run_stage(name, v, p, progress):
+    if name == "journal":
+        return read_journal(p["journal_file"])
+    if name == "labels":
+        return PreparedJournal(v["journal"], doors=p["doors"])
+    if name == "days":
+        return _stage_days(v["labels"], p["policy"], p["schedule"], progress)
+    if name == "weekly":
+        return _day_totals(v["days"], p["policy"])
+    if name == "kadry":
+        return read_kadry(p["kadry_file"]) if p["kadry_file"] is not None else None
+    if name == "calendar":
+        return _calendar_fill(v["weekly"], v["kadry"])
+    if name == "absences":
+        return _typed_report(_absence_reasons(v["calendar"], v["kadry"]))
+    if name == "render":
+        return render_report(v["absences"])
+    raise RuntimeError(f"Неизвестный этап отчёта: {name}")
+
+
+# === Ключи ===
+
+def _digest(*parts) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, bytes):
+            part = repr(part).encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def _file_key(file_obj):
+    """Хэш содержимого файла (None — файла нет)."""
+    if file_obj is None:
+        return "нет"
+    content = _read_file_bytes(file_obj)
+    h = hashlib.blake2b(digest_size=16)
+    view = memoryview(content)
+    for i in range(0, len(view), HASH_CHUNK):
+        h.update(view[i:i + HASH_CHUNK])
+    view.release()
+    if hasattr(content, "close"):
+        content.close()
+    return h.hexdigest()
+
+
+def _doors_key(doors):
+    # разметка зависит от подсказок и от поправленных руками дверей словаря площадки.
+    # Двери, которые словарь запомнил сам, совпадают с подсказками и в ключ не входят:
+    # этап разметки пополняет словарь, и ключ следующего такого же запуска не должен меняться
+    edited = sorted(doors.overrides().items()) if doors is not None else None
+    return _digest(INSIDE_HINTS, OUTSIDE_HINTS, edited)
+
+
+def _schedule_key(schedule):
+    if schedule is None:
+        return "нет"
+    hashed = pd.util.hash_pandas_object(schedule.shifts, index=False).to_numpy()
+    return _digest(list(schedule.shifts.columns), hashed.tobytes())
+
+
+def stage_keys(params) -> dict:
+    """Ключи параметров запуска и всех этапов (STAGES) — без вычисления самих этапов."""
+    keys = {
+        "journal_file": _file_key(params["journal_file"]),
+        "kadry_file": _file_key(params["kadry_file"]),
+        "doors": _doors_key(params["doors"]),
+        "policy": _digest(params["policy"]),
+        "schedule": _schedule_key(params["schedule"]),
+    }
+    for name, (inputs, _) in STAGES.items():
+        # имя этапа в начале ключа — по нему кэш решает, держать ли результат в памяти
+        keys[name] = f"{name}-{_digest(PIPELINE_VERSION, name, *(keys[i] for i in inputs))}"
+    return keys
+
+
+# === Кэш ===
+
+def _nbytes(value) -> int:
+    """Примерный размер результата этапа в памяти."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, PreparedJournal):
+        return _nbytes(value.df) + sum(int(lab.nbytes) for lab in value.labels.values())
+    return 0
+
+
+class StageCache:
+    """
+    Результаты этапов по ключу: в памяти (LRU на memory_mb) и, если задан root, на диске
+    (не больше disk_mb: сначала удаляются просроченные, затем давно не использованные).
+    disk_only — этапы, которые в памяти не держим (только на диске).
+    last_run — {этап: True, если взят из кэша} последнего запуска build_report_staged.
+    """
+
+    def __init__(self, root=STAGE_CACHE_DIR, memory_mb=STAGE_MEMORY_MB, disk_mb=STAGE_DISK_MB, disk_only=()):
+        self.root = root
+        self.memory_bytes = memory_mb * 2**20
+        self.disk_bytes = disk_mb * 2**20
+        self.disk_only = tuple(disk_only)
+        self._mem = OrderedDict()   # ключ -> (результат, байт)
+        self._mem_total = 0
+        self.last_run = {}
+        if root:
+            os.makedirs(root, exist_ok=True)
+            self.cleanup()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key):
+        """(True, результат) или (False, None)."""
+        if key in self._mem:
+            self._mem.move_to_end(key)
+            return True, self._mem[key][0]
+        if self.root:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as fh:
+                    value = pickle.load(fh)
+                os.utime(path)   # время файла — время последнего использования
+            except (OSError, EOFError, pickle.UnpicklingError):
+                return False, None
+            self._remember(key, value)
+            return True, value
+        return False, None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if not self.root:
+            return
+        # пишем во временный файл и подменяем — параллельные задания не видят половину файла
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        # процессы пула живут долго — чистим при каждой записи, а не только при создании
+        self.cleanup()
+
+    def _remember(self, key, value):
+        if key.split("-", 1)[0] in self.disk_only:
+            return
+        size = _nbytes(value)
+        if size > self.memory_bytes:
+            return
+        if key in self._mem:
+            self._mem_total -= self._mem.pop(key)[1]
+        self._mem[key] = (value, size)
+        self._mem_total += size
+        while self._mem_total > self.memory_bytes:
+            self._mem_total -= self._mem.popitem(last=False)[1][1]
+
+    def clear(self):
+        self._mem.clear()
+        self._mem_total = 0
+        if self.root:
+            self.cleanup(max_age_h=0)
+
+    def cleanup(self, max_age_h=STAGE_TTL_H):
+        """Удаляет просроченные файлы, затем самые давние, пока кэш на диске больше disk_mb."""
+        limit = time.time() - max_age_h * 3600
+        files = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+                if st.st_mtime <= limit:
+                    os.remove(path)
+                elif name.endswith(".pkl"):
+                    files.append((st.st_mtime, st.st_size, path))
+            except OSError:
+                pass
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+_DEFAULT_CACHE = None
+
+
+def default_cache() -> StageCache:
+    """Общий кэш этапов процесса (каталог STAGE_CACHE_DIR); журнал целиком — только на диске."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = StageCache(disk_only=DISK_ONLY_STAGES)
+    return _DEFAULT_CACHE
+
+
+# === Запуск ===
+
+def build_report_staged(
+    journal_file, kadry_file=None, policy=None, schedule=None, render=True, doors=None, cache=None, progress=None
+) -> pd.DataFrame:
+    """
+    То же, что engine.build_report, но по этапам STAGES с кэшем результатов.
+    Ключи этапов считаются сразу по входам (хэши файлов, политика, график, словарь дверей),
+    а сами этапы — только те, которых нет в кэше, и только если они нужны
+    для результата: если в кэше есть посуточные метрики, журнал не читается вовсе.
+    cache — StageCache (по умолчанию default_cache()).
+    """
+    cache = cache if cache is not None else default_cache()
+    progress = _as_progress(progress)
+    params = {
+        "journal_file": journal_file,
+        "kadry_file": kadry_file,
+        "policy": policy or DEFAULT_POLICY,
+        "schedule": schedule,
+        "doors": doors,
+    }
+    keys = stage_keys(params)
+    values = {}
+    cache.last_run = {}
+
+    def pull(name):
+        if name in values:
+            return values[name]
+        hit, value = cache.get(keys[name])
+        if not hit:
+            inputs, stage = STAGES[name]
+            deps = {i: pull(i) for i in inputs if i in STAGES}
+            if progress is not None and stage is not None:
+                progress.stage(stage)
+            value = _run_stage(name, deps, params, progress)
+            cache.put(keys[name], value)
+        cache.last_run[name] = hit
+        values[name] = value
+        return value
+
+    # из кэша отдаём копию: вызывающий код может менять таблицу
+    return pull("render" if render else "absences").copy()
@@ -0,0 +1,315 @@
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+from engine import (
+    DAY_START_H,
+    DEFAULT_POLICY,
+    JOURNAL_COLUMNS,
+    LAB_IN,
+    LAB_NONE,
+    Timeline,
+    _as_progress,
+    _calendar_days,
+    _calendar_fio,
+    _csv_dialect,
+    _csv_header_row,
+    _NS_DAY,
+    _NS_HOUR,
+    _pick_right_col,
+    _read_file_bytes,
+    _read_journal_sheets,
+    _typed_report,
+    _uncontrolled,
+    day_metrics,
+    door_labels,
+    excel_backend,
+    fio_match_key,
+    fio_short_key,
+    is_nonperson,
+    norm,
+    read_kadry,
+    render_report,
+    smart_parse_date,
+    sniff_format,
+)
+
+# === Движок отчёта на Polars ===
+# Тот же отчёт, что engine.build_report, но табличная часть — на Polars:
+# многопоточное чтение CSV/Parquet (scan_* с проекцией колонок), чистка
+# журнала выражениями, сортировка по (ФИО, Рабочий_день, время), итоги недели
+# оконными выражениями по (ФИО, неделя), сетка табеля и причины отсутствия —
+# соединениями (join). Правила, которые считаются на уникальное значение
+# (нормализация события, подсказки дверей, «не человек»), берутся из engine.
+# Посуточный автомат состояний «внутри/снаружи» последователен и в выражения
+# не ложится — его считает то же ядро engine.day_metrics (numba/python)
+# по плоским массивам, собранным из кадра Polars.
+# Результат совпадает с pandas-движком (бенчмарк polars сверяет оба).
+
+_TEXT_COLUMNS = [c for c in JOURNAL_COLUMNS if c != "Дата события"]
+_ISO_FORMATS = ("%Y-%m-%d %H:%M:%S%.f", "%Y-%m-%dT%H:%M:%S%.f")
+_NUMBER = re.compile(r"^[+-]?\d+(?:\.\d*)?$")
+
+
+def _pl():
+    try:
+        import polars
+    except ImportError:
+        raise RuntimeError("Для движка polars нужен пакет polars (pip install polars).")
+    return polars
+
+
+def _by_unique(pl, col, fn, dtype):
+    """Выражение: fn(значение) для каждой строки колонки, fn считается один раз на уникальное значение."""
+    def apply(s):
+        uniques = s.unique().drop_nulls()
+        return s.replace_strict(uniques, [fn(u) for u in uniques.to_list()], default=None, return_dtype=dtype)
+
+    return pl.col(col).map_batches(apply, return_dtype=dtype)
+
+
+# === Чтение журнала ===
+
+def _scan_raw(content, backend=None):
+    """Сырые колонки журнала (LazyFrame): текст — строками, «Дата события» — как есть."""
+    pl = _pl()
+    fmt = sniff_format(content)
+    path = getattr(content, "path", None)
+    if fmt == "parquet":
+        lf = pl.scan_parquet(path) if path else pl.read_parquet(io.BytesIO(content)).lazy()
+        return lf.select(JOURNAL_COLUMNS).with_columns(pl.col(_TEXT_COLUMNS).cast(pl.String))
+    if fmt == "csv":
+        encoding, delimiter = _csv_dialect(content)
+        skip = _csv_header_row(content, "Дата события")
+        opts = dict(separator=delimiter, skip_rows=skip, infer_schema=False)
+        if encoding == "utf8" and path:
+            lf = pl.scan_csv(path, **opts)
+        else:
+            data = bytes(content)
+            if encoding != "utf8":
+                data = data.decode(encoding).encode("utf-8")
+            lf = pl.read_csv(io.BytesIO(data), **opts).lazy()
+        return lf.select(JOURNAL_COLUMNS)
+
+    # Excel читает pandas (движок по формату); текст — как str(), дата — как в _clean_journal
+    raw = _read_journal_sheets(content, engine=excel_backend(fmt, backend))
+    if raw is None:
+        return None
+    raw = raw[JOURNAL_COLUMNS].copy()
+    for c in _TEXT_COLUMNS:
+        raw[c] = raw[c].map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+    if not pd.api.types.is_datetime64_dtype(raw["Дата события"]):
+        raw["Дата события"] = raw["Дата события"].apply(smart_parse_date)
+    raw["Дата события"] = raw["Дата события"].to_numpy(dtype="datetime64[ns]")
+    return pl.from_pandas(raw).lazy()
+
+
+def _parse_times(pl, df):
+    """«Дата события» -> Datetime(ns): ISO — выражением, остальное — smart_parse_date на уникальное значение."""
+    col = df["Дата события"]
+    if col.dtype.is_temporal():
+        return df.with_columns(pl.col("Дата события").cast(pl.Datetime("ns")))
+    s = col.cast(pl.String).str.strip_chars()
+    iso = pl.coalesce([pl.col("s").str.strptime(pl.Datetime("ns"), f, strict=False) for f in _ISO_FORMATS])
+    parsed = pl.DataFrame({"s": s}).select(iso.alias("t"))["t"]
+
+    rest = s.filter(parsed.is_null()).unique().drop_nulls()
+    if len(rest):
+        values = rest.to_list()
+        if all(_NUMBER.match(v) for v in s.drop_nulls().to_list()):
+            # как pyarrow: колонка из одних чисел — серийные даты Excel
+            stamps = [smart_parse_date(float(v)) for v in values]
+        else:
+            stamps = [smart_parse_date(v) for v in values]
+        stamps = pl.Series(pd.to_datetime(pd.Series(stamps, dtype=object)).to_numpy(dtype="datetime64[ns]"))
+        parsed = parsed.fill_null(s.replace_strict(rest, stamps, default=None, return_dtype=pl.Datetime("ns")))
+    return df.with_columns(parsed.alias("Дата события"))
+
+
+def read_journal_polars(file_obj, backend=None, day_start_h=DAY_START_H):
+    """
+    Журнал как polars.DataFrame: ФИО, Дата события, Рабочий_день, Вход, Выход,
+    отсортированный по (ФИО, Рабочий_день, Дата события) — те же строки, что read_journal.
+    """
+    pl = _pl()
+    content = _read_file_bytes(file_obj)
+    try:
+        lf = _scan_raw(content, backend)
+        df = lf.collect() if lf is not None else None
+    except (pl.exceptions.ColumnNotFoundError, pl.exceptions.ComputeError):
+        df = None
+    if df is None:
+        raise RuntimeError(
+            "Не удалось прочитать журнал: не найдены нужные колонки "
+            f"(ожидались: {JOURNAL_COLUMNS}). Проверьте формат файла."
+        )
+
+    keep_event = _by_unique(pl, "Событие", lambda v: "проход по идентификатору" in norm(v), pl.Boolean)
+    parts = [pl.col(c).fill_null("").str.strip_chars() for c in ("Фамилия", "Имя", "Отчество")]
+    df = df.lazy().filter(keep_event.fill_null(False)).with_columns(
+        pl.concat_str(parts, separator=" ").str.replace_all(r"\s+", " ").str.strip_chars().alias("ФИО")
+    ).collect()
+    df = _parse_times(pl, df).filter(pl.col("Дата события").is_not_null())
+
+    def uncontrolled(col):
+        return _by_unique(pl, col, lambda v: bool(_uncontrolled([v])[0]), pl.Boolean).fill_null(False)
+
+    day_off = day_start_h * _NS_HOUR
+    return (
+        df.lazy()
+        .filter(~(uncontrolled("Вход") & uncontrolled("Выход")))
+        .filter(~_by_unique(pl, "ФИО", is_nonperson, pl.Boolean))
+        .select(
+            "ФИО",
+            "Дата события",
+            ((pl.col("Дата события").dt.epoch("ns") - day_off) // _NS_DAY).cast(pl.Int32).alias("Рабочий_день"),
+            "Вход",
+            "Выход",
+        )
+        .sort(["ФИО", "Рабочий_день", "Дата события"], maintain_order=True)
+        .collect()
+    )
+
+
+# === Разметка и посуточный расчёт ===
+
+def _labels(pl, df, col, doors=None):
+    """Метки направлений по колонке дверей (int8) и «качество» колонки, как door_scores."""
+    uniques = df[col].unique().drop_nulls()
+    table = doors.classify(uniques.to_list()) if doors is not None else door_labels(uniques.to_list())
+    lab = df[col].replace_strict(uniques, table.tolist(), default=LAB_NONE, return_dtype=pl.Int8).to_numpy()
+    counts = np.bincount(lab, minlength=4)
+    return lab, (int(counts[1:].sum()), int(counts[LAB_IN] + counts[3]))
+
+
+def _timeline(df, lab) -> Timeline:
+    # ФИО подряд (кадр отсортирован) — номер серии и есть код категории
+    codes = df["ФИО"].rle_id().to_numpy()
+    names = df["ФИО"].unique(maintain_order=True).to_list()
+    frame = pd.DataFrame({
+        "ФИО": pd.Categorical.from_codes(codes, names),
+        "Дата события": df["Дата события"].to_numpy(),
+        "Рабочий_день": df["Рабочий_день"].to_numpy(),
+    })
+    return Timeline(frame, lab)
+
+
+def _work_days(pl, df, policy, schedule):
+    """Рабочие дни по графику смен (если задан) и повторная сортировка."""
+    if schedule is None:
+        return df
+    wd = schedule.work_days(df["ФИО"].to_numpy(), df["Дата события"].dt.epoch("ns").to_numpy(), policy.day_start_h)
+    return df.with_columns(pl.Series("Рабочий_день", wd.astype(np.int32))).sort(
+        ["ФИО", "Рабочий_день", "Дата события"], maintain_order=True
+    )
+
+
+# === Сборка отчёта ===
+
+def _day_totals(pl, days, policy):
+    """engine._day_totals выражениями: итоги дня, неделя — окном по (ФИО, понедельник)."""
+    incomplete = pl.col("events_cnt") == 1
+    span = pl.when(incomplete).then(0).otherwise(pl.col("Продолжительность_мин"))
+    outside = pl.when(incomplete).then(0).otherwise(pl.col("Вне_ядра_мин"))
+    days = days.with_columns(
+        incomplete.alias("incomplete"),
+        (pl.col("suspect") & ~incomplete).alias("suspect"),
+        span.alias("Продолжительность_мин"),
+        outside.alias("Вне_ядра_мин"),
+        pl.col("Дата").dt.truncate("1w").alias("week_monday"),
+    )
+    small = pl.col("Продолжительность_мин") < policy.short_shift_min
+    over_allowance = (pl.col("Вне_ядра_мин") - policy.outside_allowance_min).clip(lower_bound=0)
+    lunch = pl.when(small).then(0).otherwise(policy.lunch_min)
+    penalty = pl.when(small).then(0).otherwise(over_allowance)
+    days = days.with_columns(
+        (pl.col("Продолжительность_мин") - lunch - penalty).clip(lower_bound=0).alias("Итого_дня_мин"),
+        over_allowance.alias("Недоработки_мин"),
+    )
+    week = ["ФИО", "week_monday"]
+    week_sum = pl.col("Итого_дня_мин").sum().over(week)
+    last_day = pl.col("Дата") == pl.col("Дата").max().over(week)
+    return days.with_columns(
+        pl.when(last_day & (week_sum > 0)).then(week_sum).otherwise(0).alias("Итого_нед_мин")
+    ).drop("week_monday")
+
+
+def _fio_key_col(pl, col, key_fn, name):
+    return _by_unique(pl, col, key_fn, pl.String).fill_null("").alias(name)
+
+
+def _calendar_and_absences(pl, final, kadry_dates):
+    """engine._calendar_fill + engine._absence_reasons: сетка ФИО × Пн–Пт и причины — соединениями."""
+    days_present = _calendar_days(final["Дата"].max())
+    all_fio = _calendar_fio(final["ФИО"].drop_nulls().to_list(), kadry_dates, days_present)
+    base = pl.DataFrame({
+        "ФИО": pl.Series(np.repeat(np.array(all_fio, dtype=object), len(days_present)), dtype=pl.String),
+        "Дата": pl.Series(np.tile(days_present.to_numpy(), len(all_fio))).cast(pl.Datetime("ns")),
+    })
+    out = base.join(final, on=["ФИО", "Дата"], how="left", maintain_order="left")
+
+    if kadry_dates is None or kadry_dates.empty:
+        return out.with_columns(pl.lit("").alias("Причина отсутствия"))
+
+    kd = pl.DataFrame({
+        "ФИО": pl.Series(kadry_dates["ФИО"].to_numpy(dtype=object), dtype=pl.String),
+        "Дата": pl.Series(kadry_dates["Дата"].to_numpy(dtype="datetime64[ns]")),
+        "Тип": pl.Series(kadry_dates["Тип"].to_numpy(dtype=object), dtype=pl.String),
+    })
+    keys = [_fio_key_col(pl, "ФИО", fio_match_key, "key_full"), _fio_key_col(pl, "ФИО", fio_short_key, "key_short")]
+    kd = kd.with_columns(keys)
+    out = out.with_columns(keys)
+
+    m1 = kd.select("key_full", "Дата", "Тип").unique(maintain_order=True)
+    m2 = kd.select("key_short", "Дата", pl.col("Тип").alias("Тип2")).unique(["key_short", "Дата"], keep="first", maintain_order=True)
+    out = (
+        out.join(m1, on=["key_full", "Дата"], how="left", maintain_order="left")
+        .join(m2, on=["key_short", "Дата"], how="left", maintain_order="left")
+    )
+    return out.with_columns(
+        pl.coalesce("Тип", "Тип2").fill_null("").alias("Причина отсутствия")
+    ).drop("Тип", "Тип2", "key_full", "key_short")
+
+
+def build_report_polars(
+    journal_file, kadry_file=None, policy=None, schedule=None, render=True, doors=None, progress=None, kernel=None
+) -> pd.DataFrame:
+    """
+    engine.build_report на Polars (параметры те же); результат — pandas.DataFrame,
+    такой же, как у pandas-движка. kernel — ядро посуточного расчёта (engine.day_kernel).
+    """
+    pl = _pl()
+    policy = policy or DEFAULT_POLICY
+    progress = _as_progress(progress)
+
+    if progress is not None:
+        progress.stage("Чтение журнала")
+    df = read_journal_polars(journal_file, day_start_h=policy.day_start_h if schedule is None else DAY_START_H)
+    df = _work_days(pl, df, policy, schedule)
+
+    if progress is not None:
+        progress.stage("Разметка дверей")
+    labels = {col: _labels(pl, df, col, doors) for col in ("Вход", "Выход")}
+
+    kadry_dates = None
+    if kadry_file is not None:
+        if progress is not None:
+            progress.stage("Кадровый файл")
+        kadry_dates = read_kadry(kadry_file)
+
+    def total_outside(col):
+        return day_metrics(_timeline(df, labels[col][0]), policy, schedule, kernel=kernel)["Вне_ядра_мин"].sum()
+
+    right_col = _pick_right_col({col: v[1] for col, v in labels.items()}, total_outside)
+    if progress is not None:
+        progress.stage("Расчёт по сотрудникам")
+    days = day_metrics(_timeline(df, labels[right_col][0]), policy, schedule, progress, kernel=kernel)
+
+    if progress is not None:
+        progress.stage("Сборка отчёта")
+    final = _day_totals(pl, pl.from_pandas(days), policy)
+    final = _calendar_and_absences(pl, final, kadry_dates)
+    typed = _typed_report(final.to_pandas())
+    return render_report(typed) if render else typed
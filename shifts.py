@@ -0,0 +1,209 @@
+import re
+from datetime import datetime, time
+
+import numpy as np
+import pandas as pd
+
+from engine import _content_source, _read_file_bytes, excel_backend, fio_match_key, fio_short_key, smart_parse_date, sniff_format
+
+# === Графики смен ===
+# Файл графика: строка заголовков с колонками
+#   'Сотрудник', 'Дата' (или 'с' / 'до' для диапазона), 'Начало', 'Конец'.
+# Если 'Конец' <= 'Начало' — смена ночная и заканчивается на следующий день.
+
+SHIFT_LEAD_MIN = 180   # рабочие сутки смены начинаются за 3 часа до её начала
+SHIFT_TAIL_MIN = 180   # ...и не раньше, чем через 3 часа после конца предыдущей смены
+
+_DAY_MIN = 24 * 60
+_NS_MIN = 60 * 10**9
+
+
+def _clock_min(x):
+    """'22:00' / time / datetime / доля суток Excel -> минуты от полуночи (NaN при неуспехе)."""
+    if x is None or (isinstance(x, float) and pd.isna(x)):
+        return np.nan
+    if isinstance(x, (datetime, pd.Timestamp, time)):
+        return x.hour * 60 + x.minute
+    if isinstance(x, (int, float)):
+        # Excel хранит время как долю суток; целые 0..24 — считаем часами
+        if 0 <= x < 1:
+            return int(round(x * _DAY_MIN))
+        if 1 <= x <= 24 and float(x).is_integer():
+            return int(x) * 60
+        return np.nan
+    m = re.fullmatch(r"(\d{1,2})(?:[:.](\d{2}))?(?::\d{2})?", str(x).strip())
+    if not m:
+        return np.nan
+    h, mm = int(m.group(1)), int(m.group(2) or 0)
+    if h > 24 or mm > 59:
+        return np.nan
+    return h * 60 + mm
+
+
+def _day_ord(values) -> np.ndarray:
+    """Даты -> номер дня от 1970-01-01 (int64)."""
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+class _KeyIndex:
+    """
+    Отсортированный int64-ключ (код сотрудника, день) для поиска через np.searchsorted.
+    При повторе (сотрудник, день) действует последняя строка файла.
+    """
+
+    def __init__(self, names, day_ord, start, end):
+        codes, uniques = pd.factorize(np.asarray(names, dtype=object))
+        self.names = pd.Index(uniques)
+        keys = self._key(codes, day_ord)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        self.keys = keys[last]
+        self.start = np.asarray(start, dtype=np.int64)[order][last]
+        self.end = np.asarray(end, dtype=np.int64)[order][last]
+
+    @staticmethod
+    def _key(codes, day_ord):
+        return (np.asarray(codes, dtype=np.int64) << 32) | (np.asarray(day_ord, dtype=np.int64) + 2**31)
+
+    def find(self, names, day_ord):
+        codes = self.names.get_indexer(names)
+        if not len(self.keys):
+            return np.zeros(len(codes), dtype=bool), np.zeros(len(codes), np.int64), np.zeros(len(codes), np.int64)
+        keys = self._key(codes, day_ord)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = (codes >= 0) & (self.keys[pos] == keys)
+        return hit, np.where(hit, self.start[pos], 0), np.where(hit, self.end[pos], 0)
+
+
+class ShiftSchedule:
+    """
+    Смены по (сотрудник, дата) с векторным поиском.
+    Сотрудник сопоставляется с журналом как в кадрах: сначала полный ключ ФИО,
+    затем «Фамилия + инициалы».
+    shifts — DataFrame с колонками ФИО, Дата, start_min, end_min
+    (минуты от полуночи даты; end_min > 1440 для ночных смен).
+    """
+
+    def __init__(self, shifts: pd.DataFrame):
+        day_ord = _day_ord(shifts["Дата"]) if len(shifts) else np.zeros(0, dtype=np.int64)
+        args = (day_ord, shifts["start_min"].to_numpy(), shifts["end_min"].to_numpy())
+        self._full = _KeyIndex(shifts["ФИО"].map(fio_match_key), *args)
+        self._short = _KeyIndex(shifts["ФИО"].map(fio_short_key), *args)
+        self.shifts = shifts
+
+    def __len__(self):
+        return len(self.shifts)
+
+    def lookup(self, fio, day_ord):
+        """
+        Векторный поиск смен. fio — ФИО из журнала, day_ord — номера дней.
+        Возвращает (есть_смена, начало_мин, конец_мин).
+        """
+        fio = pd.Series(np.asarray(fio, dtype=object))
+        codes, uniques = pd.factorize(fio)
+        full = np.asarray([fio_match_key(u) for u in uniques], dtype=object)[codes]
+        short = np.asarray([fio_short_key(u) for u in uniques], dtype=object)[codes]
+
+        has, start, end = self._full.find(full, day_ord)
+        miss = ~has
+        if miss.any():
+            h2, s2, e2 = self._short.find(short[miss], np.asarray(day_ord)[miss])
+            has[miss], start[miss], end[miss] = h2, s2, e2
+        return has, start, end
+
+    def _boundaries(self, fio, day_ord, default_min):
+        """Начало рабочих суток дня day_ord (минуты от его полуночи)."""
+        has, start, _ = self.lookup(fio, day_ord)
+        has_prev, _, end_prev = self.lookup(fio, day_ord - 1)
+        b = np.where(has, start - SHIFT_LEAD_MIN, default_min)
+        # ночная смена накануне сдвигает границу вперёд, но не позже начала своей смены
+        b = np.where(has_prev, np.maximum(b, end_prev - _DAY_MIN + SHIFT_TAIL_MIN), b)
+        return np.where(has, np.minimum(b, start), b)
+
+    def work_days(self, fio, t_ns, day_start_h) -> np.ndarray:
+        """Рабочий день (номер дня) для каждого события с учётом смен."""
+        t_ns = np.asarray(t_ns, dtype=np.int64)
+        cal = t_ns // (_DAY_MIN * _NS_MIN)
+        default_min = day_start_h * 60
+        b_next = self._boundaries(fio, cal + 1, default_min)
+        b_cur = self._boundaries(fio, cal, default_min)
+        return np.where(
+            t_ns >= ((cal + 1) * _DAY_MIN + b_next) * _NS_MIN,
+            cal + 1,
+            np.where(t_ns >= (cal * _DAY_MIN + b_cur) * _NS_MIN, cal, cal - 1),
+        )
+
+    def day_windows(self, fio, day_ord, day_start_h):
+        """
+        Для групп (ФИО, рабочий день): (есть_смена, начало_мин, конец_мин,
+        граница суток дня, граница следующего дня) — всё в минутах от полуночи своей даты.
+        """
+        day_ord = np.asarray(day_ord, dtype=np.int64)
+        default_min = day_start_h * 60
+        has, start, end = self.lookup(fio, day_ord)
+        b_cur = self._boundaries(fio, day_ord, default_min)
+        b_next = self._boundaries(fio, day_ord + 1, default_min)
+        return has, start, end, b_cur, b_next
+
+
+def _read_table(file_obj) -> pd.DataFrame:
+    content = _read_file_bytes(file_obj)
+    fmt = sniff_format(content)
+    if fmt in ("xlsx", "xls"):
+        return pd.read_excel(_content_source(content), header=None, engine=excel_backend(fmt))
+    return pd.read_csv(_content_source(content), header=None, sep=None, engine="python", dtype=object)
+
+
+def read_shifts(file_obj) -> ShiftSchedule:
+    """
+    Читаем файл графика смен и строим индекс.
+    Ожидаем колонки: 'Сотрудник', 'Дата' (или 'с'/'до'), 'Начало', 'Конец'.
+    """
+    raw = _read_table(file_obj)
+
+    is_hdr = raw.apply(
+        lambda row: row.map(lambda x: ("" if pd.isna(x) else str(x)).strip().casefold() == "сотрудник").any(),
+        axis=1,
+    )
+    idxs = raw.index[is_hdr]
+    if len(idxs) == 0:
+        raise RuntimeError("Не удалось найти строку с заголовком 'Сотрудник' в файле графика смен.")
+
+    hdr_row = idxs[0]
+    raw.columns = [("" if pd.isna(c) else str(c)).strip() for c in raw.iloc[hdr_row]]
+    raw = raw.iloc[hdr_row + 1 :]
+
+    if "Дата" in raw.columns:
+        raw = raw.assign(с=raw["Дата"], до=raw["Дата"])
+    for c in ["Сотрудник", "с", "Начало", "Конец"]:
+        if c not in raw.columns:
+            raise RuntimeError(f"В файле графика смен не найдена колонка '{c}'. Найдены: {list(raw.columns)}")
+    if "до" not in raw.columns:
+        raw["до"] = raw["с"]
+
+    sh = pd.DataFrame({
+        "ФИО": raw["Сотрудник"].astype(str).str.replace("\xa0", " ").str.strip(),
+        "Дата_с": pd.to_datetime(raw["с"].map(smart_parse_date), errors="coerce"),
+        "Дата_по": pd.to_datetime(raw["до"].map(smart_parse_date), errors="coerce"),
+        "start_min": raw["Начало"].map(_clock_min),
+        "end_min": raw["Конец"].map(_clock_min),
+    })
+    sh["Дата_по"] = sh["Дата_по"].fillna(sh["Дата_с"])
+    sh = sh[raw["Сотрудник"].notna().values].dropna(subset=["Дата_с", "start_min", "end_min"])
+    sh = sh[sh["Дата_по"] >= sh["Дата_с"]]
+
+    # ночная смена: конец на следующий день
+    sh["end_min"] = np.where(sh["end_min"] <= sh["start_min"], sh["end_min"] + _DAY_MIN, sh["end_min"])
+
+    # разворачиваем диапазоны дат в посуточный список
+    n_days = ((sh["Дата_по"] - sh["Дата_с"]).dt.days + 1).to_numpy()
+    rep = sh.loc[sh.index.repeat(n_days)]
+    step = np.arange(len(rep)) - np.repeat(np.cumsum(n_days) - n_days, n_days)
+    shifts = pd.DataFrame({
+        "ФИО": rep["ФИО"].to_numpy(),
+        "Дата": (rep["Дата_с"] + pd.to_timedelta(step, unit="D")).dt.normalize().to_numpy(),
+        "start_min": rep["start_min"].astype(np.int64).to_numpy(),
+        "end_min": rep["end_min"].astype(np.int64).to_numpy(),
+    })
+    return ShiftSchedule(shifts)
@@ -0,0 +1,148 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from doors import DoorDictionary
+from engine import (
+    DEFAULT_POLICY,
+    REPORT_COLUMNS,
+    PreparedJournal,
+    _choose_right_col,
+    _finalize,
+    _journal_order,
+    day_metrics,
+    fio_match_key,
+    read_journal,
+    read_kadry,
+    render_report,
+)
+
+# === Несколько площадок (офисов) в одном отчёте ===
+# У каждой площадки свой журнал и своя разметка дверей, поэтому направление
+# («внутри»/«снаружи») определяем по каждому журналу отдельно — со своей
+# колонкой направлений — и только потом сводим события сотрудника вместе.
+# Один и тот же человек на разных площадках сопоставляется по ключу ФИО.
+
+SITE_COL = "Площадка"
+DIRECTION_COL = "Направление"   # метка направления, посчитанная своей площадкой
+SITES_COLUMN = "Площадки"       # колонка отчёта: где и когда человек был за день
+
+_KEEP = ["ФИО", "Дата события", "Рабочий_день", "Вход", "Выход"]
+
+
+def _read_bytes(journal) -> bytes:
+    if isinstance(journal, (str, os.PathLike)):
+        with open(journal, "rb") as fh:
+            return fh.read()
+    try:
+        journal.seek(0)
+    except Exception:
+        pass
+    return journal.read()
+
+
+def _prepare_site(site, content, policy, schedule, door_cache_dir):
+    """Разбор журнала одной площадки и метки направлений по её собственной колонке."""
+    doors = DoorDictionary.load(site, door_cache_dir) if door_cache_dir is not False else None
+    try:
+        prepared = PreparedJournal(read_journal(io.BytesIO(content)), doors=doors)
+    except RuntimeError as e:
+        raise RuntimeError(f"Площадка «{site}»: {e}")
+    right_col = _choose_right_col(prepared, policy, schedule)
+    if doors is not None:
+        doors.save()
+    df = prepared.df[_KEEP].assign(**{SITE_COL: site})
+    return df, prepared.labels[right_col]
+
+
+def _shared_names(fio: pd.Series) -> pd.Series:
+    """Единое написание ФИО для всех площадок: первое встреченное по ключу fio_match_key."""
+    codes, uniques = pd.factorize(fio)
+    keys = pd.Series([fio_match_key(u) for u in uniques])
+    canon = pd.Series(uniques).groupby(keys.to_numpy(), sort=False).transform("first")
+    return pd.Series(canon.to_numpy(dtype=object)[codes], index=fio.index)
+
+
+def _sites_breakdown(df: pd.DataFrame) -> pd.DataFrame:
+    """(ФИО, Дата) -> 'Офис А 08:41–13:02; Офис Б 14:10–19:21' в порядке прихода."""
+    g = (
+        df.groupby(["ФИО", "Рабочий_день", SITE_COL], sort=False)["Дата события"]
+        .agg(["min", "max"])
+        .reset_index()
+        .sort_values(["ФИО", "Рабочий_день", "min"], kind="stable")
+    )
+    g["txt"] = (
+        g[SITE_COL].astype(str) + " " + g["min"].dt.strftime("%H:%M") + "–" + g["max"].dt.strftime("%H:%M")
+    )
+    out = g.groupby(["ФИО", "Рабочий_день"], sort=False)["txt"].agg("; ".join).reset_index()
+    out["Рабочий_день"] = out["Рабочий_день"].to_numpy(dtype=np.int64).astype("datetime64[D]").astype("datetime64[ns]")
+    return out.rename(columns={"Рабочий_день": "Дата", "txt": SITES_COLUMN})
+
+
+def build_sites_report(
+    journals,
+    kadry_file=None,
+    policy=None,
+    schedule=None,
+    io_workers=None,
+    cpu_workers=None,
+    render=True,
+    door_cache_dir=None,
+) -> pd.DataFrame:
+    """
+    Сводный отчёт по нескольким площадкам.
+    journals — {название площадки: файл/путь журнала}.
+    Файлы читаются пулом потоков, разбор и разметка журналов идут пулом процессов
+    (cpu_workers=1 — всё в текущем процессе). События сотрудника со всех площадок
+    сводятся до посуточного расчёта, так что день, начатый в одном офисе и
+    законченный в другом, считается целиком.
+    К отчёту добавляется колонка «Площадки».
+    Словари дверей площадок хранятся в door_cache_dir (по умолчанию doors.DOOR_CACHE_DIR);
+    door_cache_dir=False — размечать двери только по подсказкам, без словарей.
+    """
+    policy = policy or DEFAULT_POLICY
+    journals = dict(journals)
+    if not journals:
+        raise RuntimeError("Не передано ни одного журнала.")
+    sites = list(journals)
+
+    with ThreadPoolExecutor(max_workers=io_workers or min(8, len(sites))) as pool:
+        contents = list(pool.map(_read_bytes, journals.values()))
+
+    args = [(site, content, policy, schedule, door_cache_dir) for site, content in zip(sites, contents)]
+    cpu_workers = min(cpu_workers or os.cpu_count() or 1, len(sites))
+    if cpu_workers > 1:
+        # spawn, а не fork: потоки чтения (и сервера) в этом процессе уже запущены,
+        # а fork многопоточного процесса может зависнуть
+        with ProcessPoolExecutor(max_workers=cpu_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            parts = list(pool.map(_prepare_site, *zip(*args)))
+    else:
+        parts = [_prepare_site(*a) for a in args]
+    del contents, args
+
+    df = pd.concat([p[0] for p in parts], ignore_index=True)
+    lab = np.concatenate([p[1] for p in parts])
+    df["ФИО"] = _shared_names(df["ФИО"])
+
+    order = _journal_order(df)
+    df, lab = df.iloc[order].reset_index(drop=True), lab[order]
+
+    prepared = PreparedJournal(df, labels={DIRECTION_COL: lab})
+    days = day_metrics(prepared.timeline(DIRECTION_COL, policy.day_start_h, schedule), policy, schedule)
+
+    kadry_dates = read_kadry(kadry_file) if kadry_file is not None else None
+    typed = _finalize(days, kadry_dates, policy)
+
+    work_df, _ = prepared.work_frame(policy.day_start_h, schedule)
+    typed = typed.merge(_sites_breakdown(work_df), on=["ФИО", "Дата"], how="left")
+    typed[SITES_COLUMN] = typed[SITES_COLUMN].fillna("")
+    if not render:
+        return typed
+
+    out = render_report(typed)
+    out.insert(REPORT_COLUMNS.index("Причина отсутствия") + 1, SITES_COLUMN, typed[SITES_COLUMN].to_numpy())
+    return out
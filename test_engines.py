@@ -0,0 +1,37 @@
+"""
+Движки отчёта дают одно и то же: polars-движок против pandas-движка
+на журналах examples/ и журналах с трудными случаями (examples/golden).
+
+    python -m pytest -q test_engines.py
+
+Полная сверка со всеми движками и эталоном исходного движка — equivalence.py.
+"""
+import os
+
+import pytest
+
+import engine
+import equivalence
+
+CASES = equivalence.example_cases()
+
+
+@pytest.mark.parametrize("case, journal, kadry", CASES, ids=[c[0] for c in CASES])
+def test_polars_matches_pandas(case, journal, kadry):
+    if not engine._installed("polars"):
+        pytest.skip("polars не установлен")
+    with equivalence._kernel("python"):
+        ref = engine.build_report(journal, kadry, render=False)
+        res = engine.build_report(journal, kadry, render=False, engine="polars")
+    assert equivalence.diff_reports(ref, res) == []
+
+
+@pytest.mark.parametrize("case, journal, kadry", CASES, ids=[c[0] for c in CASES])
+def test_pandas_matches_golden(case, journal, kadry):
+    # эталон снят при PYTHONHASHSEED=0 (см. equivalence.py): при другом сиде
+    # порядок сотрудников и написание ФИО из кадров могут отличаться
+    if os.environ.get("PYTHONHASHSEED") != equivalence.HASH_SEED:
+        pytest.skip(f"нужен PYTHONHASHSEED={equivalence.HASH_SEED}")
+    golden = equivalence.load_golden(journal)
+    res = equivalence._as_text(engine.render_report(engine.build_report(journal, kadry, render=False)))
+    assert equivalence.diff_reports(golden, res) == []